@@ -0,0 +1,177 @@
+# app/alert_rules.py
+"""
+Классификация логов как алертов (is_alert) в приложении при приеме.
+
+Раньше is_alert выставлял BEFORE INSERT триггер set_log_alert_flag (SELECT из log_levels
+на каждую строку), а приложение перечитывало строку через refresh(). Теперь правила
+вычисляются в Python по кешу справочников (refdata.py) до INSERT; триггер удаляет
+migrations/0007_drop_log_alert_trigger.sql.
+
+Правила задаются ALERT_RULES: JSON-список или путь к JSON-файлу; пусто - DEFAULT_RULES
+(уровни ERROR и CRITICAL, как делал триггер). Лог - алерт, если клиент прислал is_alert=true
+или подошло хотя бы одно правило. Условия внутри правила объединяются через И:
+  {"name": "low-cash",
+   "levels": ["WARNING", "ERROR"],          # имена уровней
+   "min_severity": 3,                        # severity_order уровня >= N
+   "event_types": ["LOW_CASH_LEVEL"],        # имена типов событий
+   "event_categories": ["Cash"],             # категории типов событий
+   "payload": [{"path": "cash.remaining", "op": "lt", "value": 20}]}
+Операторы payload: eq, ne, gt, gte, lt, lte, in, not_in, exists, contains; path - ключи через точку.
+
+Имена из правил переводятся в id один раз на версию снимка справочников, а в пачке условия
+по уровню и типу события проверяются один раз на каждую пару (log_level_id, event_type_id) -
+по строкам вычисляются только предикаты payload.
+"""
+import json
+import logging
+import operator
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Literal, Optional, Sequence, Tuple
+
+from pydantic import BaseModel, TypeAdapter
+
+import refdata
+from config import settings
+
+logger = logging.getLogger("app.alert_rules")
+
+MISSING = object()
+
+
+class PayloadPredicate(BaseModel):
+    path: str
+    op: Literal["eq", "ne", "gt", "gte", "lt", "lte", "in", "not_in", "exists", "contains"] = "eq"
+    value: Any = None
+
+
+class AlertRule(BaseModel):
+    name: str
+    levels: Optional[List[str]] = None
+    min_severity: Optional[int] = None
+    event_types: Optional[List[str]] = None
+    event_categories: Optional[List[str]] = None
+    payload: List[PayloadPredicate] = []
+
+
+DEFAULT_RULES = [AlertRule(name="error-levels", levels=["ERROR", "CRITICAL"])]
+
+_rules_adapter = TypeAdapter(List[AlertRule])
+
+
+def load_rules(source: str) -> List[AlertRule]:
+    """Правила из ALERT_RULES: JSON-текст или путь к JSON-файлу; пусто - DEFAULT_RULES."""
+    source = source.strip()
+    if not source:
+        return list(DEFAULT_RULES)
+    if not source.startswith("["):
+        source = Path(source).read_text(encoding="utf-8")
+    return _rules_adapter.validate_python(json.loads(source))
+
+
+_COMPARISONS: Dict[str, Callable[[Any, Any], bool]] = {
+    "eq": operator.eq, "ne": operator.ne,
+    "gt": operator.gt, "gte": operator.ge, "lt": operator.lt, "lte": operator.le,
+    "in": lambda actual, expected: actual in expected,
+    "not_in": lambda actual, expected: actual not in expected,
+    "contains": lambda actual, expected: expected in actual,
+}
+
+
+def _lookup(payload: Optional[dict], keys: Tuple[str, ...]) -> Any:
+    value: Any = payload
+    for key in keys:
+        if not isinstance(value, dict) or key not in value:
+            return MISSING
+        value = value[key]
+    return value
+
+
+@dataclass(frozen=True)
+class CompiledRule:
+    name: str
+    level_ids: Optional[FrozenSet[int]]  # None - любой уровень
+    event_type_ids: Optional[FrozenSet[int]]  # None - любой тип (и без типа)
+    predicates: Tuple[Tuple[Tuple[str, ...], str, Any], ...]
+
+    def matches_key(self, log_level_id: int, event_type_id: Optional[int]) -> bool:
+        return (
+            (self.level_ids is None or log_level_id in self.level_ids)
+            and (self.event_type_ids is None or event_type_id in self.event_type_ids)
+        )
+
+    def matches_payload(self, payload: Optional[dict]) -> bool:
+        for keys, op, expected in self.predicates:
+            actual = _lookup(payload, keys)
+            if op == "exists":
+                if (actual is not MISSING) != (expected is not False):
+                    return False
+                continue
+            if actual is MISSING:
+                return False
+            try:
+                if not _COMPARISONS[op](actual, expected):
+                    return False
+            except TypeError:  # Несравнимые типы (строка против числа и т.п.) - условие не выполнено
+                return False
+        return True
+
+
+def compile_rules(rules: Sequence[AlertRule], reference: refdata.ReferenceData) -> List[CompiledRule]:
+    """Переводит имена уровней и типов событий в множества id по снимку справочников."""
+    compiled = []
+    for rule in rules:
+        level_ids = None
+        if rule.levels is not None or rule.min_severity is not None:
+            level_ids = frozenset(
+                level.id for level in reference.log_levels.values()
+                if (rule.levels is None or level.name in rule.levels)
+                and (rule.min_severity is None or (level.severity_order or 0) >= rule.min_severity)
+            )
+        event_type_ids = None
+        if rule.event_types is not None or rule.event_categories is not None:
+            event_type_ids = frozenset(
+                event_type.id for event_type in reference.event_types.values()
+                if (rule.event_types is None or event_type.name in rule.event_types)
+                and (rule.event_categories is None or event_type.category in rule.event_categories)
+            )
+        if level_ids == frozenset() or event_type_ids == frozenset():
+            logger.warning(f"Alert rule '{rule.name}' matches no log levels or event types in reference data")
+        predicates = tuple((tuple(p.path.split(".")), p.op, p.value) for p in rule.payload)
+        compiled.append(CompiledRule(rule.name, level_ids, event_type_ids, predicates))
+    return compiled
+
+
+rules: List[AlertRule] = load_rules(settings.ALERT_RULES)
+
+_compiled: Optional[Tuple[List[AlertRule], int, List[CompiledRule]]] = None  # (rules, версия справочников, правила)
+
+
+def _compiled_rules(reference: refdata.ReferenceData) -> List[CompiledRule]:
+    global _compiled
+    cached = _compiled
+    if cached is not None and cached[0] is rules and cached[1] == reference.version:
+        return cached[2]
+    compiled = compile_rules(rules, reference)
+    _compiled = (rules, reference.version, compiled)
+    return compiled
+
+
+def classify(logs: Iterable, reference: refdata.ReferenceData) -> List[bool]:
+    """
+    is_alert для каждого лога пачки (объекты с log_level_id, event_type_id, payload, is_alert).
+    Флаг, присланный клиентом, сохраняется.
+    """
+    compiled = _compiled_rules(reference)
+    candidates_by_key: Dict[Tuple[int, Optional[int]], List[CompiledRule]] = {}
+    flags = []
+    for log in logs:
+        if log.is_alert:
+            flags.append(True)
+            continue
+        key = (log.log_level_id, log.event_type_id)
+        candidates = candidates_by_key.get(key)
+        if candidates is None:
+            candidates = candidates_by_key[key] = [rule for rule in compiled if rule.matches_key(*key)]
+        flags.append(any(not rule.predicates or rule.matches_payload(log.payload) for rule in candidates))
+    return flags
@@ -0,0 +1,145 @@
+# app/atm_deletion.py
+"""
+Удаление банкомата вместе с логами фоновой задачей (DELETE /api/v1/atms/{id}).
+
+Логи удаляются пачками по ATM_DELETE_CHUNK_SIZE, каждая пачка - отдельная короткая транзакция:
+блокировки и WAL не растут с числом логов, прием логов других банкоматов не ждет.
+В режиме archive пачка в той же транзакции копируется в atm_logs_archive (INSERT ... SELECT).
+В начале задачи банкомату выставляется deletion_requested_at, и прием новых логов для него
+отклоняется. Последняя транзакция блокирует строку банкомата (FOR UPDATE - вставки, уже проверившие
+банкомат, ждут ее и затем получают ошибку внешнего ключа), архивирует и удаляет оставшиеся логи
+и сам банкомат, поэтому ни один лог не удаляется ON DELETE CASCADE мимо архива
+(сводки rollups.py удаляет ON DELETE CASCADE).
+Прогресс хранится в памяти процесса (приложение работает одним воркером uvicorn) и отдается
+GET /api/v1/atms/deletions/{job_id}. Если задача упала, повторный DELETE продолжит с оставшихся логов.
+"""
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.orm import sessionmaker
+
+import models
+from config import settings
+
+logger = logging.getLogger("app.atm_deletion")
+
+ARCHIVED_COLUMNS = [
+    "id", "atm_id", "event_timestamp", "log_level_id", "event_type_id", "message", "payload",
+    "is_alert", "acknowledged_by_user_id", "acknowledged_at", "recorded_at",
+]
+
+
+@dataclass
+class DeletionJob:
+    atm_id: int
+    archive: bool
+    job_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = "queued"  # queued | running | completed | failed
+    total_logs: Optional[int] = None
+    deleted_logs: int = 0
+    archived_logs: int = 0
+    error: Optional[str] = None
+    created_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed")
+
+
+_jobs: "OrderedDict[str, DeletionJob]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_job(job_id: str) -> Optional[DeletionJob]:
+    return _jobs.get(job_id)
+
+
+def submit(atm_id: int, archive: bool) -> DeletionJob:
+    """Новая задача удаления; если банкомат уже удаляется, возвращается текущая задача."""
+    with _lock:
+        for job in _jobs.values():
+            if job.atm_id == atm_id and not job.finished:
+                return job
+        job = DeletionJob(atm_id=atm_id, archive=archive)
+        _jobs[job.job_id] = job
+        # Забываем самые старые завершенные задачи
+        finished = [job_id for job_id, j in _jobs.items() if j.finished]
+        for job_id in finished[:max(len(finished) - settings.ATM_DELETE_JOBS_KEPT, 0)]:
+            del _jobs[job_id]
+        return job
+
+
+def _next_chunk(atm_id: int):
+    # Порядок индекса ix_atm_logs_atm_id_event_timestamp: выборка пачки - короткий проход по индексу
+    return (
+        select(models.ATMLog.id)
+        .where(models.ATMLog.atm_id == atm_id)
+        .order_by(models.ATMLog.event_timestamp.desc(), models.ATMLog.id.desc())
+        .limit(settings.ATM_DELETE_CHUNK_SIZE)
+    )
+
+
+def _remove_logs(db, job: DeletionJob, log_ids: list) -> None:
+    """Архивирует (в режиме archive) и удаляет логи в текущей транзакции; счетчики задачи - после commit."""
+    if job.archive:
+        log_columns = [getattr(models.ATMLog, name) for name in ARCHIVED_COLUMNS]
+        db.execute(insert(models.ATMLogArchive).from_select(
+            ARCHIVED_COLUMNS, select(*log_columns).where(models.ATMLog.id.in_(log_ids))
+        ))
+    db.execute(
+        delete(models.ATMLog).where(models.ATMLog.id.in_(log_ids)).execution_options(synchronize_session=False)
+    )
+
+
+def _count_removed(job: DeletionJob, count: int) -> None:
+    job.deleted_logs += count
+    if job.archive:
+        job.archived_logs += count
+
+
+def run(job: DeletionJob, session_factory: sessionmaker) -> None:
+    """Выполняет задачу (в пуле потоков: BackgroundTasks запускает синхронные функции через threadpool)."""
+    job.status, job.started_at = "running", datetime.now(timezone.utc)
+    try:
+        with session_factory() as db:
+            # С этого момента прием логов банкомата отклоняется (crud.accepting_logs_criteria)
+            db.execute(
+                update(models.ATM).where(models.ATM.id == job.atm_id, models.ATM.deletion_requested_at.is_(None))
+                .values(deletion_requested_at=datetime.now(timezone.utc)).execution_options(synchronize_session=False)
+            )
+            db.commit()
+            job.total_logs = db.scalar(select(func.count()).where(models.ATMLog.atm_id == job.atm_id))
+            db.commit()
+            while True:
+                log_ids = list(db.scalars(_next_chunk(job.atm_id)))
+                if not log_ids:
+                    break
+                _remove_logs(db, job, log_ids)
+                db.commit()
+                _count_removed(job, len(log_ids))
+
+            # Последняя транзакция: строка банкомата заблокирована, логи, вставленные после проверки
+            # банкомата, архивируются и удаляются вместе с ним, а не каскадом
+            db.scalar(select(models.ATM.id).where(models.ATM.id == job.atm_id).with_for_update())
+            remaining = list(db.scalars(select(models.ATMLog.id).where(models.ATMLog.atm_id == job.atm_id)))
+            if remaining:
+                _remove_logs(db, job, remaining)
+            db.execute(delete(models.ATM).where(models.ATM.id == job.atm_id).execution_options(synchronize_session=False))
+            db.commit()
+            _count_removed(job, len(remaining))
+            job.total_logs = job.deleted_logs  # Вместе с логами, принятыми после подсчета
+        job.status = "completed"
+        logger.info(f"ATM {job.atm_id} deleted with {job.deleted_logs} logs (archive={job.archive}).")
+    except Exception as e:
+        job.status, job.error = "failed", str(e)
+        logger.error(f"Deleting ATM {job.atm_id} failed after {job.deleted_logs} logs: {e}", exc_info=True)
+    finally:
+        job.finished_at = datetime.now(timezone.utc)
@@ -0,0 +1,125 @@
+# app/broadcast.py
+"""
+Шина новых логов в памяти процесса для потоковой выдачи (GET /api/v1/logs/stream, SSE).
+
+Прием логов (crud_async.create_atm_log / create_atm_logs_bulk) после commit публикует
+созданные записи, шина раскладывает их по подпискам с фильтром по банкомату, уровню и признаку алерта.
+Публикация не ждет подписчиков: у каждой подписки своя очередь на LOG_STREAM_QUEUE_SIZE событий,
+и если клиент не успевает ее разбирать, подписка закрывается (клиент получает событие dropped
+и переподключается), а прием логов не замедляется.
+Шина живет в процессе, поэтому подписчик получает логи, принятые тем же воркером (uvicorn запускается
+одним процессом, см. app/Dockerfile).
+"""
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import FrozenSet, Iterable, List, Optional, Set
+
+import schemas
+from config import settings
+
+logger = logging.getLogger("app.broadcast")
+
+
+@dataclass(frozen=True)
+class LogFilter:
+    atm_ids: FrozenSet[int] = frozenset()  # Пустое множество - любые
+    log_level_ids: FrozenSet[int] = frozenset()
+    is_alert: Optional[bool] = None
+
+    def matches(self, log: schemas.ATMLog) -> bool:
+        return (
+            (not self.atm_ids or log.atm_id in self.atm_ids)
+            and (not self.log_level_ids or log.log_level_id in self.log_level_ids)
+            and (self.is_alert is None or bool(log.is_alert) == self.is_alert)
+        )
+
+
+@dataclass(frozen=True)
+class LogEvent:
+    id: int
+    data: str  # JSON schemas.ATMLog, сериализуется один раз на всех подписчиков
+
+
+DROPPED = None  # Маркер в очереди: подписка закрыта из-за переполнения
+
+
+@dataclass(eq=False)
+class Subscription:
+    log_filter: LogFilter
+    queue: asyncio.Queue
+    loop: asyncio.AbstractEventLoop
+    dropped: bool = False
+
+    async def get(self) -> Optional[LogEvent]:
+        """Следующее событие; None - подписка закрыта (клиент не успевал читать)."""
+        return await self.queue.get()
+
+
+@dataclass
+class LogBus:
+    subscriptions: Set[Subscription] = field(default_factory=set)
+
+    def has_subscribers(self) -> bool:
+        return bool(self.subscriptions)
+
+    def subscribe(self, log_filter: LogFilter) -> Subscription:
+        """Вызывается из цикла событий. Переполнение лимита подписок - OverflowError."""
+        if len(self.subscriptions) >= settings.LOG_STREAM_MAX_SUBSCRIBERS:
+            raise OverflowError("Too many log stream subscribers.")
+        subscription = Subscription(
+            log_filter=log_filter,
+            queue=asyncio.Queue(maxsize=settings.LOG_STREAM_QUEUE_SIZE + 1),  # +1 место под маркер DROPPED
+            loop=asyncio.get_running_loop(),
+        )
+        self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self.subscriptions.discard(subscription)
+
+    def publish(self, logs: Iterable[schemas.ATMLog]) -> None:
+        """Раскладывает логи по подпискам; никогда не блокирует отправителя."""
+        for log in logs:
+            event = None
+            for subscription in list(self.subscriptions):
+                if not subscription.log_filter.matches(log):
+                    continue
+                if event is None:
+                    event = LogEvent(id=log.id, data=log.model_dump_json())
+                self._deliver(subscription, event)
+
+    def _deliver(self, subscription: Subscription, event: LogEvent) -> None:
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is subscription.loop:
+            self._put(subscription, event)
+        else:  # Публикация из другого потока - в очередь кладет цикл событий подписчика
+            subscription.loop.call_soon_threadsafe(self._put, subscription, event)
+
+    def _put(self, subscription: Subscription, event: LogEvent) -> None:
+        if subscription.dropped:
+            return
+        if subscription.queue.qsize() < settings.LOG_STREAM_QUEUE_SIZE:
+            subscription.queue.put_nowait(event)
+            return
+        # Медленный потребитель: освобождаем память и сообщаем ему о закрытии
+        subscription.dropped = True
+        self.unsubscribe(subscription)
+        while not subscription.queue.empty():
+            subscription.queue.get_nowait()
+        subscription.queue.put_nowait(DROPPED)
+        logger.warning("Log stream subscriber dropped: queue overflow.")
+
+
+bus = LogBus()
+
+
+def publish_logs(logs: List[schemas.ATMLog]) -> None:
+    """Публикация из пути приема логов: ошибки шины не должны ломать запись."""
+    try:
+        bus.publish(logs)
+    except Exception as e:
+        logger.error(f"Failed to publish logs to stream subscribers: {e}", exc_info=True)
@@ -0,0 +1,382 @@
+# app/caching.py
+"""
+Кеш ответов API: общее хранилище для всех воркеров и инвалидация по тегам.
+
+Хранилище задается CACHE_URL: redis://... (Redis или совместимый сервер - Valkey, KeyDB, Dragonfly)
+или пусто - словарь в памяти процесса (один воркер, тесты). Оба бэкенда реализуют интерфейс
+fastapi_cache, поэтому через FastAPICache.init их использует и декоратор @cache.
+
+Инвалидация - версиями тегов. Ключ записи включает текущие версии ее тегов
+(например, atm:5 и refdata), а запись в БД увеличивает версии затронутых тегов: старые записи
+больше не находятся и сами истекают по TTL. Так не нужно хранить списки ключей тега,
+а ответ, посчитанный до записи и сохраненный после нее, не будет прочитан.
+Теги вычисляются по объектам, которые записывают функции crud/crud_async (события Session, как в refdata.py):
+  ATM id            -> atm:<id> (и логи этого банкомата при удалении каскадом)
+  новый ATMLog      -> logs:atm:<atm_id>
+  измененный ATMLog -> logs, logs:atm:<atm_id>
+  справочники       -> refdata
+Массовые UPDATE/DELETE без известных строк увеличивают общие теги atms:bulk / logs:bulk.
+Вставка логов не увеличивает общий тег logs: при непрерывном приеме он менялся бы на каждый запрос
+и списки по всем банкоматам не попадали бы в кеш. Новые логи появляются в них по истечении
+короткого LOGS_CACHE_TTL_SECONDS; изменения существующих логов (подтверждение, is_alert) - сразу.
+
+Версии тегов в Redis увеличиваются после commit асинхронно; CacheInvalidationMiddleware дожидается
+увеличений, начатых запросом, до отправки ответа, поэтому чтение после ответа на запись
+не вернет устаревшую запись.
+"""
+import asyncio
+import contextvars
+import hashlib
+import json
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from fastapi_cache import FastAPICache
+from fastapi_cache.types import Backend
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+import models
+from config import settings
+
+logger = logging.getLogger("app.caching")
+
+
+class PendingInvalidations:
+    """Незавершенные увеличения версий тегов одного HTTP-запроса (см. CacheInvalidationMiddleware)."""
+
+    def __init__(self):
+        self.futures: list = []
+        # После ответа не копим: задачи, запущенные из запроса (писатель ingest_queue), наследуют его контекст
+        self.open = True
+
+
+_request_invalidations: contextvars.ContextVar[Optional[PendingInvalidations]] = contextvars.ContextVar(
+    "cache_request_invalidations", default=None
+)
+
+CACHE_STATUS_HEADER = "X-Cache"
+REFDATA_TAG = "refdata"
+REFERENCE_MODELS = (models.ATMStatus, models.LogLevel, models.EventType)
+
+
+# --- Бэкенды ---
+class MemoryCacheBackend(Backend):
+    """Хранилище в памяти процесса (по умолчанию и в тестах)."""
+
+    def __init__(self):
+        self._store: Dict[str, Tuple[Optional[float], bytes]] = {}  # ключ -> (момент истечения, значение)
+        self._lock = threading.Lock()
+
+    def _get(self, key: str) -> Tuple[Optional[float], Optional[bytes]]:
+        entry = self._store.get(key)
+        if entry is None:
+            return None, None
+        expires_at, value = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._store[key]
+            return None, None
+        return expires_at, value
+
+    async def get_with_ttl(self, key: str) -> Tuple[int, Optional[bytes]]:
+        with self._lock:
+            expires_at, value = self._get(key)
+        ttl = -1 if expires_at is None else int(expires_at - time.monotonic())
+        return (ttl, value) if value is not None else (0, None)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            return self._get(key)[1]
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        with self._lock:
+            return [self._get(key)[1] for key in keys]
+
+    async def set(self, key: str, value: bytes, expire: Optional[int] = None) -> None:
+        with self._lock:
+            self._store[key] = (time.monotonic() + expire if expire else None, value)
+
+    async def clear(self, namespace: Optional[str] = None, key: Optional[str] = None) -> int:
+        with self._lock:
+            keys = [k for k in self._store if k.startswith(namespace)] if namespace else [key] if key in self._store else []
+            for k in keys:
+                del self._store[k]
+        return len(keys)
+
+    def invalidate_soon(self, keys: Iterable[str]) -> None:
+        # Увеличение версий тегов сразу, в вызывающем потоке
+        with self._lock:
+            for key in keys:
+                _, value = self._get(key)
+                self._store[key] = (None, str(int(value or 0) + 1).encode())
+
+    async def close(self) -> None:
+        pass
+
+
+class RedisCacheBackend(Backend):
+    """Redis или совместимый сервер (нужен пакет redis)."""
+
+    def __init__(self, url: str):
+        from redis import asyncio as redis_asyncio  # Необязательная зависимость - только при CACHE_URL=redis://...
+
+        self.redis = redis_asyncio.from_url(url, socket_timeout=settings.CACHE_SOCKET_TIMEOUT_SECONDS)
+        self._loop = asyncio.get_running_loop()
+        self._pending: Set[asyncio.Future] = set()
+
+    async def get_with_ttl(self, key: str) -> Tuple[int, Optional[bytes]]:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            ttl, value = await pipe.ttl(key).get(key).execute()
+        return ttl, value
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.redis.get(key)
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        return await self.redis.mget(keys)
+
+    async def set(self, key: str, value: bytes, expire: Optional[int] = None) -> None:
+        await self.redis.set(key, value, ex=expire)
+
+    async def clear(self, namespace: Optional[str] = None, key: Optional[str] = None) -> int:
+        if namespace:
+            keys = [k async for k in self.redis.scan_iter(match=f"{namespace}*")]
+            return await self.redis.delete(*keys) if keys else 0
+        return await self.redis.delete(key) if key else 0
+
+    async def _incr_many(self, keys: List[str]) -> None:
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.incr(key)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Cache invalidation failed for {keys}: {e}")
+
+    def invalidate_soon(self, keys: Iterable[str]) -> None:
+        # Вызывается из after_commit (синхронно): сама запись в Redis выполняется циклом событий приложения
+        coroutine = self._incr_many(list(keys))
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is self._loop:
+            future = self._loop.create_task(coroutine)
+        else:
+            future = asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+        self._pending.add(future)
+        future.add_done_callback(self._pending.discard)
+        request_pending = _request_invalidations.get()
+        if request_pending is not None and request_pending.open:
+            request_pending.futures.append(future)
+
+    async def close(self) -> None:
+        await self.redis.aclose()
+
+
+_backend: Optional[Backend] = None
+
+
+def create_backend(url: str) -> Backend:
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisCacheBackend(url)
+    if url:
+        raise ValueError(f"Unsupported CACHE_URL scheme: {url.split(':', 1)[0]}")
+    return MemoryCacheBackend()
+
+
+async def init_cache(url: Optional[str] = None) -> Backend:
+    """Создает хранилище (вызывается из startup) и подключает его к FastAPICache."""
+    global _backend
+    backend = create_backend(settings.CACHE_URL if url is None else url)
+    if isinstance(backend, RedisCacheBackend):
+        await backend.redis.ping()  # Недоступный сервер - ошибка при старте, а не на каждом запросе
+    FastAPICache.init(backend, prefix=settings.CACHE_PREFIX)
+    _backend = backend
+    return backend
+
+
+async def close_cache() -> None:
+    global _backend
+    backend, _backend = _backend, None
+    FastAPICache.reset()
+    if backend is not None:
+        await backend.close()
+
+
+def is_enabled() -> bool:
+    return _backend is not None
+
+
+# --- Ключи с версиями тегов ---
+def _tag_key(tag: str) -> str:
+    return f"{settings.CACHE_PREFIX}:tag:{tag}"
+
+
+async def tagged_key(namespace: str, params: Dict[str, Any], tags: Sequence[str]) -> str:
+    """Ключ записи: пространство имен, хеш параметров и текущие версии тегов."""
+    versions = await _backend.get_many([_tag_key(tag) for tag in tags])
+    material = json.dumps(
+        {"params": params, "tags": dict(zip(tags, (int(v or 0) for v in versions)))},
+        sort_keys=True, default=str
+    )
+    return f"{settings.CACHE_PREFIX}:{namespace}:{hashlib.sha1(material.encode()).hexdigest()}"
+
+
+async def lookup(namespace: str, params: Dict[str, Any], tags: Sequence[str]) -> Tuple[Optional[str], Optional[bytes]]:
+    """
+    Возвращает (ключ, значение). Если кеш не настроен или недоступен - (None, None):
+    запрос выполняется как обычно, а store() с ключом None ничего не делает.
+    """
+    if _backend is None:
+        return None, None
+    try:
+        key = await tagged_key(namespace, params, tags)
+        return key, await _backend.get(key)
+    except Exception as e:
+        logger.warning(f"Cache lookup failed ({namespace}): {e}")
+        return None, None
+
+
+async def store(key: Optional[str], value: bytes, expire: int) -> None:
+    if key is None or _backend is None:
+        return
+    try:
+        await _backend.set(key, value, expire)
+    except Exception as e:
+        logger.warning(f"Cache store failed ({key}): {e}")
+
+
+def tagged_key_builder(*tags: str):
+    """
+    key_builder для @cache: ключ по пути и параметрам запроса (без объектов зависимостей вроде сессии БД,
+    которые делали ключ по умолчанию уникальным на каждый запрос) плюс версии тегов.
+    """
+    async def build(func, namespace: str = "", *, request=None, response=None, args=(), kwargs=None) -> str:
+        params = {
+            "path": request.url.path if request is not None else None,
+            "query": sorted(request.query_params.multi_items()) if request is not None else None,
+        }
+        # namespace от декоратора уже содержит префикс FastAPICache - ключ строим по имени функции
+        return await tagged_key(f"endpoint:{func.__module__}.{func.__name__}", params, tags)
+    return build
+
+
+def atm_tags(atm_id: int) -> Tuple[str, ...]:
+    return f"atm:{atm_id}", "atms:bulk", REFDATA_TAG
+
+
+def log_list_tags(atm_id: Optional[int]) -> Tuple[str, ...]:
+    # Список по одному банкомату не сбрасывается логами других банкоматов
+    if atm_id is not None:
+        return f"logs:atm:{atm_id}", "logs:bulk", REFDATA_TAG
+    return "logs", REFDATA_TAG
+
+
+def invalidate_tags(tags: Iterable[str]) -> None:
+    if _backend is None:
+        return
+    keys = sorted({_tag_key(tag) for tag in tags})
+    if keys:
+        _backend.invalidate_soon(keys)
+
+
+# --- Теги по записям в БД ---
+def _tags_for_object(obj, deleted: bool, new: bool = False) -> Set[str]:
+    if isinstance(obj, models.ATM):
+        tags = {f"atm:{obj.id}"}
+        if deleted:  # Логи удаляются каскадом
+            tags |= {"logs", f"logs:atm:{obj.id}"}
+        return tags
+    if isinstance(obj, models.ATMLog):
+        # Новый лог сбрасывает только списки своего банкомата (общие - по TTL, см. выше)
+        return {f"logs:atm:{obj.atm_id}"} if new else {"logs", f"logs:atm:{obj.atm_id}"}
+    if isinstance(obj, REFERENCE_MODELS):
+        return {REFDATA_TAG}
+    return set()
+
+
+@event.listens_for(Session, "after_flush")
+def _track_cached_writes(session, flush_context):
+    tags = set()
+    for obj in session.new:
+        tags |= _tags_for_object(obj, deleted=False, new=True)
+    for obj in session.dirty:
+        tags |= _tags_for_object(obj, deleted=False)
+    for obj in session.deleted:
+        tags |= _tags_for_object(obj, deleted=True)
+    if tags:
+        session.info.setdefault("cache_tags", set()).update(tags)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_cached_bulk_writes(orm_execute_state):
+    if orm_execute_state.is_select:
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is None:
+        return
+    tags = set()
+    if issubclass(mapper.class_, models.ATMLog):
+        parameters = orm_execute_state.parameters
+        rows = parameters if isinstance(parameters, list) else [parameters or {}]
+        atm_ids = {row.get("atm_id") for row in rows}
+        if orm_execute_state.is_insert and None not in atm_ids:  # Пакетная вставка: банкоматы известны
+            tags = {f"logs:atm:{atm_id}" for atm_id in atm_ids}
+        else:
+            tags = {"logs", "logs:bulk"}
+    elif issubclass(mapper.class_, models.ATM):
+        tags = {"atms:bulk", "logs", "logs:bulk"}
+    elif issubclass(mapper.class_, REFERENCE_MODELS):
+        tags = {REFDATA_TAG}
+    if tags:
+        orm_execute_state.session.info.setdefault("cache_tags", set()).update(tags)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    tags = session.info.pop("cache_tags", None)
+    if tags:
+        invalidate_tags(tags)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_after_rollback(session):
+    session.info.pop("cache_tags", None)
+
+
+async def wait_invalidations(pending: PendingInvalidations) -> None:
+    """Дожидается увеличений версий тегов (задачи цикла событий или future из других потоков)."""
+    futures = [
+        future if isinstance(future, asyncio.Future) else asyncio.wrap_future(future) for future in pending.futures
+    ]
+    pending.futures.clear()
+    await asyncio.gather(*futures, return_exceptions=True)  # Ошибки Redis уже записаны в лог _incr_many
+
+
+class CacheInvalidationMiddleware:
+    """ASGI middleware: ответ отправляется только после инвалидации кеша, вызванной запросом."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        pending = PendingInvalidations()
+        token = _request_invalidations.set(pending)
+
+        async def send_after_invalidation(message):
+            if message["type"] == "http.response.start" and pending.futures:
+                await wait_invalidations(pending)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_after_invalidation)
+        finally:
+            pending.open = False
+            pending.futures.clear()
+            _request_invalidations.reset(token)
@@ -20,10 +20,117 @@ class Settings:
         LOCAL_DEV_POSTGRES_DB = os.getenv("LOCAL_DEV_DB_NAME", "atm_monitoring_db_local")
         DATABASE_URL = f"postgresql://{LOCAL_DEV_POSTGRES_USER}:{LOCAL_DEV_POSTGRES_PASSWORD}@{LOCAL_DEV_POSTGRES_SERVER}:5432/{LOCAL_DEV_POSTGRES_DB}"
 
+    # URL для асинхронного движка (AsyncSession). Если не задан, получается из DATABASE_URL
+    # заменой драйвера: postgresql:// -> postgresql+asyncpg://, sqlite:// -> sqlite+aiosqlite://
+    ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL")
+
+    # Пул соединений (database.py), отдельно для синхронного и асинхронного движков; к SQLite не применяется
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", 5))  # Постоянных соединений
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", 10))  # Временных соединений сверх DB_POOL_SIZE при всплесках
+    DB_POOL_TIMEOUT_SECONDS: float = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", 30))  # Ожидание свободного соединения
+    # Проверять соединение перед выдачей из пула: после рестарта БД запрос не получит мертвое соединение
+    DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+    DB_POOL_RECYCLE_SECONDS: int = int(os.getenv("DB_POOL_RECYCLE_SECONDS", 1800))  # -1 - не пересоздавать соединения
+    # LIFO: в тихие периоды используются одни и те же соединения, лишние закрываются сервером по таймауту
+    DB_POOL_USE_LIFO: bool = os.getenv("DB_POOL_USE_LIFO", "false").lower() in ("1", "true", "yes")
+    # Подключение через PgBouncer (pool_mode=transaction): без серверных prepared statements asyncpg
+    DB_PGBOUNCER: bool = os.getenv("DB_PGBOUNCER", "false").lower() in ("1", "true", "yes")
+
+    # Применять SQL-миграции из app/migrations при старте (migrate.py); иначе - вручную: python migrate.py
+    RUN_MIGRATIONS_ON_STARTUP: bool = os.getenv("RUN_MIGRATIONS_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+    # Применять при старте и миграции с маркером "-- migrate: manual" (0002 копирует всю atm_logs);
+    # без этого они пропускаются, остальные миграции применяются
+    RUN_MANUAL_MIGRATIONS_ON_STARTUP: bool = os.getenv("RUN_MANUAL_MIGRATIONS_ON_STARTUP", "false").lower() in ("1", "true", "yes")
+
+    # Секционирование atm_logs по event_timestamp (partitions.py)
+    ATM_LOGS_PARTITION_INTERVAL: str = os.getenv("ATM_LOGS_PARTITION_INTERVAL", "month")  # day | month
+    ATM_LOGS_PARTITIONS_AHEAD: int = int(os.getenv("ATM_LOGS_PARTITIONS_AHEAD", 2))  # Сколько периодов создавать заранее
+    ATM_LOGS_RETENTION_DAYS: int = int(os.getenv("ATM_LOGS_RETENTION_DAYS", 0))  # 0 - хранить логи бессрочно
+    ATM_LOGS_RETENTION_MODE: str = os.getenv("ATM_LOGS_RETENTION_MODE", "drop")  # drop | detach (оставить таблицу в архив)
+    PARTITION_MAINTENANCE_INTERVAL_SECONDS: int = int(os.getenv("PARTITION_MAINTENANCE_INTERVAL_SECONDS", 3600))
+
+    # Удаление банкомата фоновой задачей (atm_deletion.py): логов в одной транзакции и сколько завершенных задач помнить
+    ATM_DELETE_CHUNK_SIZE: int = int(os.getenv("ATM_DELETE_CHUNK_SIZE", 5000))
+    ATM_DELETE_JOBS_KEPT: int = int(os.getenv("ATM_DELETE_JOBS_KEPT", 100))
+
     # Настройки для JWT
     SECRET_KEY: str = os.getenv("SECRET_KEY", "fallback_secret_key_if_not_set")
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
+    # Кеш пользователей для проверки токенов (usercache.py): за сколько секунд смена роли доходит до других воркеров
+    USER_CACHE_TTL_SECONDS: int = int(os.getenv("USER_CACHE_TTL_SECONDS", 30))
+    USER_CACHE_MAX_ENTRIES: int = int(os.getenv("USER_CACHE_MAX_ENTRIES", 10000))
+
+    # Хеширование паролей (security.py): потоки bcrypt и предел очереди, сверх которого - 503
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+    PASSWORD_HASH_MAX_PENDING: int = int(os.getenv("PASSWORD_HASH_MAX_PENDING", 32))
+    # Ограничение попыток входа (throttle.py) в скользящем окне
+    LOGIN_THROTTLE_WINDOW_SECONDS: int = int(os.getenv("LOGIN_THROTTLE_WINDOW_SECONDS", 300))
+    LOGIN_MAX_FAILURES_PER_USERNAME: int = int(os.getenv("LOGIN_MAX_FAILURES_PER_USERNAME", 5))  # Неудачных на логин
+    LOGIN_MAX_ATTEMPTS_PER_IP: int = int(os.getenv("LOGIN_MAX_ATTEMPTS_PER_IP", 30))  # Неудачных (вход и регистрация) с IP
+    # Адреса/сети прокси через запятую, которым доверяем X-Forwarded-For (IP клиента для throttle.py); "*" - всем
+    FORWARDED_ALLOW_IPS: str = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
+
+    # Пакетный прием логов (POST /api/v1/atms/logs/batch)
+    LOG_BATCH_MAX_SIZE: int = int(os.getenv("LOG_BATCH_MAX_SIZE", 10000))  # Максимум записей в одном запросе
+    LOG_BATCH_CHUNK_SIZE: int = int(os.getenv("LOG_BATCH_CHUNK_SIZE", 1000))  # Записей в одном multi-row INSERT
+
+    # Прием одиночных логов через очередь в памяти (ingest_queue.py): direct - commit на каждый запрос,
+    # queued - 202 и запись пачками фоновым писателем
+    LOG_INGEST_MODE: str = os.getenv("LOG_INGEST_MODE", "direct")  # direct | queued
+    # flush - ответ после записи пачки в БД, enqueue - сразу после постановки в очередь (логи в очереди теряются при падении процесса)
+    LOG_INGEST_DURABILITY: str = os.getenv("LOG_INGEST_DURABILITY", "flush")  # flush | enqueue
+    LOG_INGEST_QUEUE_SIZE: int = int(os.getenv("LOG_INGEST_QUEUE_SIZE", 10000))  # Сверх этого - 503
+    LOG_INGEST_FLUSH_ROWS: int = int(os.getenv("LOG_INGEST_FLUSH_ROWS", 500))  # Записей в одной транзакции
+    LOG_INGEST_FLUSH_INTERVAL_MS: int = int(os.getenv("LOG_INGEST_FLUSH_INTERVAL_MS", 20))  # Сколько ждать добора пачки
+
+    # Потоковая выгрузка логов (GET /api/v1/logs/export): строк в одной пачке серверного курсора
+    LOG_EXPORT_CHUNK_SIZE: int = int(os.getenv("LOG_EXPORT_CHUNK_SIZE", 1000))
+
+    # Массовое подтверждение / смена is_alert по фильтру: строк за один запрос
+    LOG_BULK_UPDATE_MAX_ROWS: int = int(os.getenv("LOG_BULK_UPDATE_MAX_ROWS", 5000))
+
+    # Гистограмма логов (GET /api/v1/logs/histogram): предел числа интервалов в одном запросе
+    LOG_HISTOGRAM_MAX_BUCKETS: int = int(os.getenv("LOG_HISTOGRAM_MAX_BUCKETS", 10000))
+
+    # Поток новых логов (GET /api/v1/logs/stream, broadcast.py)
+    LOG_STREAM_QUEUE_SIZE: int = int(os.getenv("LOG_STREAM_QUEUE_SIZE", 1000))  # Событий в очереди подписчика до отключения
+    LOG_STREAM_MAX_SUBSCRIBERS: int = int(os.getenv("LOG_STREAM_MAX_SUBSCRIBERS", 1000))
+    LOG_STREAM_HEARTBEAT_SECONDS: float = float(os.getenv("LOG_STREAM_HEARTBEAT_SECONDS", 15))
+
+    # Метрики в формате Prometheus (GET /metrics, metrics.py)
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+    # Метка atm_id у счетчиков принятых/отклоненных логов; false - один ряд на уровень для большого парка
+    METRICS_ATM_LABELS: bool = os.getenv("METRICS_ATM_LABELS", "true").lower() in ("1", "true", "yes")
+
+    # Профилирование SQL (profiling.py, GET /api/v1/admin/sql-profiles)
+    SQL_PROFILE_ALWAYS: bool = os.getenv("SQL_PROFILE_ALWAYS", "false").lower() in ("1", "true", "yes")  # Каждый запрос
+    SQL_PROFILE_TOKEN: str = os.getenv("SQL_PROFILE_TOKEN", "")  # Значение заголовка X-SQL-Profile; пусто - заголовок не действует
+    SQL_PROFILE_PARAMETERS: bool = os.getenv("SQL_PROFILE_PARAMETERS", "false").lower() in ("1", "true", "yes")  # Сохранять параметры (кроме users)
+    SQL_PROFILE_EXPLAIN: bool = os.getenv("SQL_PROFILE_EXPLAIN", "false").lower() in ("1", "true", "yes")  # EXPLAIN ANALYZE (PostgreSQL)
+    SQL_PROFILE_EXPLAIN_MS: float = float(os.getenv("SQL_PROFILE_EXPLAIN_MS", 50))  # Только для SELECT дольше порога
+    SQL_PROFILE_BUFFER_SIZE: int = int(os.getenv("SQL_PROFILE_BUFFER_SIZE", 200))  # Профилей в кольцевом буфере
+    SQL_SLOW_QUERY_MS: float = float(os.getenv("SQL_SLOW_QUERY_MS", 0))  # Журнал медленных запросов; 0 - выключен
+
+    # Правила алертов (alert_rules.py): JSON-список правил или путь к JSON-файлу; пусто - уровни ERROR и CRITICAL
+    ALERT_RULES: str = os.getenv("ALERT_RULES", "")
+
+    # Кеш ответов API (caching.py): redis://host:6379/0 (Redis-совместимый сервер, общий для воркеров) или пусто - в памяти
+    CACHE_URL: str = os.getenv("CACHE_URL", "")
+    CACHE_PREFIX: str = os.getenv("CACHE_PREFIX", "fastapi-cache")
+    CACHE_SOCKET_TIMEOUT_SECONDS: float = float(os.getenv("CACHE_SOCKET_TIMEOUT_SECONDS", 0.5))
+    ATM_CACHE_TTL_SECONDS: int = int(os.getenv("ATM_CACHE_TTL_SECONDS", 60))  # GET /atms/{id}
+    LOGS_CACHE_TTL_SECONDS: int = int(os.getenv("LOGS_CACHE_TTL_SECONDS", 5))  # Первые страницы GET /logs/
+
+    # Кеш справочников в памяти процесса (refdata.py): страховочный TTL на изменения мимо приложения
+    REFDATA_TTL_SECONDS: int = int(os.getenv("REFDATA_TTL_SECONDS", 300))
+
+    # Подсчет X-Total-Count (counts.py): exact | cached | estimated | none. По умолчанию точный - на нем
+    # держится пагинация фронтенда; оценку включают явно (COUNT_STRATEGY=estimated или ?count=estimated)
+    COUNT_STRATEGY: str = os.getenv("COUNT_STRATEGY", "exact")
+    COUNT_ESTIMATE_THRESHOLD: int = int(os.getenv("COUNT_ESTIMATE_THRESHOLD", 100000))  # Ниже порога считаем точно
+    COUNT_CACHE_TTL_SECONDS: int = int(os.getenv("COUNT_CACHE_TTL_SECONDS", 10))
+    COUNT_CACHE_MAX_ENTRIES: int = int(os.getenv("COUNT_CACHE_MAX_ENTRIES", 1024))
 
 
 settings = Settings()
@@ -0,0 +1,135 @@
+# app/counts.py
+"""
+Стратегии подсчета X-Total-Count для списков.
+
+Точный COUNT(*) по atm_logs (часто с ILIKE) стоит столько же, сколько сама страница,
+и выполняется на каждый запрос. Поэтому режим подсчета выбирается:
+  exact     - COUNT(*) каждый раз (старое поведение);
+  cached    - COUNT(*), но результат кешируется на COUNT_CACHE_TTL_SECONDS по набору фильтров;
+  estimated - оценка планировщика (EXPLAIN: rows, на основе pg_class.reltuples и статистики);
+              если оценка ниже COUNT_ESTIMATE_THRESHOLD, считается точно (с кешем);
+  none      - не считать вовсе (клиенту итог не нужен, например при курсорной пагинации).
+Клиент выбирает режим параметром ?count= или заголовком X-Count-Mode, по умолчанию - COUNT_STRATEGY
+(exact, если не задан в окружении).
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from sqlalchemy import Select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+
+COUNT_MODES = ("exact", "cached", "estimated", "none")
+
+
+@dataclass(frozen=True)
+class TotalCount:
+    value: int
+    mode: str  # Каким способом получено значение: exact / cached / estimated
+
+
+class _TTLCache:
+    """Небольшой LRU-кеш с временем жизни записей (на процесс)."""
+
+    def __init__(self, max_entries: int):
+        self._max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[float, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, ttl: float) -> Optional[int]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if time.monotonic() - stored_at > ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: int) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_count_cache = _TTLCache(settings.COUNT_CACHE_MAX_ENTRIES)
+
+
+def resolve_mode(query_mode: Optional[str], header_mode: Optional[str]) -> str:
+    """Параметр запроса важнее заголовка, заголовок важнее настройки по умолчанию."""
+    return query_mode or header_mode or settings.COUNT_STRATEGY
+
+
+def make_cache_key(table: str, filters: Dict) -> Hashable:
+    # Значения фильтров (datetime и т.п.) приводим к строкам, чтобы ключ был хешируемым и стабильным
+    return table, json.dumps(filters, sort_keys=True, default=str)
+
+
+def clear_count_cache() -> None:
+    _count_cache.clear()
+
+
+async def estimate_rows(db: AsyncSession, query: Select) -> Optional[int]:
+    """Оценка числа строк запроса по плану PostgreSQL (без выполнения). None для других СУБД."""
+    if db.bind.dialect.name != "postgresql":
+        return None
+    connection = await db.connection()
+    compiled = query.compile(dialect=connection.dialect)
+    if compiled.positional:
+        params = tuple(compiled.params[name] for name in compiled.positiontup)
+    else:
+        params = compiled.params
+    result = await connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", params)
+    plan = result.scalar()
+    if isinstance(plan, str):  # В зависимости от драйвера JSON приходит строкой или уже разобранным
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+async def get_total_count(
+        db: AsyncSession,
+        mode: str,
+        cache_key: Hashable,
+        exact_count: Callable[[], Awaitable[int]],
+        estimate_query: Select
+) -> Optional[TotalCount]:
+    """
+    Возвращает итог списка по выбранной стратегии или None, если клиент отказался от подсчета.
+    estimate_query - SELECT с теми же фильтрами, по которому планировщик оценивает число строк.
+    """
+    if mode == "none":
+        return None
+    if mode == "exact":
+        return TotalCount(value=await exact_count(), mode="exact")
+
+    if mode == "estimated":
+        estimate = await estimate_rows(db, estimate_query)
+        if estimate is not None and estimate >= settings.COUNT_ESTIMATE_THRESHOLD:
+            return TotalCount(value=estimate, mode="estimated")
+
+    # cached, а также estimated для небольших выборок и не-PostgreSQL
+    cached = _count_cache.get(cache_key, settings.COUNT_CACHE_TTL_SECONDS)
+    if cached is not None:
+        return TotalCount(value=cached, mode="cached")
+    value = await exact_count()
+    _count_cache.set(cache_key, value)
+    return TotalCount(value=value, mode="exact")
+
+
+def count_headers(total: Optional[TotalCount]) -> Dict[str, str]:
+    if total is None:
+        return {}
+    return {"X-Total-Count": str(total.value), "X-Total-Count-Mode": total.mode}
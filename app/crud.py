@@ -1,13 +1,13 @@
 # app/crud.py
-from sqlalchemy.orm import Session
-from typing import List, Optional # Добавили Optional и List
+from sqlalchemy.orm import Session, selectinload
+from typing import List, Optional, Tuple # Добавили Optional и List
 
-import models, schemas
+import models, schemas, refdata, pagination, search, rollups, metrics, alert_rules
 from security import get_password_hash
 
 from datetime import datetime, timezone
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy import desc, func as sql_func
+from sqlalchemy import desc, insert, select, true, update, func as sql_func
 from sqlalchemy import func
 # --- User CRUD (оставляем как было) ---
 def get_user(db: Session, user_id: int) -> Optional[models.User]:
@@ -37,6 +37,18 @@ def get_users(db: Session, skip: int = 0, limit: int = 100) -> List[models.User]
 
 
 # --- ATM CRUD ---
+# Ключ keyset-пагинации банкоматов (см. pagination.py)
+ATM_KEYSET_COLUMNS = (models.ATM.id,)
+# Связи для сериализации списков через schemas.ATM / schemas.ATMLog (from_attributes): подгружаются
+# одним запросом на связь для всей страницы, а не lazy load на каждую строку (N+1).
+# Роутеры на AsyncSession берут их из кеша справочников (refdata.atm_to_schema / log_to_schema).
+ATM_LIST_OPTIONS = (selectinload(models.ATM.status),)
+
+
+def atm_keyset(db_atm: models.ATM) -> tuple:
+    return (db_atm.id,)
+
+
 def get_atm(db: Session, atm_id: int) -> Optional[models.ATM]:
     """Получает банкомат по ID."""
     return db.query(models.ATM).filter(models.ATM.id == atm_id).first()
@@ -46,6 +58,22 @@ def get_atm_by_uid(db: Session, atm_uid: str) -> Optional[models.ATM]:
     return db.query(models.ATM).filter(models.ATM.atm_uid == atm_uid).first()
 
 
+def atm_filter_criteria(
+        status_id: Optional[int] = None,
+        location_keyword: Optional[str] = None,
+        atm_uid_keyword: Optional[str] = None
+) -> list:
+    """Условия WHERE для списка банкоматов (общие для crud.py и crud_async.py)."""
+    criteria = []
+    if status_id is not None:
+        criteria.append(models.ATM.status_id == status_id)
+    if location_keyword:
+        criteria.append(models.ATM.location_description.ilike(f"%{location_keyword}%"))
+    if atm_uid_keyword:  # <-- Новый фильтр
+        criteria.append(models.ATM.atm_uid.ilike(f"%{atm_uid_keyword}%"))
+    return criteria
+
+
 def get_atms(
         db: Session,
         skip: int = 0,
@@ -54,13 +82,9 @@ def get_atms(
         location_keyword: Optional[str] = None,
         atm_uid_keyword: Optional[str] = None  # <-- Новый параметр
 ) -> List[models.ATM]:
-    query = db.query(models.ATM)
-    if status_id is not None:
-        query = query.filter(models.ATM.status_id == status_id)
-    if location_keyword:
-        query = query.filter(models.ATM.location_description.ilike(f"%{location_keyword}%"))
-    if atm_uid_keyword:  # <-- Новый фильтр
-        query = query.filter(models.ATM.atm_uid.ilike(f"%{atm_uid_keyword}%"))
+    query = db.query(models.ATM).options(*ATM_LIST_OPTIONS).filter(
+        *atm_filter_criteria(status_id, location_keyword, atm_uid_keyword)
+    )
 
     # TODO: Сортировка
     return query.offset(skip).limit(limit).all()
@@ -72,17 +96,36 @@ def get_atms_count(
         location_keyword: Optional[str] = None,
         atm_uid_keyword: Optional[str] = None  # <-- Новый параметр
 ) -> int:
-    query = db.query(sql_func.count(models.ATM.id))
-    if status_id is not None:
-        query = query.filter(models.ATM.status_id == status_id)
-    if location_keyword:
-        query = query.filter(models.ATM.location_description.ilike(f"%{location_keyword}%"))
-    if atm_uid_keyword:  # <-- Новый фильтр
-        query = query.filter(models.ATM.atm_uid.ilike(f"%{atm_uid_keyword}%"))
+    query = db.query(sql_func.count(models.ATM.id)).filter(
+        *atm_filter_criteria(status_id, location_keyword, atm_uid_keyword)
+    )
 
     total_count = query.scalar()
     return total_count if total_count is not None else 0
 
+def get_atms_page(
+        db: Session,
+        limit: int = 100,
+        cursor: Optional[pagination.Cursor] = None,
+        status_id: Optional[int] = None,
+        location_keyword: Optional[str] = None,
+        atm_uid_keyword: Optional[str] = None
+) -> pagination.Page[models.ATM]:
+    """Страница банкоматов по курсору (keyset по id) вместо OFFSET."""
+    criteria = atm_filter_criteria(status_id, location_keyword, atm_uid_keyword)
+    if cursor is not None:
+        criteria.append(pagination.keyset_criteria(ATM_KEYSET_COLUMNS, cursor))
+    rows = (
+        db.query(models.ATM)
+        .options(*ATM_LIST_OPTIONS)
+        .filter(*criteria)
+        .order_by(*pagination.keyset_ordering(ATM_KEYSET_COLUMNS, False, cursor))
+        .limit(limit + 1)  # Лишняя строка показывает, есть ли следующая страница
+        .all()
+    )
+    return pagination.build_page(rows, limit, cursor, descending=False, key_func=atm_keyset)
+
+
 def create_atm(db: Session, atm: schemas.ATMCreate, user_id: int) -> models.ATM:
     """Создает новый банкомат."""
     # Проверка на существование статуса (если нужно, но FK constraint это сделает)
@@ -111,26 +154,31 @@ def update_atm(
     db.refresh(db_atm)
     return db_atm
 
-def delete_atm(db: Session, atm_id: int) -> Optional[models.ATM]:
-    """Удаляет банкомат."""
-    db_atm = db.query(models.ATM).filter(models.ATM.id == atm_id).first()
-    if db_atm:
-        db.delete(db_atm)
-        db.commit()
-        return db_atm
-    return None
 
+# Удаление банкомата - только через atm_deletion.submit/run: пометка deletion_requested_at,
+# пачечное удаление или архивирование логов и удаление банкомата в одной транзакции с остатком.
 
 # --- ATMLog CRUD ---
+# Ключ keyset-пагинации логов: id добавлен для однозначности при совпадающем времени
+ATM_LOG_KEYSET_COLUMNS = (models.ATMLog.event_timestamp, models.ATMLog.id)
+ATM_LOG_LIST_OPTIONS = (selectinload(models.ATMLog.log_level), selectinload(models.ATMLog.event_type))
+
+
+def atm_log_keyset(db_log: models.ATMLog) -> tuple:
+    return (db_log.event_timestamp, db_log.id)
+
+
 def get_atm_log(db: Session, log_id: int) -> Optional[models.ATMLog]:
     """Получает запись лога по ID."""
     return db.query(models.ATMLog).filter(models.ATMLog.id == log_id).first()
 
 
-def get_atm_logs(
-        db: Session,
-        skip: int = 0,
-        limit: int = 100,
+def as_utc(moment: datetime) -> datetime:
+    """Время без часового пояса считаем UTC (как и границы секций atm_logs)."""
+    return moment if moment.tzinfo is not None else moment.replace(tzinfo=timezone.utc)
+
+
+def atm_log_filter_criteria(
         atm_id: Optional[int] = None,
         log_level_id: Optional[int] = None,
         event_type_id: Optional[int] = None,
@@ -138,32 +186,120 @@ def get_atm_logs(
         start_time: Optional[datetime] = None,
         end_time: Optional[datetime] = None,
         message_keyword: Optional[str] = None,
-        sort_by_timestamp_desc: bool = True  # По умолчанию сортируем по убыванию времени
-) -> List[models.ATMLog]:
-    """Получает список логов с пагинацией и фильтрацией."""
-    query = db.query(models.ATMLog)
-
+        is_acknowledged: Optional[bool] = None,
+        search_terms: Optional[Tuple[search.SearchTerm, ...]] = None,
+        payload_contains: Optional[dict] = None
+) -> list:
+    """Условия WHERE для списка логов (общие для выборки, подсчета и crud_async.py)."""
+    criteria = []
     if atm_id is not None:
-        query = query.filter(models.ATMLog.atm_id == atm_id)
+        criteria.append(models.ATMLog.atm_id == atm_id)
     if log_level_id is not None:
-        query = query.filter(models.ATMLog.log_level_id == log_level_id)
+        criteria.append(models.ATMLog.log_level_id == log_level_id)
     if event_type_id is not None:
-        query = query.filter(models.ATMLog.event_type_id == event_type_id)
+        criteria.append(models.ATMLog.event_type_id == event_type_id)
     if is_alert is not None:
-        query = query.filter(models.ATMLog.is_alert == is_alert)
+        criteria.append(models.ATMLog.is_alert == is_alert)
+    # Время сравнивается со столбцом напрямую (без функций над event_timestamp), чтобы PostgreSQL
+    # мог отсечь ненужные секции atm_logs (partition pruning, см. partitions.py)
     if start_time:
-        query = query.filter(models.ATMLog.event_timestamp >= start_time)
+        criteria.append(models.ATMLog.event_timestamp >= as_utc(start_time))
     if end_time:
-        query = query.filter(models.ATMLog.event_timestamp <= end_time)
+        criteria.append(models.ATMLog.event_timestamp <= as_utc(end_time))
     if message_keyword:
-        query = query.filter(models.ATMLog.message.ilike(f"%{message_keyword}%"))
-
+        # Для поиска по части строки используем ilike (нечувствительный к регистру)
+        criteria.append(models.ATMLog.message.ilike(f"%{message_keyword}%"))
+    if is_acknowledged is not None:
+        # is_acknowledged=false вместе с is_alert=true совпадает с условием частичного индекса
+        # ix_atm_logs_unacknowledged_alerts (см. migrations/0001_atm_logs_indexes.sql)
+        if is_acknowledged:
+            criteria.append(models.ATMLog.acknowledged_by_user_id.is_not(None))
+        else:
+            criteria.append(models.ATMLog.acknowledged_by_user_id.is_(None))
+    if search_terms:
+        # Полнотекстовый поиск по GIN-индексу (в отличие от ILIKE по message_keyword), см. search.py
+        criteria.append(search.MessageMatch(models.ATMLog.message, search_terms))
+    if payload_contains:
+        criteria.append(search.PayloadContains(models.ATMLog.payload, payload_contains))
+    return criteria
+
+
+def atm_log_ordering(
+        sort_by_timestamp_desc: bool = True,
+        rank_by_terms: Optional[Tuple[search.SearchTerm, ...]] = None
+) -> list:
+    # id - детерминированный порядок при одинаковом времени (тот же ключ, что и у курсоров)
+    if rank_by_terms:
+        # Сначала самые релевантные запросу, при равной релевантности - по времени
+        rank = search.MessageRank(models.ATMLog.message, rank_by_terms)
+        return [rank.desc(), *atm_log_ordering(sort_by_timestamp_desc)]
     if sort_by_timestamp_desc:
-        query = query.order_by(desc(models.ATMLog.event_timestamp))  # Сортировка
-    else:
-        query = query.order_by(models.ATMLog.event_timestamp)
+        return [desc(models.ATMLog.event_timestamp), desc(models.ATMLog.id)]
+    return [models.ATMLog.event_timestamp, models.ATMLog.id]
+
+
+def get_atm_logs(
+        db: Session,
+        skip: int = 0,
+        limit: int = 100,
+        atm_id: Optional[int] = None,
+        log_level_id: Optional[int] = None,
+        event_type_id: Optional[int] = None,
+        is_alert: Optional[bool] = None,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        message_keyword: Optional[str] = None,
+        is_acknowledged: Optional[bool] = None,
+        search_terms: Optional[Tuple[search.SearchTerm, ...]] = None,
+        payload_contains: Optional[dict] = None,
+        sort_by_timestamp_desc: bool = True,  # По умолчанию сортируем по убыванию времени
+        order_by_relevance: bool = False  # Сортировать по релевантности search_terms
+) -> List[models.ATMLog]:
+    """Получает список логов с пагинацией и фильтрацией."""
+    query = db.query(models.ATMLog).options(*ATM_LOG_LIST_OPTIONS).filter(*atm_log_filter_criteria(
+        atm_id, log_level_id, event_type_id, is_alert, start_time, end_time, message_keyword,
+        is_acknowledged, search_terms, payload_contains
+    ))
+    query = query.order_by(*atm_log_ordering(  # Сортировка
+        sort_by_timestamp_desc, search_terms if order_by_relevance else None
+    ))
 
     return query.offset(skip).limit(limit).all()
+
+
+def get_atm_logs_page(
+        db: Session,
+        limit: int = 100,
+        cursor: Optional[pagination.Cursor] = None,
+        atm_id: Optional[int] = None,
+        log_level_id: Optional[int] = None,
+        event_type_id: Optional[int] = None,
+        is_alert: Optional[bool] = None,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        message_keyword: Optional[str] = None,
+        is_acknowledged: Optional[bool] = None,
+        search_terms: Optional[Tuple[search.SearchTerm, ...]] = None,
+        payload_contains: Optional[dict] = None,
+        sort_by_timestamp_desc: bool = True
+) -> pagination.Page[models.ATMLog]:
+    """Страница логов по курсору (keyset по (event_timestamp, id)) с теми же фильтрами, что и get_atm_logs."""
+    criteria = atm_log_filter_criteria(
+        atm_id, log_level_id, event_type_id, is_alert, start_time, end_time, message_keyword,
+        is_acknowledged, search_terms, payload_contains
+    )
+    if cursor is not None:
+        criteria.append(pagination.keyset_criteria(ATM_LOG_KEYSET_COLUMNS, cursor))
+    rows = (
+        db.query(models.ATMLog)
+        .options(*ATM_LOG_LIST_OPTIONS)
+        .filter(*criteria)
+        .order_by(*pagination.keyset_ordering(ATM_LOG_KEYSET_COLUMNS, sort_by_timestamp_desc, cursor))
+        .limit(limit + 1)
+        .all()
+    )
+    return pagination.build_page(rows, limit, cursor, descending=sort_by_timestamp_desc, key_func=atm_log_keyset)
+
 def get_log_levels(db: Session) -> List[models.LogLevel]:
     return db.query(models.LogLevel).order_by(models.LogLevel.severity_order, models.LogLevel.name).all()
 
@@ -179,25 +315,15 @@ def get_atm_logs_count(
     is_alert: Optional[bool] = None,
     start_time: Optional[datetime] = None,
     end_time: Optional[datetime] = None,
-    message_keyword: Optional[str] = None
+    message_keyword: Optional[str] = None,
+    is_acknowledged: Optional[bool] = None,
+    search_terms: Optional[Tuple[search.SearchTerm, ...]] = None,
+    payload_contains: Optional[dict] = None
 ) -> int:
-    query = db.query(func.count(models.ATMLog.id)) # Считаем количество ID
-
-    if atm_id is not None:
-        query = query.filter(models.ATMLog.atm_id == atm_id)
-    if log_level_id is not None:
-        query = query.filter(models.ATMLog.log_level_id == log_level_id)
-    if event_type_id is not None:
-        query = query.filter(models.ATMLog.event_type_id == event_type_id)
-    if is_alert is not None:
-        query = query.filter(models.ATMLog.is_alert == is_alert)
-    if start_time:
-        query = query.filter(models.ATMLog.event_timestamp >= start_time)
-    if end_time:
-        query = query.filter(models.ATMLog.event_timestamp <= end_time)
-    if message_keyword:
-        # Для поиска по части строки используем ilike (нечувствительный к регистру) или like
-        query = query.filter(models.ATMLog.message.ilike(f"%{message_keyword}%"))
+    query = db.query(func.count(models.ATMLog.id)).filter(*atm_log_filter_criteria(  # Считаем количество ID
+        atm_id, log_level_id, event_type_id, is_alert, start_time, end_time, message_keyword,
+        is_acknowledged, search_terms, payload_contains
+    ))
 
     count = query.scalar() # scalar_one_or_none вернет None если нет записей, 0 если 0.
     return count if count is not None else 0
@@ -207,20 +333,121 @@ def create_atm_log(db: Session, log: schemas.ATMLogCreate, atm_id: int) -> model
     """Создает новую запись лога для указанного банкомата."""
     # Проверки на существование atm_id, log_level_id, event_type_id (если нужно, но FK сделают это)
     # ...
+    reference = refdata.get_reference_data(db)
     db_log = models.ATMLog(
-        **log.model_dump(),
+        **log.model_dump(exclude={"is_alert"}),
+        is_alert=alert_rules.classify([log], reference)[0],
         atm_id=atm_id
     )
     db.add(db_log)
     try:
+        db.flush()
+        rollups.record_logs(db, [db_log])
         db.commit()
         db.refresh(db_log)
     except IntegrityError as e: # Перехватываем ошибки БД (FK и т.д.)
          db.rollback()
+         metrics.count_log_rejected(atm_id, log.log_level_id, "db_error")
          raise ValueError(f"Database error: {e}") # Пример обработки ошибки БД
+    metrics.count_logs_accepted([db_log])
     return db_log
 
 
+def create_atm_logs_bulk(
+        db: Session, logs: List[schemas.ATMLogBatchItem]
+) -> List[Tuple[Optional[int], Optional[str]]]:
+    """
+    Пакетно создает логи (в том числе для разных банкоматов).
+    Существование ATM проверяется одним запросом, LogLevel/EventType - по кешу справочников,
+    вставка идет одним multi-row INSERT ... RETURNING на всю пачку и одним commit.
+    Возвращает список (id, error) в том же порядке, что и входные записи.
+    """
+    if not logs:
+        return []
+
+    atm_ids = {log.atm_id for log in logs}
+    existing_atm_ids = {row[0] for row in db.query(models.ATM.id).filter(
+        models.ATM.id.in_(atm_ids), *accepting_logs_criteria()
+    ).all()}
+    # Уровни и типы событий проверяем по кешу справочников, без запросов
+    reference = refdata.get_reference_data(db)
+    results, rows, row_positions = split_bulk_logs(logs, existing_atm_ids, reference)
+    if not rows:
+        return results
+
+    try:
+        inserted = db.execute(bulk_insert_logs_statement(), rows).all()
+        rollups.record_logs(db, inserted_logs(rows, inserted))
+        db.commit()
+    except IntegrityError as e:  # Например, банкомат удален между проверкой и вставкой
+        db.rollback()
+        for index in row_positions:
+            results[index] = (None, f"Database error: {e.orig}")
+            metrics.count_log_rejected(logs[index].atm_id, logs[index].log_level_id, "db_error")
+        return results
+
+    for index, row in zip(row_positions, inserted):
+        results[index] = (row.id, None)
+    metrics.count_logs_accepted(logs[index] for index in row_positions)
+    return results
+
+
+def accepting_logs_criteria() -> list:
+    """Банкомат, который удаляется (atm_deletion.py), логов не принимает - для приема он "не найден"."""
+    return [models.ATM.deletion_requested_at.is_(None)]
+
+
+def split_bulk_logs(
+        logs: List[schemas.ATMLogBatchItem], existing_atm_ids: set, reference: refdata.ReferenceData
+) -> Tuple[List[Tuple[Optional[int], Optional[str]]], List[dict], List[int]]:
+    """
+    Делит пачку на отклоненные записи и строки для INSERT.
+    Возвращает (results, rows, row_positions): results уже содержит ошибки отклоненных записей,
+    row_positions - индексы входных записей, попавших в rows.
+    """
+    results: List[Tuple[Optional[int], Optional[str]]] = [(None, None)] * len(logs)
+    accepted = []
+    row_positions = []  # Индексы входных записей, попавших в INSERT
+    for index, log in enumerate(logs):
+        # В метки отказа идут только проверенные id (см. metrics.count_log_rejected)
+        if log.atm_id not in existing_atm_ids:
+            results[index] = (None, f"ATM with id {log.atm_id} not found")
+            metrics.count_log_rejected(None, None, "atm_not_found")
+        elif log.log_level_id not in reference.log_levels:
+            results[index] = (None, f"LogLevel with id {log.log_level_id} not found.")
+            metrics.count_log_rejected(log.atm_id, None, "unknown_log_level")
+        elif log.event_type_id is not None and log.event_type_id not in reference.event_types:
+            results[index] = (None, f"EventType with id {log.event_type_id} not found.")
+            metrics.count_log_rejected(log.atm_id, log.log_level_id, "unknown_event_type")
+        else:
+            accepted.append(log)
+            row_positions.append(index)
+    # is_alert по правилам alert_rules для всей пачки сразу
+    rows = [
+        dict(log.model_dump(), is_alert=is_alert)
+        for log, is_alert in zip(accepted, alert_rules.classify(accepted, reference))
+    ]
+    return results, rows, row_positions
+
+
+def bulk_insert_logs_statement():
+    """
+    Multi-row INSERT ... RETURNING id и значений, которые выставляет БД (recorded_at);
+    sort_by_parameter_order сохраняет порядок строк.
+    """
+    return insert(models.ATMLog).returning(
+        models.ATMLog.id, models.ATMLog.recorded_at, sort_by_parameter_order=True
+    )
+
+
+def inserted_logs(rows: List[dict], inserted: List) -> List[models.ATMLog]:
+    """Несохраняемые ATMLog из строк пакетной вставки и значений, возвращенных RETURNING."""
+    return [
+        models.ATMLog(**{**values, "id": row.id, "recorded_at": row.recorded_at})
+        for values, row in zip(rows, inserted)
+    ]
+
+
 def acknowledge_alert(
         db: Session, db_log: models.ATMLog, user_id: int
 ) -> models.ATMLog:
@@ -232,27 +459,86 @@ def acknowledge_alert(
     if db_log.acknowledged_by_user_id is not None:
         raise ValueError(f"Alert log {db_log.id} was already acknowledged by user {db_log.acknowledged_by_user_id}.")
 
-    db_log.acknowledged_by_user_id = user_id
-    db_log.acknowledged_at = datetime.now(timezone.utc)
-
-    db.add(db_log)
+    # Условный UPDATE, как в массовом подтверждении: db_log мог устареть, а параллельный запрос -
+    # уже подтвердить алерт; тогда строка не вернется и сводки второй раз не уменьшаются
+    row = db.execute(acknowledge_alerts_statement(
+        [models.ATMLog.id == db_log.id, *unacknowledged_alert_conditions()], user_id
+    )).first()
+    if row is None:
+        db.rollback()
+        raise ValueError(f"Alert log {db_log.id} was already acknowledged.")
+    rollups.record_alert_changes(db, [rollups.AlertChange(rollups.LogFact.of(row), unacknowledged_delta=-1)])
     db.commit()
     db.refresh(db_log)
+    return db_log
 
-    _ = db_log.log_level
-    if db_log.event_type:
-        _ = db_log.event_type
 
-    return db_log
+# --- Массовые операции над алертами ---
+# Один UPDATE ... RETURNING на всю выборку. Условие (например, "алерт еще не подтвержден") стоит в WHERE
+# самого UPDATE: при READ COMMITTED PostgreSQL перепроверяет его после ожидания блокировки строки,
+# поэтому строку, подтвержденную параллельным запросом, второй запрос пропустит, а не перезапишет.
+BULK_UPDATE_RETURNING = (
+    models.ATMLog.id, models.ATMLog.atm_id, models.ATMLog.event_timestamp, models.ATMLog.log_level_id,
+    models.ATMLog.event_type_id, models.ATMLog.is_alert, models.ATMLog.acknowledged_by_user_id,
+)
+
+
+def bulk_log_criteria(
+        log_ids: Optional[List[int]], filters: Optional[dict], limit: int, conditions: list
+) -> list:
+    """WHERE для массового UPDATE: логи из списка ID или первые limit логов по фильтру, удовлетворяющие conditions."""
+    if log_ids is not None:
+        return [models.ATMLog.id.in_(log_ids), *conditions]
+    first_matching = (
+        select(models.ATMLog.id)
+        .where(*atm_log_filter_criteria(**filters), *conditions)
+        .order_by(*atm_log_ordering(sort_by_timestamp_desc=False))
+        .limit(limit)
+    )
+    return [models.ATMLog.id.in_(first_matching), *conditions]
+
+
+def unacknowledged_alert_conditions() -> list:
+    # is_alert = true (а не IS TRUE) планировщик сводит к условию частичного индекса ix_atm_logs_unacknowledged_alerts
+    return [models.ATMLog.is_alert == true(), models.ATMLog.acknowledged_by_user_id.is_(None)]
+
+
+def alert_status_change_conditions(is_alert: bool) -> list:
+    # Только строки, где значение действительно меняется (NULL считается "не алерт")
+    return [models.ATMLog.is_alert.is_not(true()) if is_alert else models.ATMLog.is_alert.is_(true())]
+
+
+def acknowledge_alerts_statement(criteria: list, user_id: int):
+    return (
+        update(models.ATMLog)
+        .where(*criteria)
+        .values(acknowledged_by_user_id=user_id, acknowledged_at=datetime.now(timezone.utc))
+        .returning(*BULK_UPDATE_RETURNING)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def update_alert_status_statement(criteria: list, is_alert: bool):
+    return (
+        update(models.ATMLog)
+        .where(*criteria)
+        .values(is_alert=is_alert)
+        .returning(*BULK_UPDATE_RETURNING)
+        .execution_options(synchronize_session=False)
+    )
 
 
 def update_log_alert_status(
         db: Session, db_log: models.ATMLog, is_alert: bool
 ) -> models.ATMLog:
     """Обновляет статус is_alert для лога."""
-    db_log.is_alert = is_alert
-
-    db.add(db_log)
+    # Условный UPDATE, как в массовом пути: db_log мог устареть, и параллельный запрос уже сменил флаг;
+    # тогда строка не вернется и сводки второй раз не меняются
+    row = db.execute(update_alert_status_statement(
+        [models.ATMLog.id == db_log.id, *alert_status_change_conditions(is_alert)], is_alert
+    )).first()
+    if row is not None:
+        rollups.record_alert_changes(db, [rollups.alert_status_change(row, is_alert)])
     db.commit()
     db.refresh(db_log)
     return db_log
@@ -268,6 +554,8 @@ def update_user_role(db: Session, db_user: models.User, new_role: str) -> models
         raise ValueError(f"Invalid role: {new_role}. Allowed roles are {', '.join(ALLOWED_ROLES)}.")
 
     db_user.role = new_role
+    # Токены, выданные со старой ролью, отзываются (deps.get_current_user сверяет claim "ver")
+    db_user.token_version = (db_user.token_version or 0) + 1
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
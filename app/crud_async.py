@@ -0,0 +1,344 @@
+# app/crud_async.py
+"""
+Асинхронные версии функций crud.py для AsyncSession.
+Условия фильтрации берутся из crud.py, поэтому выборки совпадают с синхронными один в один.
+"""
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import crud, models, schemas, refdata, pagination, search, broadcast, rollups, metrics, alert_rules
+from security import get_password_hash_async
+
+
+# --- User CRUD ---
+async def get_user(db: AsyncSession, user_id: int) -> Optional[models.User]:
+    return await db.scalar(select(models.User).where(models.User.id == user_id))
+
+
+async def get_user_by_email(db: AsyncSession, email: str) -> Optional[models.User]:
+    return await db.scalar(select(models.User).where(models.User.email == email))
+
+
+async def get_user_by_username(db: AsyncSession, username: str) -> Optional[models.User]:
+    return await db.scalar(select(models.User).where(models.User.username == username))
+
+
+async def create_user(db: AsyncSession, user: schemas.UserCreate) -> models.User:
+    hashed_password = await get_password_hash_async(user.password)  # bcrypt не в цикле событий
+    db_user = models.User(
+        username=user.username,
+        email=user.email,
+        password_hash=hashed_password,
+        role='operator'
+    )
+    db.add(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    return db_user
+
+
+# --- ATM CRUD ---
+async def get_atm(db: AsyncSession, atm_id: int) -> Optional[models.ATM]:
+    return await db.scalar(select(models.ATM).where(models.ATM.id == atm_id))
+
+
+async def get_atms(
+        db: AsyncSession,
+        skip: int = 0,
+        limit: int = 100,
+        status_id: Optional[int] = None,
+        location_keyword: Optional[str] = None,
+        atm_uid_keyword: Optional[str] = None
+) -> List[models.ATM]:
+    stmt = (
+        select(models.ATM)
+        .where(*crud.atm_filter_criteria(status_id, location_keyword, atm_uid_keyword))
+        .offset(skip)
+        .limit(limit)
+    )
+    return list((await db.scalars(stmt)).all())
+
+
+async def get_atms_page(
+        db: AsyncSession,
+        limit: int = 100,
+        cursor: Optional[pagination.Cursor] = None,
+        status_id: Optional[int] = None,
+        location_keyword: Optional[str] = None,
+        atm_uid_keyword: Optional[str] = None
+) -> pagination.Page[models.ATM]:
+    criteria = crud.atm_filter_criteria(status_id, location_keyword, atm_uid_keyword)
+    if cursor is not None:
+        criteria.append(pagination.keyset_criteria(crud.ATM_KEYSET_COLUMNS, cursor))
+    stmt = (
+        select(models.ATM)
+        .where(*criteria)
+        .order_by(*pagination.keyset_ordering(crud.ATM_KEYSET_COLUMNS, False, cursor))
+        .limit(limit + 1)
+    )
+    rows = list((await db.scalars(stmt)).all())
+    return pagination.build_page(rows, limit, cursor, descending=False, key_func=crud.atm_keyset)
+
+
+async def get_atms_count(
+        db: AsyncSession,
+        status_id: Optional[int] = None,
+        location_keyword: Optional[str] = None,
+        atm_uid_keyword: Optional[str] = None
+) -> int:
+    stmt = select(func.count(models.ATM.id)).where(
+        *crud.atm_filter_criteria(status_id, location_keyword, atm_uid_keyword)
+    )
+    total_count = await db.scalar(stmt)
+    return total_count if total_count is not None else 0
+
+
+async def get_atm_summaries(
+        db: AsyncSession, status_id: Optional[int] = None
+) -> Tuple[List[Tuple[models.ATM, Optional[models.ATMHealth]]], List[models.ATMLevelCount]]:
+    """
+    Банкоматы с их состоянием и счетчиками по уровням из таблиц сводок (rollups.py):
+    два запроса, atm_logs не читается.
+    """
+    criteria = crud.atm_filter_criteria(status_id)
+    atms = (await db.execute(
+        select(models.ATM, models.ATMHealth)
+        .outerjoin(models.ATMHealth, models.ATMHealth.atm_id == models.ATM.id)
+        .where(*criteria)
+        .order_by(models.ATM.id)
+    )).all()
+    level_counts = select(models.ATMLevelCount)
+    if status_id is not None:
+        level_counts = level_counts.join(models.ATM, models.ATM.id == models.ATMLevelCount.atm_id).where(*criteria)
+    return [tuple(row) for row in atms], list((await db.scalars(level_counts)).all())
+
+
+# --- ATMLog CRUD ---
+async def get_atm_log(db: AsyncSession, log_id: int) -> Optional[models.ATMLog]:
+    return await db.scalar(select(models.ATMLog).where(models.ATMLog.id == log_id))
+
+
+async def get_atm_logs(
+        db: AsyncSession,
+        skip: int = 0,
+        limit: int = 100,
+        atm_id: Optional[int] = None,
+        log_level_id: Optional[int] = None,
+        event_type_id: Optional[int] = None,
+        is_alert: Optional[bool] = None,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        message_keyword: Optional[str] = None,
+        is_acknowledged: Optional[bool] = None,
+        search_terms: Optional[Tuple[search.SearchTerm, ...]] = None,
+        payload_contains: Optional[dict] = None,
+        sort_by_timestamp_desc: bool = True,
+        order_by_relevance: bool = False
+) -> List[models.ATMLog]:
+    stmt = (
+        select(models.ATMLog)
+        .where(*crud.atm_log_filter_criteria(
+            atm_id, log_level_id, event_type_id, is_alert, start_time, end_time, message_keyword,
+            is_acknowledged, search_terms, payload_contains
+        ))
+        .order_by(*crud.atm_log_ordering(sort_by_timestamp_desc, search_terms if order_by_relevance else None))
+        .offset(skip)
+        .limit(limit)
+    )
+    return list((await db.scalars(stmt)).all())
+
+
+async def get_atm_logs_page(
+        db: AsyncSession,
+        limit: int = 100,
+        cursor: Optional[pagination.Cursor] = None,
+        atm_id: Optional[int] = None,
+        log_level_id: Optional[int] = None,
+        event_type_id: Optional[int] = None,
+        is_alert: Optional[bool] = None,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        message_keyword: Optional[str] = None,
+        is_acknowledged: Optional[bool] = None,
+        search_terms: Optional[Tuple[search.SearchTerm, ...]] = None,
+        payload_contains: Optional[dict] = None,
+        sort_by_timestamp_desc: bool = True
+) -> pagination.Page[models.ATMLog]:
+    criteria = crud.atm_log_filter_criteria(
+        atm_id, log_level_id, event_type_id, is_alert, start_time, end_time, message_keyword,
+        is_acknowledged, search_terms, payload_contains
+    )
+    if cursor is not None:
+        criteria.append(pagination.keyset_criteria(crud.ATM_LOG_KEYSET_COLUMNS, cursor))
+    stmt = (
+        select(models.ATMLog)
+        .where(*criteria)
+        .order_by(*pagination.keyset_ordering(crud.ATM_LOG_KEYSET_COLUMNS, sort_by_timestamp_desc, cursor))
+        .limit(limit + 1)
+    )
+    rows = list((await db.scalars(stmt)).all())
+    return pagination.build_page(
+        rows, limit, cursor, descending=sort_by_timestamp_desc, key_func=crud.atm_log_keyset
+    )
+
+
+async def get_atm_logs_count(
+        db: AsyncSession,
+        atm_id: Optional[int] = None,
+        log_level_id: Optional[int] = None,
+        event_type_id: Optional[int] = None,
+        is_alert: Optional[bool] = None,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        message_keyword: Optional[str] = None,
+        is_acknowledged: Optional[bool] = None,
+        search_terms: Optional[Tuple[search.SearchTerm, ...]] = None,
+        payload_contains: Optional[dict] = None
+) -> int:
+    stmt = select(func.count(models.ATMLog.id)).where(*crud.atm_log_filter_criteria(
+        atm_id, log_level_id, event_type_id, is_alert, start_time, end_time, message_keyword,
+        is_acknowledged, search_terms, payload_contains
+    ))
+    count = await db.scalar(stmt)
+    return count if count is not None else 0
+
+
+async def create_atm_log(db: AsyncSession, log: schemas.ATMLogCreate, atm_id: int) -> models.ATMLog:
+    reference = await refdata.get_reference_data_async(db)
+    db_log = models.ATMLog(
+        **log.model_dump(exclude={"is_alert"}),
+        is_alert=alert_rules.classify([log], reference)[0],
+        atm_id=atm_id
+    )
+    db.add(db_log)
+    try:
+        await db.flush()
+        await rollups.record_logs_async(db, [db_log])
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        metrics.count_log_rejected(atm_id, log.log_level_id, "db_error")
+        raise ValueError(f"Database error: {e}")
+    metrics.count_logs_accepted([db_log])
+    if broadcast.bus.has_subscribers():
+        reference = await refdata.get_reference_data_async(db, [db_log])
+        broadcast.publish_logs([refdata.log_to_schema(db_log, reference)])
+    return db_log
+
+
+async def create_atm_logs_bulk(
+        db: AsyncSession, logs: List[schemas.ATMLogBatchItem]
+) -> List[Tuple[Optional[int], Optional[str]]]:
+    """Асинхронный вариант crud.create_atm_logs_bulk (те же проверки, один INSERT и один commit)."""
+    if not logs:
+        return []
+
+    atm_ids = {log.atm_id for log in logs}
+    existing_atm_ids = set((await db.scalars(
+        select(models.ATM.id).where(models.ATM.id.in_(atm_ids), *crud.accepting_logs_criteria())
+    )).all())
+    reference = await refdata.get_reference_data_async(db)
+    results, rows, row_positions = crud.split_bulk_logs(logs, existing_atm_ids, reference)
+    if not rows:
+        return results
+
+    try:
+        inserted = (await db.execute(crud.bulk_insert_logs_statement(), rows)).all()
+        inserted_logs = crud.inserted_logs(rows, inserted)
+        await rollups.record_logs_async(db, inserted_logs)
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        for index in row_positions:
+            results[index] = (None, f"Database error: {e.orig}")
+            metrics.count_log_rejected(logs[index].atm_id, logs[index].log_level_id, "db_error")
+        return results
+
+    for index, row in zip(row_positions, inserted):
+        results[index] = (row.id, None)
+    metrics.count_logs_accepted(inserted_logs)
+    if broadcast.bus.has_subscribers():
+        broadcast.publish_logs([refdata.log_to_schema(db_log, reference) for db_log in inserted_logs])
+    return results
+
+
+async def acknowledge_alert(
+        db: AsyncSession, db_log: models.ATMLog, user_id: int
+) -> models.ATMLog:
+    if not db_log.is_alert:
+        raise ValueError("Cannot acknowledge a non-alert log entry.")
+
+    if db_log.acknowledged_by_user_id is not None:
+        raise ValueError(f"Alert log {db_log.id} was already acknowledged by user {db_log.acknowledged_by_user_id}.")
+
+    # Условный UPDATE (см. crud.acknowledge_alert): сводки уменьшаются только для реально подтвержденной строки
+    row = (await db.execute(crud.acknowledge_alerts_statement(
+        [models.ATMLog.id == db_log.id, *crud.unacknowledged_alert_conditions()], user_id
+    ))).first()
+    if row is None:
+        await db.rollback()
+        raise ValueError(f"Alert log {db_log.id} was already acknowledged.")
+    await rollups.record_alert_changes_async(
+        db, [rollups.AlertChange(rollups.LogFact.of(row), unacknowledged_delta=-1)]
+    )
+    await db.commit()
+    await db.refresh(db_log)
+    return db_log
+
+
+async def update_log_alert_status(
+        db: AsyncSession, db_log: models.ATMLog, is_alert: bool
+) -> models.ATMLog:
+    # Условный UPDATE (см. crud.update_log_alert_status): сводки меняются только для реально измененной строки
+    row = (await db.execute(crud.update_alert_status_statement(
+        [models.ATMLog.id == db_log.id, *crud.alert_status_change_conditions(is_alert)], is_alert
+    ))).first()
+    if row is not None:
+        await rollups.record_alert_changes_async(db, [rollups.alert_status_change(row, is_alert)])
+    await db.commit()
+    await db.refresh(db_log)
+    return db_log
+
+
+async def acknowledge_alerts_bulk(
+        db: AsyncSession, user_id: int, log_ids: Optional[List[int]] = None, filters: Optional[dict] = None,
+        limit: int = 0
+) -> List:
+    """
+    Подтверждает неподтвержденные алерты из списка ID или по фильтру (не больше limit) одним UPDATE ... RETURNING.
+    Возвращает строки подтвержденных логов (crud.BULK_UPDATE_RETURNING).
+    """
+    criteria = crud.bulk_log_criteria(log_ids, filters, limit, crud.unacknowledged_alert_conditions())
+    rows = (await db.execute(crud.acknowledge_alerts_statement(criteria, user_id))).all()
+    await rollups.record_alert_changes_async(
+        db, [rollups.AlertChange(rollups.LogFact.of(row), unacknowledged_delta=-1) for row in rows]
+    )
+    await db.commit()
+    return rows
+
+
+async def update_alert_status_bulk(
+        db: AsyncSession, is_alert: bool, log_ids: Optional[List[int]] = None, filters: Optional[dict] = None,
+        limit: int = 0
+) -> List:
+    """Выставляет is_alert логам, у которых значение отличается; возвращает строки измененных логов."""
+    criteria = crud.bulk_log_criteria(log_ids, filters, limit, crud.alert_status_change_conditions(is_alert))
+    rows = (await db.execute(crud.update_alert_status_statement(criteria, is_alert))).all()
+    await rollups.record_alert_changes_async(db, [rollups.alert_status_change(row, is_alert) for row in rows])
+    await db.commit()
+    return rows
+
+
+async def get_log_alert_states(db: AsyncSession, log_ids: List[int]) -> dict:
+    """{id: (is_alert, acknowledged_by_user_id)} для существующих логов из списка."""
+    if not log_ids:
+        return {}
+    rows = await db.execute(
+        select(models.ATMLog.id, models.ATMLog.is_alert, models.ATMLog.acknowledged_by_user_id)
+        .where(models.ATMLog.id.in_(log_ids))
+    )
+    return {row.id: (row.is_alert, row.acknowledged_by_user_id) for row in rows}
@@ -1,8 +1,75 @@
 # app/database.py
+import time
+import uuid
+
 from sqlalchemy import create_engine
+from sqlalchemy import exc as sa_exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker, declarative_base # Новый импорт
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from config import settings # Импортируем наши настройки
+import metrics
+
+# --- Пул соединений ---
+# Размер пула, переподключение и проверка соединений задаются в config.py (DB_POOL_*).
+# Время ожидания свободного соединения попадает в гистограмму db_pool_wait_seconds,
+# занятость пулов отдается на GET /metrics в момент опроса (pool_metrics).
+POOL_WAIT = metrics.histogram(
+    "db_pool_wait_seconds", "Time to get a connection from the pool (including opening a new one).", ["pool"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+POOL_TIMEOUTS = metrics.counter("db_pool_timeouts_total", "Pool checkouts that failed with a pool timeout.", ["pool"])
+
+
+class _TimedPoolMixin:
+    metrics_name = ""
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        except sa_exc.TimeoutError:
+            POOL_TIMEOUTS.inc(pool=self.metrics_name)
+            raise
+        finally:
+            POOL_WAIT.observe(time.perf_counter() - started, pool=self.metrics_name)
+
+
+# Имя пула - атрибут класса: engine.dispose() пересоздает пул тем же классом
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    metrics_name = "sync"
+
+
+class TimedAsyncAdaptedQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    metrics_name = "async"
+
+
+def engine_options(url: str, is_async: bool = False) -> dict:
+    """Аргументы create_engine / create_async_engine для пула и драйвера из настроек."""
+    url_obj = make_url(url)
+    if url_obj.get_backend_name() == "sqlite":
+        return {}  # Для SQLite SQLAlchemy сам выбирает подходящий пул
+    options = {
+        "poolclass": TimedAsyncAdaptedQueuePool if is_async else TimedQueuePool,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT_SECONDS,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS,
+        "pool_use_lifo": settings.DB_POOL_USE_LIFO,
+    }
+    if settings.DB_PGBOUNCER and url_obj.get_driver_name() == "asyncpg":
+        # PgBouncer в режиме transaction: соседние транзакции идут через разные серверные соединения,
+        # поэтому именованные prepared statements asyncpg отключаются (psycopg2 их не использует)
+        options["connect_args"] = {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+        }
+    return options
+
 
 # DATABASE_URL из config.py будет использован здесь
 SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
@@ -10,7 +77,7 @@ print(f"DEBUG: Connecting to DATABASE_URL: {SQLALCHEMY_DATABASE_URL}")
 # Создаем движок SQLAlchemy
 # connect_args нужны для SQLite, для PostgreSQL они обычно не требуются,
 # но если будут проблемы с SSL или другими параметрами, их можно добавить сюда.
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **engine_options(SQLALCHEMY_DATABASE_URL))
 
 # Создаем фабрику сессий
 # autocommit=False и autoflush=False - стандартные настройки для SQLAlchemy сессий,
@@ -27,4 +94,66 @@ def get_db():
     try:
         yield db  # Предоставляем сессию в эндпоинт
     finally:
-        db.close() # Закрываем сессию после того, как эндпоинт отработал
\ No newline at end of file
+        db.close() # Закрываем сессию после того, как эндпоинт отработал
+
+
+def get_sessionmaker() -> sessionmaker:
+    """Фабрика сессий для фоновых задач, которые выполняются уже после ответа на запрос."""
+    return SessionLocal
+
+
+# --- Асинхронный слой (AsyncSession) ---
+# Синхронные сессии блокируют event loop uvicorn на время каждого запроса к БД,
+# поэтому горячие эндпоинты (прием логов, списки, аутентификация) работают через асинхронный драйвер.
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def to_async_database_url(url: str) -> str:
+    """Подменяет синхронный драйвер в URL на асинхронный (psycopg2 -> asyncpg, pysqlite -> aiosqlite)."""
+    url_obj = make_url(url)
+    async_driver = ASYNC_DRIVERS.get(url_obj.get_backend_name())
+    if async_driver is None:
+        raise ValueError(f"No async driver configured for database backend '{url_obj.get_backend_name()}'")
+    return url_obj.set(drivername=async_driver).render_as_string(hide_password=False)
+
+
+SQLALCHEMY_ASYNC_DATABASE_URL = settings.ASYNC_DATABASE_URL or to_async_database_url(SQLALCHEMY_DATABASE_URL)
+async_engine = create_async_engine(
+    SQLALCHEMY_ASYNC_DATABASE_URL, **engine_options(SQLALCHEMY_ASYNC_DATABASE_URL, is_async=True)
+)
+
+# expire_on_commit=False: после commit атрибуты объектов остаются доступными без повторного запроса
+# (в асинхронной сессии неявная подгрузка атрибутов невозможна)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def get_async_sessionmaker() -> async_sessionmaker:
+    """Фабрика сессий для кода, который сам управляет временем жизни сессии (потоковые ответы)."""
+    return AsyncSessionLocal
+
+
+def pool_metrics():
+    """Занятость пулов соединений на момент опроса /metrics."""
+    gauges = {
+        "size": metrics.Gauge("db_pool_size", "Configured number of persistent connections.", ["pool"]),
+        "checkedin": metrics.Gauge("db_pool_checked_in", "Idle connections in the pool.", ["pool"]),
+        "checkedout": metrics.Gauge("db_pool_checked_out", "Connections currently in use.", ["pool"]),
+        "overflow": metrics.Gauge("db_pool_overflow", "Connections open above pool_size (negative: not yet opened).", ["pool"]),
+    }
+    for name, pool in (("sync", engine.pool), ("async", async_engine.sync_engine.pool)):
+        if not isinstance(pool, QueuePool):
+            continue
+        for attribute, gauge in gauges.items():
+            gauge.set(getattr(pool, attribute)(), pool=name)
+    return gauges.values()
+
+
+metrics.register_collector("db_pool", pool_metrics)
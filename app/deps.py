@@ -1,11 +1,13 @@
 # app/deps.py
-from fastapi import Depends, HTTPException, status
+from typing import Optional
+
+from fastapi import Depends, HTTPException, status, Query
 from fastapi.security import OAuth2PasswordBearer  # Для получения токена из заголовка
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from jose import JWTError
 
-import crud, models, schemas
-from database import get_db
+import crud_async, models, schemas, usercache
+from database import get_async_db
 from security import decode_access_token  # Наша функция декодирования
 from config import settings
 
@@ -14,29 +16,51 @@ from config import settings
 # username/password для получения токена и как потом использовать этот токен.
 # URL "/api/v1/auth/login/token" - это наш эндпоинт логина.
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login/token")
+# То же без автоматической 401 - для эндпоинтов, где токен может прийти и в параметре запроса
+oauth2_scheme_optional = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login/token", auto_error=False)
 
 
 async def get_current_user(
-        db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)
+        db: AsyncSession = Depends(get_async_db), token: str = Depends(oauth2_scheme)
 ) -> models.User:
     """
     Зависимость для получения текущего аутентифицированного пользователя.
-    Извлекает токен, декодирует его, получает пользователя из БД.
+    Извлекает токен, декодирует его, получает пользователя из кеша (usercache.py), а при промахе - из БД.
+    Токен с устаревшей ролью или версией (после смены роли) отклоняется.
     """
+    return await authenticate_token(db, token)
+
+
+async def get_current_user_header_or_query(
+        db: AsyncSession = Depends(get_async_db),
+        token: Optional[str] = Depends(oauth2_scheme_optional),
+        access_token: Optional[str] = Query(None, description="JWT для клиентов без заголовков (EventSource)")
+) -> models.User:
+    """Как get_current_user, но токен можно передать и параметром access_token (EventSource не умеет в заголовки)."""
+    return await authenticate_token(db, token or access_token)
+
+
+async def authenticate_token(db: AsyncSession, token: Optional[str]) -> models.User:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
 
-    token_data = decode_access_token(token)
+    token_data = decode_access_token(token) if token else None
     if token_data is None or token_data.user_id is None:  # Убедимся, что user_id есть
         raise credentials_exception
 
-    user = crud.get_user(db, user_id=token_data.user_id)  # Получаем пользователя по ID
+    user = usercache.get_cached_user(token_data.user_id)
     if user is None:
+        generation = usercache.current_generation()
+        db_user = await crud_async.get_user(db, user_id=token_data.user_id)  # Получаем пользователя по ID
+        if db_user is None:
+            raise credentials_exception
+        user = usercache.store_user(db_user, generation)
+    if not user.accepts(token_data):
         raise credentials_exception
-    return user
+    return user.to_model()
 
 
 async def get_current_active_user(  # Пример зависимости для активного пользователя (если бы у нас было поле is_active)
@@ -0,0 +1,87 @@
+# app/export.py
+"""
+Потоковая выгрузка логов в NDJSON или CSV (GET /api/v1/logs/export).
+
+Выборка выполняется одним запросом через серверный курсор (yield_per): строки приходят
+из БД пачками по LOG_EXPORT_CHUNK_SIZE и сразу уходят клиенту, поэтому память воркера
+не зависит от объема выгрузки, а COUNT(*) и OFFSET, как при постраничном обходе, не нужны.
+Выбираются столбцы таблицы (Core), а не ORM-объекты: identity map и отслеживание изменений
+для выгрузки не нужны. Вложенные log_level/event_type берутся из кеша справочников.
+"""
+import csv
+import io
+import json
+from typing import AsyncIterator, Dict, Iterable, List
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+import crud, models, refdata
+from config import settings
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+CSV_COLUMNS = [
+    "id", "atm_id", "event_timestamp", "log_level", "event_type", "message", "payload",
+    "is_alert", "acknowledged_by_user_id", "acknowledged_at", "recorded_at",
+]
+
+
+def export_statement(filters: Dict, sort_by_timestamp_desc: bool):
+    """SELECT столбцов atm_logs с фильтрами read_logs, отдаваемый серверным курсором."""
+    return (
+        select(*models.ATMLog.__table__.columns)
+        .where(*crud.atm_log_filter_criteria(**filters))
+        .order_by(*crud.atm_log_ordering(sort_by_timestamp_desc))
+        .execution_options(yield_per=settings.LOG_EXPORT_CHUNK_SIZE)
+    )
+
+
+def format_ndjson(rows: Iterable, reference: refdata.ReferenceData) -> str:
+    return "".join(refdata.log_to_schema(row, reference).model_dump_json() + "\n" for row in rows)
+
+
+def format_csv(rows: Iterable, reference: refdata.ReferenceData) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        log = refdata.log_to_schema(row, reference)
+        writer.writerow([
+            log.id, log.atm_id, log.event_timestamp.isoformat(), log.log_level.name,
+            log.event_type.name if log.event_type else "", log.message,
+            json.dumps(log.payload, ensure_ascii=False) if log.payload is not None else "",
+            log.is_alert, log.acknowledged_by_user_id or "",
+            log.acknowledged_at.isoformat() if log.acknowledged_at else "",
+            log.recorded_at.isoformat() if log.recorded_at else "",
+        ])
+    return buffer.getvalue()
+
+
+def csv_header() -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(CSV_COLUMNS)
+    return buffer.getvalue()
+
+
+async def stream_logs(
+        session_factory: async_sessionmaker,
+        export_format: str,
+        filters: Dict,
+        sort_by_timestamp_desc: bool
+) -> AsyncIterator[str]:
+    """
+    Генератор тела ответа. Сессия открывается здесь же, а не берется из зависимости запроса:
+    тело StreamingResponse отдается уже после выхода из обработчика эндпоинта.
+    """
+    formatter = format_csv if export_format == "csv" else format_ndjson
+    if export_format == "csv":
+        yield csv_header()
+    async with session_factory() as db:
+        result = await db.stream(export_statement(filters, sort_by_timestamp_desc))
+        async for partition in result.partitions():
+            rows: List = list(partition)
+            # Проверка полноты кеша на каждую пачку: справочник мог пополниться во время выгрузки
+            reference = await refdata.get_reference_data_async(db, rows)
+            yield formatter(rows, reference)
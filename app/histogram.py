@@ -0,0 +1,159 @@
+# app/histogram.py
+"""
+Число логов по интервалам времени (GET /api/v1/logs/histogram) с разбивкой по уровню, типу события или банкомату.
+
+Подсчет идет в БД (date_trunc + GROUP BY, см. rollups.TimeBucket), клиенту уходят только счетчики.
+Для интервалов 1h и 1d закрытые часы берутся из почасовых сводок atm_log_rollups (rollups.py),
+а по atm_logs считаются только неполные часы на краях диапазона и текущий, еще открытый час.
+Если фильтр по сводкам не выразить (message, q, payload_contains, is_acknowledged) или интервал 1m,
+все считается по atm_logs. Границы интервалов - в UTC.
+"""
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import func, literal_column, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import crud, models, refdata, rollups, schemas
+
+BUCKETS = {"1m": "minute", "1h": "hour", "1d": "day"}
+BUCKET_SIZES = {"1m": timedelta(minutes=1), "1h": timedelta(hours=1), "1d": timedelta(days=1)}
+GROUP_BY = ("level", "event_type", "atm")
+HOUR = timedelta(hours=1)
+
+# Фильтры atm_log_filter_criteria, которых нет в сводках
+_RAW_ONLY_FILTERS = ("message_keyword", "is_acknowledged", "search_terms", "payload_contains")
+
+_log_group_columns = {
+    "level": models.ATMLog.log_level_id,
+    "event_type": models.ATMLog.event_type_id,
+    "atm": models.ATMLog.atm_id,
+}
+_rollup = models.ATMLogRollup
+_rollup_group_columns = {
+    "level": _rollup.log_level_id,
+    # Литерал, а не параметр: иначе выражения в SELECT и GROUP BY получат разные $n в asyncpg
+    "event_type": func.nullif(_rollup.event_type_id, literal_column(str(rollups.NO_EVENT_TYPE))),
+    "atm": _rollup.atm_id,
+}
+
+
+@dataclass(frozen=True)
+class HistogramPlan:
+    """Какие часы считать по сводкам: [rollup_from, rollup_to); None - все по atm_logs."""
+    rollup_from: Optional[datetime] = None
+    rollup_to: Optional[datetime] = None
+
+    @property
+    def source(self) -> str:
+        return "raw" if self.rollup_to is None else "rollup"
+
+
+def _ceil_hour(moment: datetime) -> datetime:
+    start = rollups.bucket_start(moment)
+    return start if start == rollups.as_utc(moment) else start + HOUR
+
+
+def plan(bucket: str, filters: Dict, now: datetime) -> HistogramPlan:
+    if bucket == "1m" or any(filters.get(name) for name in _RAW_ONLY_FILTERS):
+        return HistogramPlan()
+    if filters.get("event_type_id") == rollups.NO_EVENT_TYPE:
+        return HistogramPlan()
+    rollup_from = _ceil_hour(filters["start_time"]) if filters.get("start_time") else None
+    # Открытый час и неполный час в конце (end_time включительно) считаются по atm_logs
+    end = min(rollups.as_utc(filters["end_time"]), now) if filters.get("end_time") else now
+    rollup_to = rollups.bucket_start(end)
+    if rollup_from is not None and rollup_from >= rollup_to:
+        return HistogramPlan()
+    return HistogramPlan(rollup_from, rollup_to)
+
+
+def bucket_count(bucket: str, filters: Dict, now: datetime) -> Optional[int]:
+    """Сколько интервалов покрывает диапазон (None, если start_time не задан)."""
+    if not filters.get("start_time"):
+        return None
+    end = rollups.as_utc(filters["end_time"]) if filters.get("end_time") else now
+    return max(int((end - rollups.as_utc(filters["start_time"])) / BUCKET_SIZES[bucket]) + 1, 0)
+
+
+def raw_statement(bucket: str, group_by: Optional[str], filters: Dict, histogram_plan: HistogramPlan):
+    time_bucket = rollups.TimeBucket(models.ATMLog.event_timestamp, BUCKETS[bucket])
+    columns = [time_bucket] + ([_log_group_columns[group_by]] if group_by else [])
+    criteria = crud.atm_log_filter_criteria(**filters)
+    if histogram_plan.rollup_to is not None:
+        # Только то, чего нет в сводках: до rollup_from и начиная с rollup_to (сравнения со столбцом - для отсечения секций)
+        outside = models.ATMLog.event_timestamp >= histogram_plan.rollup_to
+        if histogram_plan.rollup_from is not None:
+            outside = or_(models.ATMLog.event_timestamp < histogram_plan.rollup_from, outside)
+        criteria.append(outside)
+    return select(*columns, func.count()).where(*criteria).group_by(*columns)
+
+
+def rollup_statement(bucket: str, group_by: Optional[str], filters: Dict, histogram_plan: HistogramPlan):
+    time_bucket = rollups.TimeBucket(_rollup.bucket_start, BUCKETS[bucket])
+    columns = [time_bucket] + ([_rollup_group_columns[group_by]] if group_by else [])
+    criteria = [_rollup.bucket_start < histogram_plan.rollup_to]
+    if histogram_plan.rollup_from is not None:
+        criteria.append(_rollup.bucket_start >= histogram_plan.rollup_from)
+    if filters.get("atm_id") is not None:
+        criteria.append(_rollup.atm_id == filters["atm_id"])
+    if filters.get("log_level_id") is not None:
+        criteria.append(_rollup.log_level_id == filters["log_level_id"])
+    if filters.get("event_type_id") is not None:
+        criteria.append(_rollup.event_type_id == filters["event_type_id"])
+
+    is_alert = filters.get("is_alert")
+    if is_alert is None:
+        count = func.sum(_rollup.log_count)
+    elif is_alert:
+        count = func.sum(_rollup.alert_count)
+    else:
+        count = func.sum(_rollup.log_count - _rollup.alert_count)
+    return select(*columns, count).where(*criteria).group_by(*columns)
+
+
+def _group_name(group_by: Optional[str], group_id: Optional[int], reference: refdata.ReferenceData) -> Optional[str]:
+    if group_by == "level":
+        level = reference.log_levels.get(group_id)
+        return level.name if level else None
+    if group_by == "event_type" and group_id is not None:
+        event_type = reference.event_types.get(group_id)
+        return event_type.name if event_type else None
+    return None
+
+
+async def get_histogram(
+        db: AsyncSession,
+        bucket: str,
+        group_by: Optional[str],
+        filters: Dict,
+        now: Optional[datetime] = None
+) -> schemas.LogHistogram:
+    histogram_plan = plan(bucket, filters, now or datetime.now(timezone.utc))
+    statements = [raw_statement(bucket, group_by, filters, histogram_plan)]
+    if histogram_plan.rollup_to is not None:
+        statements.append(rollup_statement(bucket, group_by, filters, histogram_plan))
+
+    totals: Dict[Tuple[datetime, Optional[int]], int] = defaultdict(int)
+    for stmt in statements:
+        for row in await db.execute(stmt):
+            group_id = row[1] if group_by else None
+            totals[(rollups.as_utc(row[0]), group_id)] += int(row[-1] or 0)
+
+    reference = await refdata.get_reference_data_async(db)
+    keys = sorted((key for key, count in totals.items() if count),
+                  key=lambda key: (key[0], key[1] is None, key[1] or 0))
+    return schemas.LogHistogram(
+        bucket=bucket,
+        group_by=group_by,
+        source=histogram_plan.source,
+        buckets=[
+            schemas.LogHistogramBucket(
+                bucket_start=bucket_start, group_id=group_id,
+                group_name=_group_name(group_by, group_id, reference), count=totals[(bucket_start, group_id)]
+            )
+            for bucket_start, group_id in keys
+        ]
+    )
@@ -0,0 +1,190 @@
+# app/ingest_queue.py
+"""
+Очередь приема одиночных логов с групповой записью (LOG_INGEST_MODE=queued).
+
+POST /api/v1/atms/{atm_id}/logs/ проверяет запись по кешу справочников, кладет ее в ограниченную
+очередь в памяти процесса и отвечает 202. Фоновый писатель забирает из очереди до LOG_INGEST_FLUSH_ROWS
+записей (или сколько набралось за LOG_INGEST_FLUSH_INTERVAL_MS) и пишет их через
+crud_async.create_atm_logs_bulk: один INSERT и один commit на пачку вместо commit на каждый запрос.
+
+Надежность (LOG_INGEST_DURABILITY):
+  flush   - запрос ждет записи своей пачки и получает id лога или ошибку (например, банкомат не найден);
+  enqueue - ответ сразу после постановки в очередь; отказы писателя только считаются в статистике,
+            а записи, не успевшие попасть в БД, теряются при падении процесса.
+Переполненная очередь - 503 с Retry-After, отправитель повторит позже. Сбой записи в БД
+(ошибка сервера, а не записи) ожидающие запросы получают как IngestWriteFailed - тоже 503 с Retry-After;
+подробности ошибки пишутся только в лог сервера.
+
+Писатель запускается в пустом контексте (contextvars): иначе он унаследовал бы контекст первого
+запроса приема и все дальнейшие пачки попадали бы в его SQL-профиль и статистику запросов к БД.
+"""
+import asyncio
+import contextvars
+import logging
+import time
+from typing import List, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+import crud_async, metrics, schemas
+from config import settings
+
+logger = logging.getLogger("app.ingest_queue")
+
+_STOP = object()
+
+
+class IngestQueueFull(Exception):
+    """В очереди нет места."""
+
+
+class IngestWriteFailed(Exception):
+    """Пачку не удалось записать в БД; запись можно повторить."""
+
+
+DB_ERROR_PREFIX = "Database error"  # Так crud_async.create_atm_logs_bulk помечает отказы БД
+
+
+class IngestQueue:
+    def __init__(self, maxsize: int, flush_rows: int, flush_interval_ms: int):
+        self.maxsize = maxsize
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._writer: Optional[asyncio.Task] = None
+        self._session_factory: Optional[async_sessionmaker] = None
+        self.enqueued = 0
+        self.written = 0
+        self.rejected = 0
+        self.flushes = 0
+        self.last_flush_rows = 0
+        self.last_flush_seconds = 0.0
+
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def ensure_started(self, session_factory: async_sessionmaker) -> None:
+        """Запускает писателя в текущем цикле событий при первом обращении."""
+        self._session_factory = session_factory
+        loop = asyncio.get_running_loop()
+        if self._writer is not None and not self._writer.done() and self._loop is loop:
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._writer = contextvars.Context().run(loop.create_task, self._run())
+
+    def submit(self, item: schemas.ATMLogBatchItem, wait_for_flush: bool) -> Optional[asyncio.Future]:
+        """
+        Ставит запись в очередь. При wait_for_flush возвращает future с (id, error) после записи пачки.
+        Бросает IngestQueueFull, если очередь заполнена.
+        """
+        future = self._loop.create_future() if wait_for_flush else None
+        try:
+            self._queue.put_nowait((item, future))
+        except asyncio.QueueFull:
+            raise IngestQueueFull()
+        self.enqueued += 1
+        return future
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Дописывает очередь и останавливает писателя (при остановке приложения)."""
+        if self._writer is None or self._writer.done():
+            return
+        await self._queue.put(_STOP)
+        try:
+            await asyncio.wait_for(asyncio.shield(self._writer), timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Ingest queue: {self.depth()} records not written before shutdown.")
+            self._writer.cancel()
+
+    async def _next_batch(self) -> Tuple[List, bool]:
+        """Ждет первую запись, затем добирает пачку до flush_rows или до истечения flush_interval."""
+        entry = await self._queue.get()
+        if entry is _STOP:
+            return [], True
+        batch = [entry]
+        deadline = self._loop.time() + self.flush_interval
+        while len(batch) < self.flush_rows:
+            try:
+                entry = self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                remaining = deadline - self._loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    entry = await asyncio.wait_for(self._queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            if entry is _STOP:
+                return batch, True
+            batch.append(entry)
+        return batch, False
+
+    async def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch, stopping = await self._next_batch()
+            if batch:
+                await self._flush(batch)
+
+    async def _flush(self, batch: List) -> None:
+        started = time.perf_counter()
+        try:
+            async with self._session_factory() as db:
+                results = await crud_async.create_atm_logs_bulk(db, [item for item, _ in batch])
+        except Exception as e:
+            logger.error(f"Ingest queue: writing {len(batch)} records failed: {e}", exc_info=True)
+            results = [(None, f"{DB_ERROR_PREFIX}: {e}")] * len(batch)
+
+        for (item, future), (log_id, error) in zip(batch, results):
+            if error is None:
+                self.written += 1
+            else:
+                self.rejected += 1
+                if future is None or error.startswith(DB_ERROR_PREFIX):
+                    logger.warning(f"Ingest queue: log for ATM {item.atm_id} rejected: {error}")
+            if future is None or future.done():
+                continue
+            if error is not None and error.startswith(DB_ERROR_PREFIX):
+                future.set_exception(IngestWriteFailed())  # Текст ошибки БД клиенту не отдаем
+            else:
+                future.set_result((log_id, error))
+        self.flushes += 1
+        self.last_flush_rows = len(batch)
+        self.last_flush_seconds = time.perf_counter() - started
+
+    def stats(self) -> schemas.IngestQueueStats:
+        return schemas.IngestQueueStats(
+            mode=settings.LOG_INGEST_MODE,
+            durability=settings.LOG_INGEST_DURABILITY,
+            running=self._writer is not None and not self._writer.done(),
+            depth=self.depth(),
+            capacity=self.maxsize,
+            enqueued=self.enqueued,
+            written=self.written,
+            rejected=self.rejected,
+            flushes=self.flushes,
+            last_flush_rows=self.last_flush_rows,
+            last_flush_ms=round(self.last_flush_seconds * 1000, 3),
+        )
+
+
+queue = IngestQueue(
+    maxsize=settings.LOG_INGEST_QUEUE_SIZE,
+    flush_rows=settings.LOG_INGEST_FLUSH_ROWS,
+    flush_interval_ms=settings.LOG_INGEST_FLUSH_INTERVAL_MS,
+)
+
+
+def queue_metrics():
+    """Состояние очереди приема на момент опроса /metrics (queue берется из модуля: тесты его подменяют)."""
+    current = queue
+    depth = metrics.Gauge("ingest_queue_depth", "Records waiting in the ingest queue.")
+    depth.set(current.depth())
+    flushes = metrics.Counter("ingest_queue_flushes_total", "Batches written by the ingest queue writer.")
+    flushes.inc(current.flushes)
+    return depth, flushes
+
+
+metrics.register_collector("ingest_queue", queue_metrics)
@@ -1,21 +1,28 @@
 # app/main.py
+import asyncio
 import logging
 import sys
 import os # Для работы с путями, если будешь раздавать статику
 from pathlib import Path
 
-from fastapi_cache import FastAPICache
-from fastapi_cache.backends.inmemory import InMemoryBackend
 from fastapi import FastAPI, Request, status
 from fastapi.responses import JSONResponse, FileResponse # FileResponse для SPA
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles # Если будешь раздавать статику
 from fastapi.encoders import jsonable_encoder
+from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
 
 from config import settings
-from database import engine, Base # Убедись, что Base импортируется для create_all
-from routers import auth, users, atms, logs
+from database import engine, async_engine, Base, SessionLocal # Убедись, что Base импортируется для create_all
+import refdata
+import caching
+import migrate
+import partitions
+import ingest_queue
+import metrics
+import profiling
+from routers import auth, users, atms, logs, admin
 
 # 1. Базовая конфигурация логирования должна быть одной из первых вещей
 logging.basicConfig(
@@ -51,18 +58,65 @@ async def startup_event():
         # В зависимости от критичности, можно здесь завершить приложение
         # sys.exit(1)
 
+    # Индексы и прочие изменения схемы существующей БД (create_all их не добавляет)
+    if settings.RUN_MIGRATIONS_ON_STARTUP:
+        try:
+            applied = migrate.apply_migrations(engine, include_manual=settings.RUN_MANUAL_MIGRATIONS_ON_STARTUP)
+            logger.info(f"STARTUP EVENT: Migrations applied: {applied or 'none'}.")
+        except Exception as e:
+            logger.error(f"STARTUP EVENT: Error applying migrations: {e}", exc_info=True)
+
+    # Секции atm_logs: создание будущих и удаление устаревших - периодически в фоне
+    if engine.dialect.name == "postgresql":
+        app.state.partition_maintenance = asyncio.create_task(partitions.maintenance_loop(engine))
+
+    # Загрузка кеша справочников (при ошибке он подгрузится лениво при первом запросе)
+    try:
+        db = SessionLocal()
+        try:
+            reference = refdata.load_reference_data(db)
+        finally:
+            db.close()
+        logger.info(f"STARTUP EVENT: Reference data loaded (version {reference.version}).")
+    except Exception as e:
+        logger.error(f"STARTUP EVENT: Error loading reference data: {e}", exc_info=True)
+
     # Инициализация кеша
     logger.info("STARTUP EVENT: Attempting to initialize FastAPI Cache...")
     try:
-        FastAPICache.init(InMemoryBackend(), prefix="fastapi-cache")
-        logger.info("STARTUP EVENT: FastAPI Cache (InMemoryBackend) initialized SUCCESSFULLY.")
+        backend = await caching.init_cache()
+        logger.info(f"STARTUP EVENT: FastAPI Cache ({type(backend).__name__}) initialized SUCCESSFULLY.")
     except Exception as e:
         logger.error(f"STARTUP EVENT: FAILED to initialize FastAPI Cache: {e}", exc_info=True)
-        # Можно добавить sys.exit(1) если кеш критичен
+        # Общий кеш недоступен - работаем с кешем в памяти процесса
+        try:
+            await caching.init_cache(url="")
+            logger.warning("STARTUP EVENT: Falling back to in-process cache.")
+        except Exception as e:
+            logger.error(f"STARTUP EVENT: FAILED to initialize in-process cache: {e}", exc_info=True)
 
     logger.info("STARTUP EVENT: Application startup finished.")
 # --- Конец обработчика события startup ---
 
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    maintenance_task = getattr(app.state, "partition_maintenance", None)
+    if maintenance_task is not None:
+        maintenance_task.cancel()
+    # Дописываем логи, оставшиеся в очереди приема
+    try:
+        await ingest_queue.queue.stop()
+    except Exception as e:
+        logger.error(f"SHUTDOWN EVENT: Error flushing ingest queue: {e}", exc_info=True)
+    try:
+        await caching.close_cache()
+    except Exception as e:
+        logger.error(f"SHUTDOWN EVENT: Error closing cache: {e}", exc_info=True)
+    # Закрываем соединения пула асинхронного движка
+    await async_engine.dispose()
+    logger.info("SHUTDOWN EVENT: Async database engine disposed.")
+
 # 4. Настройка CORS Middleware (должна быть добавлена до роутеров и обработчиков исключений,
 # которые могут сами возвращать ответы, на которые должен влиять CORS)
 origins = [
@@ -81,6 +135,20 @@ app.add_middleware(
 )
 logger.info(f"CORS Middleware configured for origins: {origins}")
 
+# Профилирование SQL по заголовку X-SQL-Profile или для всех запросов (profiling.py)
+app.add_middleware(profiling.SQLProfileMiddleware)
+
+# Ответ на запись уходит после увеличения версий тегов кеша в Redis (caching.py)
+app.add_middleware(caching.CacheInvalidationMiddleware)
+
+# Метрики запросов (metrics.py): добавлено последним - внешний слой, учитывает и ответы CORS
+if settings.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+
+# IP клиента из X-Forwarded-For, если запрос пришел от доверенного прокси (FORWARDED_ALLOW_IPS);
+# самый внешний слой, чтобы request.client был настоящим для всех обработчиков (throttle.py)
+app.add_middleware(ProxyHeadersMiddleware, trusted_hosts=settings.FORWARDED_ALLOW_IPS)
+
 # 5. Кастомные обработчики исключений
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
@@ -110,6 +178,9 @@ app.include_router(auth.router, prefix=f"{API_PREFIX}/auth", tags=["Authenticati
 app.include_router(users.router, prefix=f"{API_PREFIX}/users", tags=["Users"])
 app.include_router(atms.router, prefix=f"{API_PREFIX}/atms", tags=["ATMs"])
 app.include_router(logs.router, prefix=f"{API_PREFIX}/logs", tags=["Logs"])
+app.include_router(admin.router, prefix=f"{API_PREFIX}/admin", tags=["Admin"])
+if settings.METRICS_ENABLED:
+    app.include_router(metrics.router, tags=["Metrics"])  # GET /metrics (до обработчика SPA)
 logger.info("API routers included.")
 
 
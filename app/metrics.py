@@ -0,0 +1,345 @@
+# app/metrics.py
+"""
+Метрики приложения в текстовом формате Prometheus (GET /metrics).
+
+Счетчики, измерители и гистограммы хранятся в памяти процесса: запись значения - словарь
+и блокировка, без внешних зависимостей. Значения, которые дешевле прочитать в момент
+опроса (состояние пула соединений, глубина очередей), отдают функции-сборщики (register_collector).
+Каждый воркер uvicorn отдает свои метрики; агрегирует Prometheus.
+
+Инструментация:
+  - MetricsMiddleware (ASGI): число, длительность и запросы в работе по шаблону маршрута
+    (/api/v1/atms/{atm_id}, а не конкретный путь), метод и код ответа;
+  - обработчики before/after_cursor_execute на всех движках SQLAlchemy: число запросов к БД
+    и время в БД - всего и в расчете на HTTP-запрос (через contextvar, в том числе из AsyncSession);
+  - count_logs_accepted / count_log_rejected: принятые и отклоненные логи по банкомату и уровню.
+На запрос это несколько perf_counter и обновлений словаря, поэтому метрики включены по умолчанию.
+"""
+import bisect
+import contextvars
+import math
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional, Sequence, Tuple
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from config import settings
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Границы интервалов по умолчанию, секунды: от миллисекунды до десятков секунд
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Sample = Tuple[str, Dict[str, str], float]  # (имя ряда, метки, значение)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+class Metric:
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"Metric {self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: Tuple[str, ...]) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    def samples(self) -> Iterable[Sample]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> Iterable[Sample]:
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield self.name, self._labels(key), value
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # По ключу меток: [счетчики по интервалам (без накопления) + интервал +Inf, сумма, количество]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, **labels) -> int:
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def samples(self) -> Iterable[Sample]:
+        with self._lock:
+            values = [(key, list(state[0]), state[1], state[2]) for key, state in self._values.items()]
+        for key, counts, total, count in values:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", dict(labels, le=_format_value(bound)), cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: Dict[str, Callable[[], Iterable[Metric]]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                # Повторный импорт модуля (например, в тестах) получает уже зарегистрированную метрику
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"Metric {metric.name} is already registered with a different type or labels.")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def register_collector(self, name: str, collector: Callable[[], Iterable[Metric]]) -> None:
+        """
+        collector вызывается при каждом опросе и возвращает метрики с текущими значениями.
+        Повторная регистрация под тем же именем заменяет сборщик (модуль импортирован дважды).
+        """
+        with self._lock:
+            self._collectors[name] = collector
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors.values())
+        for collector in collectors:
+            metrics.extend(collector())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {_escape(metric.documentation)}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (),
+              buckets: Optional[Sequence[float]] = None) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets or DEFAULT_BUCKETS))
+
+
+def register_collector(name: str, collector: Callable[[], Iterable[Metric]]) -> None:
+    REGISTRY.register_collector(name, collector)
+
+
+# --- HTTP-запросы ---
+HTTP_REQUESTS = counter("http_requests_total", "HTTP requests by route template, method and status.",
+                        ["method", "route", "status"])
+HTTP_DURATION = histogram("http_request_duration_seconds", "HTTP request duration (streaming: until the body is sent).",
+                          ["method", "route"])
+HTTP_IN_FLIGHT = gauge("http_requests_in_flight", "HTTP requests being processed.", ["method"])
+HTTP_DB_QUERIES = histogram("http_request_db_queries", "Database queries per HTTP request.", ["method", "route"],
+                            buckets=(0, 1, 2, 3, 5, 10, 25, 50, 100))
+HTTP_DB_SECONDS = histogram("http_request_db_seconds", "Time spent in database queries per HTTP request.",
+                            ["method", "route"])
+
+# --- Запросы к БД ---
+DB_QUERY_DURATION = histogram("db_query_duration_seconds", "Database query (cursor execute) duration.")
+
+# --- Прием логов ---
+LOGS_ACCEPTED = counter("atm_logs_accepted_total", "Logs stored, by ATM and log level.", ["atm_id", "log_level_id"])
+LOGS_REJECTED = counter("atm_logs_rejected_total", "Logs rejected at ingest, by ATM, log level and reason.",
+                        ["atm_id", "log_level_id", "reason"])
+
+UNMATCHED_ROUTE = "unmatched"  # 404 без маршрута: путь в метку не попадает, иначе ряды плодит любой сканер
+
+
+class RequestDBStats:
+    __slots__ = ("queries", "seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+
+_request_db_stats: contextvars.ContextVar[Optional[RequestDBStats]] = contextvars.ContextVar(
+    "request_db_stats", default=None
+)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("metrics_query_start")
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    DB_QUERY_DURATION.observe(elapsed)
+    stats = _request_db_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.seconds += elapsed
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(exception_context):
+    # Запрос с ошибкой не доходит до after_cursor_execute: снимаем его отметку
+    connection = exception_context.connection
+    if connection is not None:
+        starts = connection.info.get("metrics_query_start")
+        if starts:
+            starts.pop()
+
+
+class MetricsMiddleware:
+    """ASGI middleware: длительность, число и код ответа HTTP-запросов, запросы к БД на HTTP-запрос."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        response_status = 500  # Если приложение упало до ответа
+        stats = RequestDBStats()
+        token = _request_db_stats.set(stats)
+
+        async def send_with_status(message):
+            nonlocal response_status
+            if message["type"] == "http.response.start":
+                response_status = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc(method=method)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            HTTP_IN_FLIGHT.dec(method=method)
+            _request_db_stats.reset(token)
+            # Маршрут FastAPI кладет в scope при сопоставлении пути
+            route = getattr(scope.get("route"), "path_format", None) or UNMATCHED_ROUTE
+            HTTP_REQUESTS.inc(method=method, route=route, status=response_status)
+            HTTP_DURATION.observe(elapsed, method=method, route=route)
+            HTTP_DB_QUERIES.observe(stats.queries, method=method, route=route)
+            HTTP_DB_SECONDS.observe(stats.seconds, method=method, route=route)
+
+
+def _atm_label(atm_id) -> str:
+    # METRICS_ATM_LABELS=false: без ряда на каждый банкомат, когда их десятки тысяч
+    return str(atm_id) if settings.METRICS_ATM_LABELS else "all"
+
+
+def count_logs_accepted(logs: Iterable) -> None:
+    """logs - объекты с atm_id и log_level_id (ATMLog или записи пачки)."""
+    tally: Dict[Tuple[str, str], int] = {}
+    for log in logs:
+        key = (_atm_label(log.atm_id), str(log.log_level_id))
+        tally[key] = tally.get(key, 0) + 1
+    for (atm_id, log_level_id), amount in tally.items():
+        LOGS_ACCEPTED.inc(amount, atm_id=atm_id, log_level_id=log_level_id)
+
+
+def count_log_rejected(atm_id, log_level_id, reason: str) -> None:
+    """
+    reason: atm_not_found | unknown_log_level | unknown_event_type | invalid | queue_full | db_error.
+    atm_id и log_level_id передаются только уже проверенные (существующие), иначе None - метка "unknown":
+    значения клиента в метках позволили бы плодить ряды без ограничений.
+    """
+    LOGS_REJECTED.inc(
+        atm_id=_atm_label(atm_id) if atm_id is not None else "unknown",
+        log_level_id=str(log_level_id) if log_level_id is not None else "unknown",
+        reason=reason,
+    )
+
+
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False)
+def read_metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
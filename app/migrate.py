@@ -0,0 +1,180 @@
+# app/migrate.py
+"""
+Управляемые SQL-миграции для PostgreSQL.
+
+Base.metadata.create_all() создает только недостающие таблицы и не трогает существующие,
+поэтому индексы, секционирование и прочие изменения схемы рабочей БД описаны
+SQL-файлами app/migrations/NNNN_<name>.sql. Они применяются по порядку номера,
+примененные версии записываются в таблицу schema_migrations.
+
+Файл, первая строка которого "-- migrate: no-transaction", выполняется вне транзакции
+по одному оператору (операторы разделяются ";" в конце строки) - это нужно для
+CREATE INDEX CONCURRENTLY, который не блокирует запись в atm_logs на время построения.
+На секционированной таблице PostgreSQL не поддерживает CONCURRENTLY, поэтому для нее такой
+оператор выполняется обычным CREATE INDEX (индексы секционированной atm_logs создает сама 0002,
+и IF NOT EXISTS делает его пустым).
+
+Файл с маркером "-- migrate: manual" среди первых строк-комментариев (тяжелые миграции вроде
+0002, копирующей всю atm_logs) при старте приложения не применяется, если не включен
+RUN_MANUAL_MIGRATIONS_ON_STARTUP: он пропускается до окна обслуживания, а следующие миграции
+применяются. Поэтому они не должны зависеть от ручных (0003-0008 работают и с несекционированной
+atm_logs), а ручная миграция, примененная позже, - учитывать уже примененные следующие.
+
+Запуск вручную: python migrate.py (из папки app, применяет и ручные миграции);
+при старте приложения - если RUN_MIGRATIONS_ON_STARTUP.
+"""
+import logging
+import re
+from pathlib import Path
+from typing import List, Optional, Set, Tuple
+
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger("app.migrate")
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent / "migrations"
+NO_TRANSACTION_MARKER = "-- migrate: no-transaction"
+MANUAL_MARKER = "-- migrate: manual"
+MIGRATION_FILE_RE = re.compile(r"^(\d{4})_[\w-]+\.sql$")
+CONCURRENT_INDEX_RE = re.compile(
+    r"^CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+(?:IF\s+NOT\s+EXISTS\s+)?\S+\s+ON\s+(?:ONLY\s+)?([\w.]+)",
+    re.IGNORECASE,
+)
+# Ключ pg_advisory_lock: несколько воркеров, стартующих одновременно, применяют миграции по очереди
+ADVISORY_LOCK_KEY = 7_310_006
+
+
+def discover_migrations() -> List[Tuple[str, Path]]:
+    """Список (версия, путь) всех файлов миграций по возрастанию версии."""
+    migrations = []
+    for path in MIGRATIONS_DIR.glob("*.sql"):
+        match = MIGRATION_FILE_RE.match(path.name)
+        if match:
+            migrations.append((path.stem, path))
+    return sorted(migrations)
+
+
+def _markers(sql: str) -> Set[str]:
+    """Маркеры "-- migrate: ..." из первых строк-комментариев файла."""
+    markers = set()
+    for line in sql.lstrip().splitlines():
+        line = line.strip()
+        if not line.startswith("--"):
+            break
+        if line.startswith("-- migrate:"):
+            markers.add(line)
+    return markers
+
+
+def is_manual(path: Path) -> bool:
+    return MANUAL_MARKER in _markers(path.read_text(encoding="utf-8"))
+
+
+def _execute_raw(connection, sql: str) -> None:
+    # Через курсор DBAPI без параметров, чтобы "%" в SQL не принимался за плейсхолдер
+    cursor = connection.connection.cursor()
+    try:
+        cursor.execute(sql)
+    finally:
+        cursor.close()
+
+
+def _split_statements(sql: str) -> List[str]:
+    """Операторы файла без строк-комментариев (для выполнения по одному вне транзакции)."""
+    code = "\n".join(line for line in sql.splitlines() if not line.strip().startswith("--"))
+    statements = re.split(r";\s*$", code, flags=re.MULTILINE)
+    return [statement.strip() for statement in statements if statement.strip()]
+
+
+def concurrent_index_table(statement: str) -> Optional[str]:
+    """Таблица оператора CREATE INDEX CONCURRENTLY (None - другой оператор)."""
+    match = CONCURRENT_INDEX_RE.match(statement)
+    return match.group(1) if match else None
+
+
+def _is_partitioned(connection, table: str) -> bool:
+    relkind = connection.exec_driver_sql(
+        "SELECT relkind FROM pg_class WHERE oid = to_regclass(%(table)s)", {"table": table}
+    ).scalar()
+    return relkind == "p"
+
+
+def applied_versions(engine: Engine) -> Set[str]:
+    with engine.begin() as connection:
+        _execute_raw(connection, """
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version VARCHAR(255) PRIMARY KEY,
+                applied_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+            )
+        """)
+        rows = connection.exec_driver_sql("SELECT version FROM schema_migrations").all()
+    return {row[0] for row in rows}
+
+
+def apply_migration(engine: Engine, version: str, path: Path) -> None:
+    sql = path.read_text(encoding="utf-8")
+    if NO_TRANSACTION_MARKER in _markers(sql):
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            for statement in _split_statements(sql):
+                table = concurrent_index_table(statement)
+                if table and _is_partitioned(connection, table):
+                    statement = re.sub(r"\bCONCURRENTLY\s+", "", statement, count=1, flags=re.IGNORECASE)
+                _execute_raw(connection, statement)
+        with engine.begin() as connection:
+            connection.exec_driver_sql(
+                "INSERT INTO schema_migrations (version) VALUES (%(version)s)", {"version": version}
+            )
+    else:
+        with engine.begin() as connection:
+            _execute_raw(connection, sql)
+            connection.exec_driver_sql(
+                "INSERT INTO schema_migrations (version) VALUES (%(version)s)", {"version": version}
+            )
+
+
+def pending_migrations(done: Set[str], include_manual: bool = True) -> List[Tuple[str, Path]]:
+    """
+    Не примененные миграции по порядку. Без include_manual ручные миграции пропускаются,
+    следующие за ними остаются в списке.
+    """
+    pending = []
+    for version, path in discover_migrations():
+        if version in done:
+            continue
+        if not include_manual and is_manual(path):
+            logger.warning(
+                f"Migration {version} must be applied manually in a maintenance window (python migrate.py); "
+                f"skipped until then."
+            )
+            continue
+        pending.append((version, path))
+    return pending
+
+
+def apply_migrations(engine: Engine, include_manual: bool = True) -> List[str]:
+    """
+    Применяет все еще не примененные миграции. Возвращает список примененных версий.
+    include_manual=False - пропустить ручные миграции (при старте приложения).
+    """
+    if engine.dialect.name != "postgresql":
+        logger.info(f"Migrations skipped: dialect '{engine.dialect.name}' is not PostgreSQL.")
+        return []
+    applied = []
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as lock_connection:
+        lock_connection.exec_driver_sql(f"SELECT pg_advisory_lock({ADVISORY_LOCK_KEY})")
+        try:
+            for version, path in pending_migrations(applied_versions(engine), include_manual):
+                logger.info(f"Applying migration {version}...")
+                apply_migration(engine, version, path)
+                applied.append(version)
+        finally:
+            lock_connection.exec_driver_sql(f"SELECT pg_advisory_unlock({ADVISORY_LOCK_KEY})")
+    return applied
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(name)s - %(message)s")
+    from database import engine
+
+    applied_now = apply_migrations(engine)
+    print(f"Applied migrations: {', '.join(applied_now) if applied_now else 'none (schema is up to date)'}")
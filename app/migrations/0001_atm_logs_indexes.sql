@@ -0,0 +1,27 @@
+-- migrate: no-transaction
+-- Составные индексы atm_logs под фильтры и сортировку GET /logs/ и /atms/{id}/logs/.
+-- Строятся CONCURRENTLY, чтобы не блокировать прием логов; IF NOT EXISTS - миграцию можно
+-- повторить после сбоя (недостроенный индекс остается INVALID, его нужно удалить вручную).
+
+-- Лента событий одного банкомата: WHERE atm_id = ? ORDER BY event_timestamp DESC, id DESC
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_atm_logs_atm_id_event_timestamp
+    ON public.atm_logs USING btree (atm_id, event_timestamp DESC, id DESC);
+
+-- Общая лента без фильтров, диапазон по времени и курсорная пагинация по (event_timestamp, id)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_atm_logs_event_timestamp_id
+    ON public.atm_logs USING btree (event_timestamp DESC, id DESC);
+
+-- Фильтр по уровню (например, только ERROR/CRITICAL за период)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_atm_logs_log_level_id_event_timestamp
+    ON public.atm_logs USING btree (log_level_id, event_timestamp);
+
+-- Фильтр по типу события
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_atm_logs_event_type_id_event_timestamp
+    ON public.atm_logs USING btree (event_type_id, event_timestamp);
+
+-- Неподтвержденные тревоги: маленький частичный индекс, который не растет вместе с таблицей
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_atm_logs_unacknowledged_alerts
+    ON public.atm_logs USING btree (event_timestamp DESC, id DESC)
+    WHERE is_alert AND acknowledged_by_user_id IS NULL;
+
+ANALYZE public.atm_logs;
@@ -0,0 +1,116 @@
+-- migrate: manual
+-- Перевод atm_logs в таблицу, секционированную по диапазонам event_timestamp.
+-- Старые данные раскладываются по месячным секциям, дальше секции создает и удаляет
+-- partitions.py (ATM_LOGS_PARTITION_INTERVAL, ATM_LOGS_RETENTION_DAYS).
+-- Первичный ключ секционированной таблицы обязан включать ключ секционирования: (id, event_timestamp);
+-- уникальность id по-прежнему обеспечивает последовательность atm_logs_id_seq.
+-- Миграция копирует всю таблицу, поэтому при старте приложения не применяется (маркер manual):
+-- ее запускают в окно обслуживания (python migrate.py) или включают RUN_MANUAL_MIGRATIONS_ON_STARTUP.
+-- Следующие миграции при старте применяются и без нее, поэтому она может выполниться после них:
+-- триггер set_log_alert_flag переносится, только если 0007 его еще не удалила, а поисковые
+-- индексы 0003 создаются здесь же (старая таблица удаляется вместе с ними).
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+DO $$
+DECLARE
+    first_month timestamp;
+    last_month timestamp;
+    month_start timestamp;
+BEGIN
+    IF (SELECT c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'public' AND c.relname = 'atm_logs') = 'p' THEN
+        RETURN;  -- Уже секционирована
+    END IF;
+
+    ALTER TABLE public.atm_logs RENAME TO atm_logs_legacy;
+    ALTER TABLE public.atm_logs_legacy RENAME CONSTRAINT atm_logs_pkey TO atm_logs_legacy_pkey;
+    ALTER SEQUENCE public.atm_logs_id_seq OWNED BY NONE;
+    ALTER SEQUENCE public.atm_logs_id_seq AS bigint;
+
+    CREATE TABLE public.atm_logs (
+        id bigint NOT NULL DEFAULT nextval('public.atm_logs_id_seq'::regclass),
+        atm_id integer NOT NULL,
+        event_timestamp timestamp with time zone NOT NULL,
+        log_level_id integer NOT NULL,
+        event_type_id integer,
+        message text NOT NULL,
+        payload jsonb,
+        is_alert boolean DEFAULT false,
+        acknowledged_by_user_id integer,
+        acknowledged_at timestamp with time zone,
+        recorded_at timestamp with time zone DEFAULT now(),
+        CONSTRAINT atm_logs_pkey PRIMARY KEY (id, event_timestamp)
+    ) PARTITION BY RANGE (event_timestamp);
+    ALTER SEQUENCE public.atm_logs_id_seq OWNED BY public.atm_logs.id;
+
+    -- Сюда попадают события вне созданных секций (например, с неверными часами банкомата),
+    -- чтобы прием логов не падал. partitions.py переносит их при создании нужной секции.
+    CREATE TABLE public.atm_logs_default PARTITION OF public.atm_logs DEFAULT;
+
+    SELECT date_trunc('month', min(event_timestamp) AT TIME ZONE 'UTC'),
+           date_trunc('month', max(event_timestamp) AT TIME ZONE 'UTC')
+    INTO first_month, last_month
+    FROM public.atm_logs_legacy;
+
+    month_start := first_month;
+    WHILE month_start <= last_month LOOP
+        EXECUTE format(
+            'CREATE TABLE public.%I PARTITION OF public.atm_logs FOR VALUES FROM (%L) TO (%L)',
+            'atm_logs_p' || to_char(month_start, 'YYYY_MM'),
+            to_char(month_start, 'YYYY-MM-DD') || ' 00:00:00+00',
+            to_char(month_start + interval '1 month', 'YYYY-MM-DD') || ' 00:00:00+00'
+        );
+        month_start := month_start + interval '1 month';
+    END LOOP;
+
+    INSERT INTO public.atm_logs (
+        id, atm_id, event_timestamp, log_level_id, event_type_id, message, payload,
+        is_alert, acknowledged_by_user_id, acknowledged_at, recorded_at
+    )
+    SELECT id, atm_id, event_timestamp, log_level_id, event_type_id, message, payload::jsonb,
+           is_alert, acknowledged_by_user_id, acknowledged_at, recorded_at
+    FROM public.atm_logs_legacy;
+
+    DROP TABLE public.atm_logs_legacy;
+
+    -- Внешние ключи (как в lab4.sql)
+    ALTER TABLE public.atm_logs
+        ADD CONSTRAINT fk_atm FOREIGN KEY (atm_id) REFERENCES public.atms(id) ON DELETE CASCADE;
+    ALTER TABLE public.atm_logs
+        ADD CONSTRAINT fk_log_level FOREIGN KEY (log_level_id) REFERENCES public.log_levels(id);
+    ALTER TABLE public.atm_logs
+        ADD CONSTRAINT fk_event_type FOREIGN KEY (event_type_id) REFERENCES public.event_types(id);
+    ALTER TABLE public.atm_logs
+        ADD CONSTRAINT fk_acknowledged_by_user FOREIGN KEY (acknowledged_by_user_id)
+        REFERENCES public.users(id) ON DELETE SET NULL;
+
+    -- Индексы из 0001 (на секционированной таблице они создаются в каждой секции автоматически)
+    CREATE INDEX ix_atm_logs_atm_id_event_timestamp
+        ON public.atm_logs USING btree (atm_id, event_timestamp DESC, id DESC);
+    CREATE INDEX ix_atm_logs_event_timestamp_id
+        ON public.atm_logs USING btree (event_timestamp DESC, id DESC);
+    CREATE INDEX ix_atm_logs_log_level_id_event_timestamp
+        ON public.atm_logs USING btree (log_level_id, event_timestamp);
+    CREATE INDEX ix_atm_logs_event_type_id_event_timestamp
+        ON public.atm_logs USING btree (event_type_id, event_timestamp);
+    CREATE INDEX ix_atm_logs_unacknowledged_alerts
+        ON public.atm_logs USING btree (event_timestamp DESC, id DESC)
+        WHERE is_alert AND acknowledged_by_user_id IS NULL;
+
+    -- Индексы поиска из 0003
+    CREATE INDEX ix_atm_logs_message_tsv
+        ON public.atm_logs USING gin (to_tsvector('simple'::regconfig, message));
+    CREATE INDEX ix_atm_logs_message_trgm
+        ON public.atm_logs USING gin (message gin_trgm_ops);
+    CREATE INDEX ix_atm_logs_payload
+        ON public.atm_logs USING gin (payload jsonb_path_ops);
+
+    IF to_regprocedure('public.set_log_alert_flag()') IS NOT NULL THEN
+        CREATE TRIGGER trigger_set_log_alert BEFORE INSERT ON public.atm_logs
+            FOR EACH ROW EXECUTE FUNCTION public.set_log_alert_flag();
+    END IF;
+END
+$$;
+
+ANALYZE public.atm_logs;
@@ -0,0 +1,22 @@
+-- migrate: no-transaction
+-- Индексы для поиска по логам (search.py, параметры q и payload_contains в GET /api/v1/logs/).
+-- Применяется при старте и на несекционированной atm_logs (0002 - ручная миграция), поэтому
+-- индексы строятся CONCURRENTLY, не блокируя прием логов. Если atm_logs уже секционирована,
+-- migrate.py выполняет их обычным CREATE INDEX (0002 создает эти индексы сама, IF NOT EXISTS
+-- пропускает их). Недостроенный после сбоя индекс остается INVALID, его нужно удалить вручную.
+
+-- Полнотекстовый поиск: выражение совпадает с тем, что строит search.MessageMatch
+-- (конфигурация 'simple' литералом, иначе планировщик не применит индекс)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_atm_logs_message_tsv
+    ON public.atm_logs USING gin (to_tsvector('simple'::regconfig, message));
+
+-- Триграммы: ускоряют старый фильтр message (ILIKE '%kw%'), которым пользуется фронтенд
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_atm_logs_message_trgm
+    ON public.atm_logs USING gin (message gin_trgm_ops);
+
+-- Фильтр payload @> '{...}': jsonb_path_ops компактнее и быстрее для оператора @>
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_atm_logs_payload
+    ON public.atm_logs USING gin (payload jsonb_path_ops);
+
+ANALYZE public.atm_logs;
@@ -0,0 +1,3 @@
+-- Версия токенов пользователя: записывается в JWT (claim "ver") при логине.
+-- Смена роли увеличивает версию, и ранее выданные токены перестают приниматься (см. usercache.py).
+ALTER TABLE public.users ADD COLUMN IF NOT EXISTS token_version integer NOT NULL DEFAULT 0;
@@ -0,0 +1,73 @@
+-- Сводки по логам банкоматов (rollups.py): почасовые счетчики, счетчики по уровням и состояние банкомата.
+-- Приложение обновляет их при приеме логов и подтверждении алертов, GET /api/v1/atms/summary
+-- читает только их. Заполнение ниже пересчитывает сводки целиком, миграцию можно повторить;
+-- логи, принятые между миграцией и выкладкой нового кода, учитывает python rollups.py --rebuild.
+
+CREATE TABLE IF NOT EXISTS public.atm_log_rollups (
+    bucket_start timestamptz NOT NULL,
+    atm_id integer NOT NULL REFERENCES public.atms (id) ON DELETE CASCADE,
+    log_level_id integer NOT NULL REFERENCES public.log_levels (id),
+    event_type_id integer NOT NULL DEFAULT 0,
+    log_count bigint NOT NULL DEFAULT 0,
+    alert_count bigint NOT NULL DEFAULT 0,
+    PRIMARY KEY (bucket_start, atm_id, log_level_id, event_type_id)
+);
+CREATE INDEX IF NOT EXISTS ix_atm_log_rollups_atm_id_bucket_start
+    ON public.atm_log_rollups USING btree (atm_id, bucket_start);
+
+CREATE TABLE IF NOT EXISTS public.atm_level_counts (
+    atm_id integer NOT NULL REFERENCES public.atms (id) ON DELETE CASCADE,
+    log_level_id integer NOT NULL REFERENCES public.log_levels (id),
+    log_count bigint NOT NULL DEFAULT 0,
+    PRIMARY KEY (atm_id, log_level_id)
+);
+
+CREATE TABLE IF NOT EXISTS public.atm_health (
+    atm_id integer PRIMARY KEY REFERENCES public.atms (id) ON DELETE CASCADE,
+    unacknowledged_alerts integer NOT NULL DEFAULT 0,
+    last_event_at timestamptz,
+    last_error_at timestamptz,
+    last_error_log_id bigint,
+    last_error_message text
+);
+
+-- --- Заполнение по существующим логам ---
+DELETE FROM public.atm_log_rollups;
+INSERT INTO public.atm_log_rollups (bucket_start, atm_id, log_level_id, event_type_id, log_count, alert_count)
+SELECT date_trunc('hour', event_timestamp AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+       atm_id, log_level_id, COALESCE(event_type_id, 0),
+       count(*), count(*) FILTER (WHERE is_alert)
+FROM public.atm_logs
+GROUP BY 1, 2, 3, 4;
+
+DELETE FROM public.atm_level_counts;
+INSERT INTO public.atm_level_counts (atm_id, log_level_id, log_count)
+SELECT atm_id, log_level_id, count(*)
+FROM public.atm_logs
+GROUP BY atm_id, log_level_id;
+
+DELETE FROM public.atm_health;
+INSERT INTO public.atm_health (atm_id, unacknowledged_alerts, last_event_at)
+SELECT atm_id,
+       count(*) FILTER (WHERE is_alert AND acknowledged_by_user_id IS NULL),
+       max(event_timestamp)
+FROM public.atm_logs
+GROUP BY atm_id;
+
+-- Последняя ошибка (уровни ERROR и CRITICAL, как в триггере set_log_alert_flag)
+UPDATE public.atm_health h
+SET last_error_at = e.event_timestamp,
+    last_error_log_id = e.id,
+    last_error_message = e.message
+FROM (
+    SELECT DISTINCT ON (l.atm_id) l.atm_id, l.event_timestamp, l.id, l.message
+    FROM public.atm_logs l
+    JOIN public.log_levels ll ON ll.id = l.log_level_id
+    WHERE ll.name IN ('ERROR', 'CRITICAL')
+    ORDER BY l.atm_id, l.event_timestamp DESC, l.id DESC
+) e
+WHERE e.atm_id = h.atm_id;
+
+ANALYZE public.atm_log_rollups;
+ANALYZE public.atm_level_counts;
+ANALYZE public.atm_health;
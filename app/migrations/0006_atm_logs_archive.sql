@@ -0,0 +1,18 @@
+-- Архив логов удаленных банкоматов: DELETE /api/v1/atms/{id}?archive=true переносит логи сюда пачками
+-- перед удалением (atm_deletion.py). Внешних ключей нет - банкомата и его сводок к этому моменту уже нет.
+-- Логи без архива удаляются теми же пачками; ON DELETE CASCADE (fk_atm) добирает записанные во время удаления.
+CREATE TABLE IF NOT EXISTS public.atm_logs_archive (
+    id bigint PRIMARY KEY,
+    atm_id integer NOT NULL,
+    event_timestamp timestamptz NOT NULL,
+    log_level_id integer NOT NULL,
+    event_type_id integer,
+    message text NOT NULL,
+    payload jsonb,
+    is_alert boolean DEFAULT false,
+    acknowledged_by_user_id integer,
+    acknowledged_at timestamptz,
+    recorded_at timestamptz,
+    archived_at timestamptz DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS ix_atm_logs_archive_atm_id ON public.atm_logs_archive USING btree (atm_id);
@@ -0,0 +1,5 @@
+-- is_alert вычисляет приложение при приеме логов (alert_rules.py, правила ALERT_RULES) до INSERT.
+-- Триггер из lab4.sql делал SELECT из log_levels на каждую вставляемую строку и требовал
+-- перечитывать строку после вставки; удаление с родительской таблицы удаляет его и на секциях.
+DROP TRIGGER IF EXISTS trigger_set_log_alert ON public.atm_logs;
+DROP FUNCTION IF EXISTS public.set_log_alert_flag();
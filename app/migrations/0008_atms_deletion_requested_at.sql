@@ -0,0 +1,3 @@
+-- Отметка начала удаления банкомата (atm_deletion.py): прием логов отклоняет такие банкоматы,
+-- чтобы пачечное удаление сходилось и ни один лог не миновал atm_logs_archive.
+ALTER TABLE public.atms ADD COLUMN IF NOT EXISTS deletion_requested_at timestamptz;
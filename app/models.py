@@ -1,5 +1,5 @@
 # app/models.py
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Boolean, Text, JSON
+from sqlalchemy import Column, Integer, BigInteger, String, ForeignKey, DateTime, Boolean, Text, JSON, Index, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func  # Для DEFAULT NOW()
 
@@ -55,6 +55,8 @@ class User(Base):
     password_hash = Column(String(255), nullable=False)
     # Пока роль храним строкой, но можно было бы сделать ForeignKey на user_roles
     role = Column(String(20), nullable=False, default='operator')
+    # Версия JWT (claim "ver"): увеличивается при смене роли, старые токены перестают действовать (migrations/0004)
+    token_version = Column(Integer, nullable=False, default=0, server_default=text("0"))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
@@ -77,11 +79,15 @@ class ATM(Base):
 
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    # Выставляется в начале удаления (atm_deletion.py): с этого момента логи банкомата не принимаются
+    deletion_requested_at = Column(DateTime(timezone=True), nullable=True)
 
     # Связи с другими таблицами
     status = relationship("ATMStatus", back_populates="atms")
     added_by = relationship("User", back_populates="added_atms", foreign_keys=[added_by_user_id])
-    logs = relationship("ATMLog", back_populates="atm", cascade="all, delete-orphan")
+    # passive_deletes: логи удаляет сама БД (ON DELETE CASCADE) или atm_deletion.py пачками,
+    # ORM не загружает их в сессию перед удалением банкомата
+    logs = relationship("ATMLog", back_populates="atm", cascade="all, delete-orphan", passive_deletes=True)
 
 
 class ATMLog(Base):
@@ -89,7 +95,7 @@ class ATMLog(Base):
 
     id = Column(Integer, primary_key=True,
                 index=True)  # В DDL был BIGSERIAL, но для SQLAlchemy Integer часто мапится на BIGINT если это PK
-    atm_id = Column(Integer, ForeignKey("atms.id"), nullable=False)
+    atm_id = Column(Integer, ForeignKey("atms.id", ondelete="CASCADE"), nullable=False)
     event_timestamp = Column(DateTime(timezone=True), nullable=False)
 
     log_level_id = Column(Integer, ForeignKey("log_levels.id"), nullable=False)
@@ -103,8 +109,81 @@ class ATMLog(Base):
     acknowledged_at = Column(DateTime(timezone=True), nullable=True)
     recorded_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    # Индексы под фильтры списка логов; для существующей БД их создает migrations/0001_atm_logs_indexes.sql
+    # В PostgreSQL таблица секционирована по event_timestamp (migrations/0002_partition_atm_logs.sql),
+    # первичный ключ там (id, event_timestamp); id по-прежнему уникален благодаря последовательности
+    __table_args__ = (
+        Index("ix_atm_logs_atm_id_event_timestamp", atm_id, event_timestamp.desc(), id.desc()),
+        Index("ix_atm_logs_event_timestamp_id", event_timestamp.desc(), id.desc()),
+        Index("ix_atm_logs_log_level_id_event_timestamp", log_level_id, event_timestamp),
+        Index("ix_atm_logs_event_type_id_event_timestamp", event_type_id, event_timestamp),
+        Index(
+            "ix_atm_logs_unacknowledged_alerts", event_timestamp.desc(), id.desc(),
+            postgresql_where=text("is_alert AND acknowledged_by_user_id IS NULL"),
+            sqlite_where=text("is_alert AND acknowledged_by_user_id IS NULL"),
+        ),
+    )
+
     # Связи
     atm = relationship("ATM", back_populates="logs")
     log_level = relationship("LogLevel", back_populates="atm_logs")
     event_type = relationship("EventType", back_populates="atm_logs")
-    acknowledged_by = relationship("User", back_populates="acknowledged_logs", foreign_keys=[acknowledged_by_user_id])
\ No newline at end of file
+    acknowledged_by = relationship("User", back_populates="acknowledged_logs", foreign_keys=[acknowledged_by_user_id])
+
+
+# --- Сводки по логам (rollups.py, migrations/0005_atm_rollups.sql) ---
+# Обновляются в той же транзакции, что и прием логов / подтверждение алертов,
+# чтобы сводка по парку банкоматов не требовала сканировать atm_logs.
+class ATMLogRollup(Base):
+    """Почасовые счетчики логов по банкомату, уровню и типу события."""
+    __tablename__ = "atm_log_rollups"
+
+    bucket_start = Column(DateTime(timezone=True), primary_key=True)  # Начало часа (UTC)
+    atm_id = Column(Integer, ForeignKey("atms.id", ondelete="CASCADE"), primary_key=True)
+    log_level_id = Column(Integer, ForeignKey("log_levels.id"), primary_key=True)
+    event_type_id = Column(Integer, primary_key=True, default=0)  # 0 - без типа: в первичном ключе не может быть NULL
+    log_count = Column(BigInteger, nullable=False, default=0)
+    alert_count = Column(BigInteger, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ix_atm_log_rollups_atm_id_bucket_start", atm_id, bucket_start),
+    )
+
+
+class ATMLevelCount(Base):
+    """Число логов банкомата по уровням за все время."""
+    __tablename__ = "atm_level_counts"
+
+    atm_id = Column(Integer, ForeignKey("atms.id", ondelete="CASCADE"), primary_key=True)
+    log_level_id = Column(Integer, ForeignKey("log_levels.id"), primary_key=True)
+    log_count = Column(BigInteger, nullable=False, default=0)
+
+
+class ATMHealth(Base):
+    """Состояние банкомата: неподтвержденные алерты, последнее событие и последняя ошибка."""
+    __tablename__ = "atm_health"
+
+    atm_id = Column(Integer, ForeignKey("atms.id", ondelete="CASCADE"), primary_key=True)
+    unacknowledged_alerts = Column(Integer, nullable=False, default=0)
+    last_event_at = Column(DateTime(timezone=True), nullable=True)
+    last_error_at = Column(DateTime(timezone=True), nullable=True)
+    last_error_log_id = Column(BigInteger, nullable=True)
+    last_error_message = Column(Text, nullable=True)
+
+
+class ATMLogArchive(Base):
+    """Логи удаленных банкоматов (DELETE /atms/{id}?archive=true, atm_deletion.py). Без внешних ключей."""
+    __tablename__ = "atm_logs_archive"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=False)  # id из atm_logs
+    atm_id = Column(Integer, nullable=False, index=True)
+    event_timestamp = Column(DateTime(timezone=True), nullable=False)
+    log_level_id = Column(Integer, nullable=False)
+    event_type_id = Column(Integer, nullable=True)
+    message = Column(Text, nullable=False)
+    payload = Column(JSON, nullable=True)
+    is_alert = Column(Boolean, default=False)
+    acknowledged_by_user_id = Column(Integer, nullable=True)
+    acknowledged_at = Column(DateTime(timezone=True), nullable=True)
+    recorded_at = Column(DateTime(timezone=True), nullable=True)
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
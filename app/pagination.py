@@ -0,0 +1,143 @@
+# app/pagination.py
+"""
+Keyset-пагинация (курсоры) для списков логов и банкоматов.
+
+OFFSET заставляет PostgreSQL прочитать и выбросить все пропущенные строки, поэтому глубокие
+страницы atm_logs становятся все медленнее. Курсор хранит ключ сортировки крайней строки
+страницы ((event_timestamp, id) для логов, (id,) для банкоматов), и следующая страница
+выбирается условием WHERE (ключ) < (значение курсора) по индексу - страница N стоит как первая.
+Для клиента курсор непрозрачен: base64url от короткого JSON.
+"""
+import base64
+import binascii
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, Generic, List, Optional, Sequence, Tuple, TypeVar
+
+from sqlalchemy import and_, tuple_
+
+T = TypeVar("T")
+
+NEXT = "next"
+PREV = "prev"
+
+# Заголовки ответа, которые фронтенд должен иметь возможность прочитать (CORS)
+EXPOSED_HEADERS = "X-Total-Count, X-Total-Count-Mode, X-Next-Cursor, X-Prev-Cursor"
+
+
+class InvalidCursorError(ValueError):
+    """Курсор поврежден или выдан для другого порядка сортировки."""
+
+
+@dataclass(frozen=True)
+class Cursor:
+    key: Tuple[Any, ...]  # Значения ключа сортировки крайней строки страницы
+    direction: str  # NEXT - строки после key, PREV - строки перед key
+    descending: bool  # Порядок сортировки, для которого выдан курсор
+
+
+@dataclass
+class Page(Generic[T]):
+    items: List[T]
+    next_cursor: Optional[str] = None
+    prev_cursor: Optional[str] = None
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict) and "dt" in value:
+        return datetime.fromisoformat(value["dt"])
+    return value
+
+
+def encode_cursor(key: Sequence[Any], direction: str, descending: bool) -> str:
+    raw = json.dumps(
+        {"k": [_encode_value(v) for v in key], "d": direction, "s": "desc" if descending else "asc"},
+        separators=(",", ":")
+    )
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str, descending: bool, key_length: int) -> Cursor:
+    """Разбирает курсор и проверяет, что он подходит к текущему запросу."""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        key = tuple(_decode_value(v) for v in data["k"])
+        direction = data["d"]
+        cursor_descending = data["s"] == "desc"
+    except (binascii.Error, ValueError, KeyError, TypeError, AttributeError):
+        raise InvalidCursorError("Invalid pagination cursor.")
+    if direction not in (NEXT, PREV) or len(key) != key_length:
+        raise InvalidCursorError("Invalid pagination cursor.")
+    if cursor_descending != descending:
+        raise InvalidCursorError("Pagination cursor was issued for a different sort order.")
+    return Cursor(key=key, direction=direction, descending=descending)
+
+
+def keyset_criteria(columns: Sequence, cursor: Cursor):
+    """Условие WHERE, отсекающее строки до курсора (включительно) в направлении выборки."""
+    # next при DESC и prev при ASC идут к меньшим ключам
+    towards_smaller = cursor.descending == (cursor.direction == NEXT)
+    if len(columns) == 1:
+        column, value = columns[0], cursor.key[0]
+        return column < value if towards_smaller else column > value
+    # Сравнение row values: (event_timestamp, id) < (:ts, :id) - использует составной индекс.
+    # По row value PostgreSQL не отсекает секции, поэтому первый столбец дублируется
+    # отдельным (следующим из него) условием - оно включает partition pruning по event_timestamp.
+    row, value = tuple_(*columns), tuple_(*cursor.key)
+    if towards_smaller:
+        return and_(columns[0] <= cursor.key[0], row < value)
+    return and_(columns[0] >= cursor.key[0], row > value)
+
+
+def keyset_ordering(columns: Sequence, descending: bool, cursor: Optional[Cursor]) -> list:
+    """ORDER BY для выборки страницы. Страница "назад" читается в обратном порядке и затем разворачивается."""
+    backwards = cursor is not None and cursor.direction == PREV
+    effective_descending = descending != backwards
+    return [column.desc() if effective_descending else column.asc() for column in columns]
+
+
+def build_page(
+        rows: List[T],
+        limit: int,
+        cursor: Optional[Cursor],
+        descending: bool,
+        key_func: Callable[[T], Sequence[Any]]
+) -> Page[T]:
+    """
+    Собирает страницу из limit + 1 выбранных строк (лишняя строка означает, что дальше есть данные)
+    и выдает курсоры на соседние страницы.
+    """
+    has_more = len(rows) > limit
+    items = list(rows[:limit])
+    direction = cursor.direction if cursor is not None else NEXT
+    if direction == PREV:
+        items.reverse()
+
+    if not items:
+        return Page(items=[])
+
+    if direction == NEXT:
+        next_cursor = encode_cursor(key_func(items[-1]), NEXT, descending) if has_more else None
+        prev_cursor = encode_cursor(key_func(items[0]), PREV, descending) if cursor is not None else None
+    else:
+        prev_cursor = encode_cursor(key_func(items[0]), PREV, descending) if has_more else None
+        next_cursor = encode_cursor(key_func(items[-1]), NEXT, descending)
+    return Page(items=items, next_cursor=next_cursor, prev_cursor=prev_cursor)
+
+
+def page_headers(page: Page) -> Dict[str, str]:
+    """Заголовки X-Next-Cursor / X-Prev-Cursor для ответа со страницей."""
+    headers = {}
+    if page.next_cursor:
+        headers["X-Next-Cursor"] = page.next_cursor
+    if page.prev_cursor:
+        headers["X-Prev-Cursor"] = page.prev_cursor
+    return headers
@@ -0,0 +1,215 @@
+# app/partitions.py
+"""
+Обслуживание секций atm_logs (секционирование по event_timestamp, см. migrations/0002_partition_atm_logs.sql).
+
+- ensure_future_partitions() заранее создает секции на ATM_LOGS_PARTITIONS_AHEAD периодов вперед
+  (ATM_LOGS_PARTITION_INTERVAL: day или month), чтобы свежие логи не попадали в секцию по умолчанию.
+  Если в atm_logs_default уже лежат строки нового диапазона, они переносятся в создаваемую секцию.
+- apply_retention() отключает (DETACH) секции старше ATM_LOGS_RETENTION_DAYS и, в режиме drop,
+  удаляет их. Это операции над метаданными: время не зависит от числа строк, а таблица не
+  раздувается, как после DELETE. Затем удаляются почасовые сводки за тот же период
+  и пересчитываются неподтвержденные алерты банкоматов (rollups.py).
+Запускается фоновой задачей приложения (maintenance_loop) или вручную: python partitions.py.
+Проход выполняет только тот воркер, что взял pg_try_advisory_lock; остальные его пропускают.
+"""
+import asyncio
+import logging
+import re
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy.engine import Connection, Engine
+
+import rollups
+from config import settings
+
+logger = logging.getLogger("app.partitions")
+
+PARENT_TABLE = "atm_logs"
+DEFAULT_PARTITION = "atm_logs_default"
+PARTITION_INTERVALS = ("day", "month")
+_BOUND_RE = re.compile(r"FOR VALUES FROM \('([^']+)'\) TO \('([^']+)'\)")
+_HOUR_OFFSET_RE = re.compile(r"([+-]\d{2})$")
+# Ключ pg_try_advisory_lock: обслуживание секций выполняет один воркер за раз (у migrate.py свой ключ)
+ADVISORY_LOCK_KEY = 7_310_007
+
+
+@dataclass(frozen=True)
+class Partition:
+    name: str
+    start: datetime  # Включительно
+    end: datetime  # Не включительно
+
+
+# --- Границы периодов (все в UTC) ---
+def period_start(moment: datetime, interval: str) -> datetime:
+    moment = moment.astimezone(timezone.utc) if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+    if interval == "day":
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if interval == "month":
+        return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"Unknown partition interval '{interval}', expected one of {PARTITION_INTERVALS}.")
+
+
+def next_period(start: datetime, interval: str) -> datetime:
+    if interval == "day":
+        return start + timedelta(days=1)
+    if start.month == 12:
+        return start.replace(year=start.year + 1, month=1)
+    return start.replace(month=start.month + 1)
+
+
+def partition_name(start: datetime, interval: str) -> str:
+    return f"{PARENT_TABLE}_p{start.strftime('%Y_%m_%d' if interval == 'day' else '%Y_%m')}"
+
+
+def _overlaps(start: datetime, end: datetime, partitions: List[Partition]) -> bool:
+    return any(start < p.end and p.start < end for p in partitions)
+
+
+def parse_bound(value: str) -> datetime:
+    """Граница секции в виде '2025-05-01 00:00:00+00'; fromisoformat до Python 3.11 не принимает смещение "+00"."""
+    return datetime.fromisoformat(_HOUR_OFFSET_RE.sub(r"\1:00", value))
+
+
+# --- Чтение состояния ---
+def is_partitioned(connection: Connection) -> bool:
+    if connection.dialect.name != "postgresql":
+        return False
+    relkind = connection.exec_driver_sql(
+        "SELECT c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+        "WHERE n.nspname = 'public' AND c.relname = %(table)s",
+        {"table": PARENT_TABLE}
+    ).scalar()
+    return relkind == "p"
+
+
+def list_partitions(connection: Connection) -> List[Partition]:
+    """Подключенные диапазонные секции atm_logs по возрастанию (без секции по умолчанию)."""
+    # Границы печатаются в часовом поясе сессии - фиксируем UTC (до конца транзакции), чтобы их однозначно разбирать
+    connection.exec_driver_sql("SET LOCAL TIME ZONE 'UTC'")
+    rows = connection.exec_driver_sql(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) "
+        "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'public.atm_logs'::regclass"
+    ).all()
+    partitions = []
+    for name, bound in rows:
+        match = _BOUND_RE.search(bound or "")
+        if match is None:  # DEFAULT или MINVALUE/MAXVALUE
+            continue
+        partitions.append(Partition(
+            name=name,
+            start=parse_bound(match.group(1)),
+            end=parse_bound(match.group(2)),
+        ))
+    return sorted(partitions, key=lambda p: p.start)
+
+
+# --- Изменение секций ---
+def create_partition(engine: Engine, name: str, start: datetime, end: datetime) -> None:
+    """
+    Создает секцию [start, end). Строки этого диапазона из секции по умолчанию переносятся в нее
+    (иначе ATTACH PARTITION завершится ошибкой), все в одной транзакции.
+    """
+    bounds = {"start": start, "end": end}
+    with engine.begin() as connection:
+        connection.exec_driver_sql(
+            f'CREATE TABLE public."{name}" (LIKE public.{PARENT_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'
+        )
+        moved = connection.exec_driver_sql(
+            f'WITH moved AS (DELETE FROM public.{DEFAULT_PARTITION} '
+            f'WHERE event_timestamp >= %(start)s AND event_timestamp < %(end)s RETURNING *) '
+            f'INSERT INTO public."{name}" SELECT * FROM moved',
+            bounds
+        ).rowcount
+        connection.exec_driver_sql(
+            f'ALTER TABLE public.{PARENT_TABLE} ATTACH PARTITION public."{name}" '
+            f'FOR VALUES FROM (%(start)s) TO (%(end)s)',
+            bounds
+        )
+    logger.info(f"Created partition {name} [{start.isoformat()}, {end.isoformat()}), moved {moved} rows from default.")
+
+
+def ensure_future_partitions(engine: Engine, now: Optional[datetime] = None) -> List[str]:
+    """Создает недостающие секции от текущего периода на ATM_LOGS_PARTITIONS_AHEAD периодов вперед."""
+    interval = settings.ATM_LOGS_PARTITION_INTERVAL
+    now = now or datetime.now(timezone.utc)
+    with engine.connect() as connection:
+        existing = list_partitions(connection)
+
+    created = []
+    start = period_start(now, interval)
+    for _ in range(settings.ATM_LOGS_PARTITIONS_AHEAD + 1):
+        end = next_period(start, interval)
+        # Период может быть уже покрыт секцией другой длины (например, месячной из миграции)
+        if not _overlaps(start, end, existing):
+            name = partition_name(start, interval)
+            create_partition(engine, name, start, end)
+            existing.append(Partition(name=name, start=start, end=end))
+            created.append(name)
+        start = end
+    return created
+
+
+def apply_retention(engine: Engine, now: Optional[datetime] = None) -> List[str]:
+    """Отключает (и в режиме drop удаляет) секции, целиком старше срока хранения."""
+    if settings.ATM_LOGS_RETENTION_DAYS <= 0:
+        return []
+    cutoff = (now or datetime.now(timezone.utc)) - timedelta(days=settings.ATM_LOGS_RETENTION_DAYS)
+    with engine.connect() as connection:
+        expired = [p for p in list_partitions(connection) if p.end <= cutoff]
+
+    removed = []
+    for partition in expired:
+        with engine.begin() as connection:
+            connection.exec_driver_sql(
+                f'ALTER TABLE public.{PARENT_TABLE} DETACH PARTITION public."{partition.name}"'
+            )
+            if settings.ATM_LOGS_RETENTION_MODE == "drop":
+                connection.exec_driver_sql(f'DROP TABLE public."{partition.name}"')
+        logger.info(f"Retention: partition {partition.name} {'dropped' if settings.ATM_LOGS_RETENTION_MODE == 'drop' else 'detached'}.")
+        removed.append(partition.name)
+
+    if removed:
+        with engine.begin() as connection:
+            rollups.prune_buckets(connection, max(partition.end for partition in expired))
+            rollups.refresh_alert_counts(connection)
+    return removed
+
+
+def run_maintenance(engine: Engine) -> Dict[str, List[str]]:
+    """
+    Один проход обслуживания. Для несекционированной atm_logs (или не PostgreSQL) ничего не делает,
+    как и если проход уже выполняет другой воркер (advisory lock занят).
+    """
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as lock_connection:
+        if not is_partitioned(lock_connection):
+            return {"created": [], "removed": []}
+        if not lock_connection.exec_driver_sql(f"SELECT pg_try_advisory_lock({ADVISORY_LOCK_KEY})").scalar():
+            logger.info("Partition maintenance skipped: another worker holds the lock.")
+            return {"created": [], "removed": []}
+        try:
+            return {"created": ensure_future_partitions(engine), "removed": apply_retention(engine)}
+        finally:
+            lock_connection.exec_driver_sql(f"SELECT pg_advisory_unlock({ADVISORY_LOCK_KEY})")
+
+
+async def maintenance_loop(engine: Engine) -> None:
+    """Фоновая задача: обслуживание секций раз в PARTITION_MAINTENANCE_INTERVAL_SECONDS."""
+    while True:
+        try:
+            report = await asyncio.to_thread(run_maintenance, engine)
+            if report["created"] or report["removed"]:
+                logger.info(f"Partition maintenance: {report}")
+        except Exception as e:
+            logger.error(f"Partition maintenance failed: {e}", exc_info=True)
+        await asyncio.sleep(settings.PARTITION_MAINTENANCE_INTERVAL_SECONDS)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(name)s - %(message)s")
+    from database import engine
+
+    print(run_maintenance(engine))
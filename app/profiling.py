@@ -0,0 +1,239 @@
+# app/profiling.py
+"""
+Профилирование SQL: какие запросы к БД выполнил HTTP-запрос и сколько они шли.
+
+Включается:
+  - для отдельного запроса - заголовком X-SQL-Profile со значением SQL_PROFILE_TOKEN
+    (без токена в настройках заголовок игнорируется: профилирование с EXPLAIN ANALYZE - не для всех);
+  - для всех запросов - SQL_PROFILE_ALWAYS=true;
+  - журнал медленных запросов - SQL_SLOW_QUERY_MS > 0: отдельные запросы к БД дольше порога
+    из любых HTTP-запросов, даже без профилирования.
+Обработчики before/after_cursor_execute пишут текст запроса, параметры и длительность
+в профиль текущего HTTP-запроса (contextvar, как metrics.RequestDBStats). На PostgreSQL при
+SQL_PROFILE_EXPLAIN=true для SELECT дольше SQL_PROFILE_EXPLAIN_MS в профиль добавляется план
+EXPLAIN (ANALYZE, BUFFERS) - запрос выполняется повторно на том же соединении внутри SAVEPOINT.
+Профили хранятся в кольцевом буфере (SQL_PROFILE_BUFFER_SIZE, GET /api/v1/admin/sql-profiles)
+и пишутся в лог app.sql_profile одной JSON-строкой. Параметры запросов сохраняются только при
+SQL_PROFILE_PARAMETERS=true и никогда - для запросов к users и к столбцам с паролями/токенами.
+"""
+import contextvars
+import itertools
+import json
+import logging
+import re
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from typing import Deque, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from config import settings
+
+logger = logging.getLogger("app.sql_profile")
+
+PROFILE_HEADER = b"x-sql-profile"
+MAX_PARAMETERS_LENGTH = 1000
+EXPLAINABLE = re.compile(r"^\s*SELECT\b", re.IGNORECASE)  # EXPLAIN ANALYZE выполняет запрос: только чтение
+# Параметры таких запросов не сохраняются: хеши паролей, токены
+SENSITIVE_STATEMENT = re.compile(r"\busers\b|password|secret|token", re.IGNORECASE)
+REDACTED = "[redacted]"
+
+
+@dataclass
+class StatementProfile:
+    statement: str
+    parameters: Optional[str]
+    duration_ms: float
+    executemany: bool = False
+    slow: bool = False
+    plan: Optional[str] = None
+
+
+@dataclass
+class RequestProfile:
+    id: int
+    trigger: str  # header | always | slow
+    method: str
+    path: str
+    started_at: datetime
+    route: Optional[str] = None
+    status_code: Optional[int] = None
+    duration_ms: Optional[float] = None
+    db_ms: float = 0.0
+    statements: List[StatementProfile] = field(default_factory=list)
+
+
+_ids = itertools.count(1)
+_profiles: Deque[RequestProfile] = deque(maxlen=settings.SQL_PROFILE_BUFFER_SIZE)
+_lock = threading.Lock()
+
+# Профиль текущего HTTP-запроса; None - запрос не профилируется
+_current_profile: contextvars.ContextVar[Optional[RequestProfile]] = contextvars.ContextVar(
+    "sql_profile", default=None
+)
+# Метод и путь текущего запроса для журнала медленных запросов
+_current_request: contextvars.ContextVar[Optional[tuple]] = contextvars.ContextVar("sql_profile_request", default=None)
+
+
+def get_profiles(limit: int = 50, slow_only: bool = False) -> List[RequestProfile]:
+    """Последние профили, новые первыми."""
+    with _lock:
+        profiles = list(_profiles)
+    profiles.reverse()
+    if slow_only:
+        profiles = [p for p in profiles if any(s.slow for s in p.statements)]
+    return profiles[:limit]
+
+
+def get_profile(profile_id: int) -> Optional[RequestProfile]:
+    with _lock:
+        return next((p for p in _profiles if p.id == profile_id), None)
+
+
+def clear_profiles() -> int:
+    with _lock:
+        count = len(_profiles)
+        _profiles.clear()
+    return count
+
+
+def _store(profile: RequestProfile) -> None:
+    with _lock:
+        _profiles.append(profile)
+    logger.info(json.dumps(asdict(profile), default=str, ensure_ascii=False))
+
+
+def _format_parameters(statement: str, parameters) -> Optional[str]:
+    if not settings.SQL_PROFILE_PARAMETERS or parameters is None:
+        return None
+    if SENSITIVE_STATEMENT.search(statement):
+        return REDACTED
+    text = repr(parameters)
+    return text if len(text) <= MAX_PARAMETERS_LENGTH else text[:MAX_PARAMETERS_LENGTH] + "..."
+
+
+def _explain(conn, statement: str, parameters) -> Optional[str]:
+    """EXPLAIN (ANALYZE, BUFFERS) на DBAPI-соединении запроса; ошибка плана не ломает транзакцию запроса."""
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.execute("SAVEPOINT sql_profile_explain")
+        try:
+            cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) {statement}", parameters)
+            plan = "\n".join(row[0] for row in cursor.fetchall())
+        except Exception as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT sql_profile_explain")
+            plan = f"EXPLAIN failed: {e}"
+        cursor.execute("RELEASE SAVEPOINT sql_profile_explain")
+        return plan
+    except Exception as e:
+        logger.warning(f"SQL profile: EXPLAIN skipped: {e}")
+        return None
+    finally:
+        cursor.close()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("sql_profile_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(exception_context):
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("sql_profile_start"):
+        connection.info["sql_profile_start"].pop()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("sql_profile_start")
+    if not starts:
+        return
+    duration_ms = (time.perf_counter() - starts.pop()) * 1000
+    profile = _current_profile.get()
+    slow = 0 < settings.SQL_SLOW_QUERY_MS <= duration_ms
+    if profile is None and not slow:
+        return
+
+    entry = StatementProfile(
+        statement=statement, parameters=_format_parameters(statement, parameters),
+        duration_ms=round(duration_ms, 3), executemany=executemany, slow=slow,
+    )
+    if (
+        settings.SQL_PROFILE_EXPLAIN and profile is not None and not executemany
+        and duration_ms >= settings.SQL_PROFILE_EXPLAIN_MS
+        and conn.dialect.name == "postgresql" and EXPLAINABLE.match(statement)
+        and not (context is not None and context.execution_options.get("stream_results"))
+    ):
+        entry.plan = _explain(conn, statement, parameters)
+
+    if profile is not None:
+        profile.statements.append(entry)
+        profile.db_ms = round(profile.db_ms + duration_ms, 3)
+    else:
+        # Медленный запрос вне профилирования - отдельной записью
+        method, path = _current_request.get() or ("", "")
+        _store(RequestProfile(
+            id=next(_ids), trigger="slow", method=method, path=path,
+            started_at=datetime.now(timezone.utc), db_ms=entry.duration_ms, statements=[entry],
+        ))
+
+
+def _requested_trigger(scope) -> Optional[str]:
+    if settings.SQL_PROFILE_ALWAYS:
+        return "always"
+    if settings.SQL_PROFILE_TOKEN:
+        for name, value in scope.get("headers", ()):
+            if name == PROFILE_HEADER:
+                if value.decode("latin-1") == settings.SQL_PROFILE_TOKEN:
+                    return "header"
+                break
+    return None
+
+
+class SQLProfileMiddleware:
+    """ASGI middleware: включает профиль для запроса и сохраняет его после ответа."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        trigger = _requested_trigger(scope)
+        request_token = _current_request.set((scope["method"], scope["path"]))
+        if trigger is None:
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                _current_request.reset(request_token)
+            return
+
+        profile = RequestProfile(
+            id=next(_ids), trigger=trigger, method=scope["method"], path=scope["path"],
+            started_at=datetime.now(timezone.utc),
+        )
+        profile_token = _current_profile.set(profile)
+
+        async def send_with_profile(message):
+            if message["type"] == "http.response.start":
+                profile.status_code = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"x-sql-profile-id", str(profile.id).encode()))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            _current_profile.reset(profile_token)
+            _current_request.reset(request_token)
+            profile.duration_ms = round((time.perf_counter() - started) * 1000, 3)
+            profile.route = getattr(scope.get("route"), "path_format", None)
+            _store(profile)
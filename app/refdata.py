@@ -0,0 +1,203 @@
+# app/refdata.py
+"""
+Кеш справочников (atm_statuses, log_levels, event_types) в памяти процесса.
+
+Таблицы маленькие (~20 строк) и почти не меняются, поэтому проверки внешних ключей
+при приеме логов и вложенные log_level/event_type в ответах берутся отсюда без запросов к БД.
+Снимок версионируется: любая запись в эти таблицы через ORM помечает его устаревшим,
+и следующий вызов get_reference_data() перечитывает справочники. TTL страхует
+от изменений, сделанных мимо приложения (psql, другой воркер).
+"""
+import threading
+import time
+from dataclasses import dataclass
+from itertools import chain
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import models, schemas
+from config import settings
+
+REFERENCE_MODELS = (models.ATMStatus, models.LogLevel, models.EventType)
+
+
+@dataclass(frozen=True)
+class ReferenceData:
+    version: int
+    loaded_at: float  # time.monotonic() момента загрузки
+    atm_statuses: Dict[int, schemas.ATMStatus]
+    log_levels: Dict[int, schemas.LogLevel]
+    event_types: Dict[int, schemas.EventType]
+
+    def covers_logs(self, logs: Iterable[models.ATMLog]) -> bool:
+        """True, если все уровни и типы событий логов есть в снимке."""
+        return all(
+            log.log_level_id in self.log_levels
+            and (log.event_type_id is None or log.event_type_id in self.event_types)
+            for log in logs
+        )
+
+    def covers_atms(self, atms: Iterable[models.ATM]) -> bool:
+        """True, если статусы всех банкоматов есть в снимке."""
+        return all(atm.status_id in self.atm_statuses for atm in atms)
+
+    def sorted_atm_statuses(self) -> List[schemas.ATMStatus]:
+        return sorted(self.atm_statuses.values(), key=lambda s: s.id)
+
+    def sorted_log_levels(self) -> List[schemas.LogLevel]:
+        # Тот же порядок, что и в crud.get_log_levels (NULL в конце, как в PostgreSQL)
+        return sorted(
+            self.log_levels.values(),
+            key=lambda l: (l.severity_order is None, l.severity_order or 0, l.name)
+        )
+
+    def sorted_event_types(self) -> List[schemas.EventType]:
+        # Тот же порядок, что и в crud.get_event_types
+        return sorted(
+            self.event_types.values(),
+            key=lambda e: (e.category is None, e.category or "", e.name)
+        )
+
+
+_lock = threading.Lock()
+_snapshot: Optional[ReferenceData] = None
+_version = 0
+_stale = True
+
+
+def load_reference_data(db: Session) -> ReferenceData:
+    """Перечитывает справочники из БД и публикует новый снимок."""
+    global _snapshot, _version, _stale
+    atm_statuses = {s.id: schemas.ATMStatus.model_validate(s) for s in db.query(models.ATMStatus).all()}
+    log_levels = {l.id: schemas.LogLevel.model_validate(l) for l in db.query(models.LogLevel).all()}
+    event_types = {e.id: schemas.EventType.model_validate(e) for e in db.query(models.EventType).all()}
+    with _lock:
+        _version += 1
+        _snapshot = ReferenceData(
+            version=_version,
+            loaded_at=time.monotonic(),
+            atm_statuses=atm_statuses,
+            log_levels=log_levels,
+            event_types=event_types,
+        )
+        _stale = False
+        return _snapshot
+
+
+def _is_fresh(snapshot: Optional[ReferenceData]) -> bool:
+    return (
+        snapshot is not None
+        and not _stale
+        and time.monotonic() - snapshot.loaded_at <= settings.REFDATA_TTL_SECONDS
+    )
+
+
+def get_reference_data(db: Session) -> ReferenceData:
+    """Возвращает актуальный снимок справочников, при необходимости перечитывая его через db."""
+    snapshot = _snapshot
+    if not _is_fresh(snapshot):
+        return load_reference_data(db)
+    return snapshot
+
+
+async def get_reference_data_async(
+        db: AsyncSession, logs: Iterable[models.ATMLog] = (), atms: Iterable[models.ATM] = ()
+) -> ReferenceData:
+    """
+    То же, что get_reference_data(), для AsyncSession.
+    Если переданы логи или банкоматы, снимок дополнительно проверяется на полноту: в асинхронной сессии
+    запасной lazy load связей в log_to_schema()/atm_to_schema() невозможен, поэтому справочники перечитываются заранее.
+    """
+    snapshot = _snapshot
+    if not _is_fresh(snapshot) or not snapshot.covers_logs(logs) or not snapshot.covers_atms(atms):
+        snapshot = await db.run_sync(load_reference_data)
+    return snapshot
+
+
+def invalidate_reference_data() -> None:
+    """Помечает снимок устаревшим; следующий get_reference_data() перечитает справочники."""
+    global _stale
+    _stale = True
+
+
+# --- Сериализация ответов без lazy load связей ---
+def log_to_schema(db_log: models.ATMLog, reference: ReferenceData) -> schemas.ATMLog:
+    """Собирает schemas.ATMLog, беря log_level/event_type из кеша, а не из связей ORM."""
+    log_level = reference.log_levels.get(db_log.log_level_id)
+    if log_level is None:  # Уровень появился после загрузки снимка - берем из БД
+        invalidate_reference_data()
+        log_level = schemas.LogLevel.model_validate(db_log.log_level)
+
+    event_type = None
+    if db_log.event_type_id is not None:
+        event_type = reference.event_types.get(db_log.event_type_id)
+        if event_type is None:
+            invalidate_reference_data()
+            event_type = schemas.EventType.model_validate(db_log.event_type)
+
+    return schemas.ATMLog(
+        id=db_log.id,
+        atm_id=db_log.atm_id,
+        event_timestamp=db_log.event_timestamp,
+        message=db_log.message,
+        payload=db_log.payload,
+        is_alert=db_log.is_alert,
+        log_level_id=db_log.log_level_id,
+        event_type_id=db_log.event_type_id,
+        recorded_at=db_log.recorded_at,
+        acknowledged_by_user_id=db_log.acknowledged_by_user_id,
+        acknowledged_at=db_log.acknowledged_at,
+        log_level=log_level,
+        event_type=event_type,
+    )
+
+
+def atm_to_schema(db_atm: models.ATM, reference: ReferenceData) -> schemas.ATM:
+    """Собирает schemas.ATM, беря status из кеша, а не из связи ORM."""
+    atm_status = reference.atm_statuses.get(db_atm.status_id)
+    if atm_status is None:  # Статус появился после загрузки снимка - берем из БД
+        invalidate_reference_data()
+        atm_status = schemas.ATMStatus.model_validate(db_atm.status)
+
+    return schemas.ATM(
+        id=db_atm.id,
+        atm_uid=db_atm.atm_uid,
+        location_description=db_atm.location_description,
+        ip_address=db_atm.ip_address,
+        status_id=db_atm.status_id,
+        added_by_user_id=db_atm.added_by_user_id,
+        created_at=db_atm.created_at,
+        updated_at=db_atm.updated_at,
+        status=atm_status,
+    )
+
+
+# --- Инвалидация при записи в справочники ---
+@event.listens_for(Session, "after_flush")
+def _track_reference_writes(session, flush_context):
+    if any(isinstance(obj, REFERENCE_MODELS) for obj in chain(session.new, session.dirty, session.deleted)):
+        session.info["refdata_dirty"] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_reference_bulk_writes(orm_execute_state):
+    # query(...).update()/delete() и insert()/update() по моделям справочников
+    if orm_execute_state.is_select:
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and issubclass(mapper.class_, REFERENCE_MODELS):
+        orm_execute_state.session.info["refdata_dirty"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    if session.info.pop("refdata_dirty", False):
+        invalidate_reference_data()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_after_rollback(session):
+    session.info.pop("refdata_dirty", None)
@@ -0,0 +1,332 @@
+# app/rollups.py
+"""
+Сводки по логам, которые обновляются при записи, а не считаются сканированием atm_logs.
+
+  atm_log_rollups  - почасовые счетчики (банкомат, уровень, тип события): логи и алерты;
+  atm_level_counts - число логов банкомата по уровням за все время;
+  atm_health       - неподтвержденные алерты, последнее событие и последняя ошибка банкомата.
+
+Прием логов (crud/crud_async: create_atm_log, create_atm_logs_bulk) агрегирует пачку в Python
+и выполняет по одному INSERT ... ON CONFLICT DO UPDATE на таблицу в той же транзакции, что и вставка логов.
+Подтверждение алерта и смена is_alert корректируют счетчики так же. Строки сортируются по ключу,
+чтобы параллельные пачки блокировали их в одном порядке.
+rebuild() пересчитывает все с нуля (python rollups.py --rebuild), refresh_alert_counts() -
+только неподтвержденные алерты (после удаления старых секций atm_logs).
+"""
+import logging
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import DateTime, and_, case, delete, func, insert, literal_column, or_, select, true, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.expression import ColumnElement
+
+import models, refdata
+
+logger = logging.getLogger("app.rollups")
+
+ERROR_LEVEL_NAMES = ("ERROR", "CRITICAL")  # Уровни ошибок для last_error_at; совпадают с alert_rules.DEFAULT_RULES
+NO_EVENT_TYPE = 0
+BUCKET_UNITS = ("minute", "hour", "day")
+
+rollup_table = models.ATMLogRollup.__table__
+level_count_table = models.ATMLevelCount.__table__
+health_table = models.ATMHealth.__table__
+log_table = models.ATMLog.__table__
+
+
+# --- Усечение времени до начала интервала (UTC) ---
+class TimeBucket(ColumnElement):
+    """Начало минуты/часа/дня (UTC), в которое попадает значение столбца."""
+    type = DateTime(timezone=True)
+    inherit_cache = False
+
+    def __init__(self, column, unit: str):
+        if unit not in BUCKET_UNITS:
+            raise ValueError(f"Unknown bucket unit '{unit}', expected one of {BUCKET_UNITS}.")
+        self.column = column
+        self.unit = unit
+
+
+@compiles(TimeBucket, "postgresql")
+def _time_bucket_pg(element, compiler, **kw):
+    column = compiler.process(element.column, **kw)
+    return f"(date_trunc('{element.unit}', {column} AT TIME ZONE 'UTC') AT TIME ZONE 'UTC')"
+
+
+_SQLITE_BUCKET_FORMATS = {
+    "minute": "%Y-%m-%d %H:%M:00.000000",
+    "hour": "%Y-%m-%d %H:00:00.000000",
+    "day": "%Y-%m-%d 00:00:00.000000",
+}
+
+
+@compiles(TimeBucket)
+def _time_bucket_default(element, compiler, **kw):
+    # SQLite хранит DateTime строкой 'YYYY-MM-DD HH:MM:SS.ffffff'
+    column = compiler.process(element.column, **kw)
+    return f"strftime('{_SQLITE_BUCKET_FORMATS[element.unit]}', {column})"
+
+
+def as_utc(moment: datetime) -> datetime:
+    """Приводит время к UTC; время без часового пояса считается UTC (как в crud.as_utc)."""
+    return moment.astimezone(timezone.utc) if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
+def bucket_start(moment: datetime, unit: str = "hour") -> datetime:
+    moment = as_utc(moment)
+    if unit == "minute":
+        return moment.replace(second=0, microsecond=0)
+    if unit == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    if unit == "day":
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"Unknown bucket unit '{unit}', expected one of {BUCKET_UNITS}.")
+
+
+# --- Агрегация пачки ---
+@dataclass(frozen=True)
+class LogFact:
+    """То, что нужно сводкам от одного лога (ORM-объект или строка пакетной вставки)."""
+    id: int
+    atm_id: int
+    event_timestamp: datetime
+    log_level_id: int
+    event_type_id: Optional[int]
+    is_alert: bool
+    message: Optional[str] = None  # Нужно только для последней ошибки при приеме
+
+    @classmethod
+    def of(cls, log) -> "LogFact":
+        return cls(
+            id=log.id, atm_id=log.atm_id, event_timestamp=as_utc(log.event_timestamp), log_level_id=log.log_level_id,
+            event_type_id=log.event_type_id, is_alert=bool(log.is_alert), message=getattr(log, "message", None),
+        )
+
+
+def _insert(dialect_name: str):
+    return postgresql.insert if dialect_name == "postgresql" else sqlite.insert
+
+
+def _upsert_counters(dialect_name: str, table, keys: List[str], rows: List[dict]):
+    """INSERT ... ON CONFLICT (keys) DO UPDATE: счетчики (все столбцы кроме ключа) складываются."""
+    stmt = _insert(dialect_name)(table).values(sorted(rows, key=lambda row: tuple(row[k] for k in keys)))
+    counters = [name for name in rows[0] if name not in keys]
+    return stmt.on_conflict_do_update(
+        index_elements=keys,
+        set_={name: table.c[name] + stmt.excluded[name] for name in counters}
+    )
+
+
+def _upsert_health(dialect_name: str, rows: List[dict]):
+    stmt = _insert(dialect_name)(health_table).values(sorted(rows, key=lambda row: row["atm_id"]))
+    t, ex = health_table.c, stmt.excluded
+    newer_event = or_(t.last_event_at.is_(None), ex.last_event_at > t.last_event_at)
+    newer_error = or_(t.last_error_at.is_(None), and_(ex.last_error_at.is_not(None), ex.last_error_at >= t.last_error_at))
+    return stmt.on_conflict_do_update(
+        index_elements=["atm_id"],
+        set_={
+            "unacknowledged_alerts": t.unacknowledged_alerts + ex.unacknowledged_alerts,
+            "last_event_at": case((newer_event, ex.last_event_at), else_=t.last_event_at),
+            "last_error_at": case((newer_error, ex.last_error_at), else_=t.last_error_at),
+            "last_error_log_id": case((newer_error, ex.last_error_log_id), else_=t.last_error_log_id),
+            "last_error_message": case((newer_error, ex.last_error_message), else_=t.last_error_message),
+        }
+    )
+
+
+def ingest_statements(dialect_name: str, facts: Iterable[LogFact], reference: refdata.ReferenceData) -> List:
+    """Upsert-ы сводок для пачки новых логов (пустой список, если логов нет)."""
+    buckets: Dict[Tuple, List[int]] = defaultdict(lambda: [0, 0])
+    levels: Dict[Tuple[int, int], int] = defaultdict(int)
+    health: Dict[int, dict] = {}
+    error_level_ids = {level.id for level in reference.log_levels.values() if level.name in ERROR_LEVEL_NAMES}
+
+    for fact in facts:
+        counters = buckets[(bucket_start(fact.event_timestamp), fact.atm_id, fact.log_level_id,
+                            fact.event_type_id or NO_EVENT_TYPE)]
+        counters[0] += 1
+        counters[1] += fact.is_alert
+        levels[(fact.atm_id, fact.log_level_id)] += 1
+
+        atm = health.setdefault(fact.atm_id, {
+            "atm_id": fact.atm_id, "unacknowledged_alerts": 0, "last_event_at": fact.event_timestamp,
+            "last_error_at": None, "last_error_log_id": None, "last_error_message": None,
+        })
+        atm["unacknowledged_alerts"] += fact.is_alert
+        atm["last_event_at"] = max(atm["last_event_at"], fact.event_timestamp)
+        if fact.log_level_id in error_level_ids and (
+                atm["last_error_at"] is None or (fact.event_timestamp, fact.id) > (atm["last_error_at"], atm["last_error_log_id"])):
+            atm.update(last_error_at=fact.event_timestamp, last_error_log_id=fact.id, last_error_message=fact.message)
+
+    if not health:
+        return []
+    return [
+        _upsert_counters(dialect_name, rollup_table, ["bucket_start", "atm_id", "log_level_id", "event_type_id"], [
+            {"bucket_start": key[0], "atm_id": key[1], "log_level_id": key[2], "event_type_id": key[3],
+             "log_count": count, "alert_count": alerts}
+            for key, (count, alerts) in buckets.items()
+        ]),
+        _upsert_counters(dialect_name, level_count_table, ["atm_id", "log_level_id"], [
+            {"atm_id": atm_id, "log_level_id": level_id, "log_count": count}
+            for (atm_id, level_id), count in levels.items()
+        ]),
+        _upsert_health(dialect_name, list(health.values())),
+    ]
+
+
+@dataclass(frozen=True)
+class AlertChange:
+    """Изменение алерта: alert_delta - смена is_alert (+1/-1), unacknowledged_delta - неподтвержденных."""
+    fact: LogFact
+    alert_delta: int = 0
+    unacknowledged_delta: int = 0
+
+
+def alert_change_statements(dialect_name: str, changes: Iterable[AlertChange]) -> List:
+    """Корректировки сводок при подтверждении алертов и смене is_alert."""
+    buckets: Dict[Tuple, int] = defaultdict(int)
+    unacknowledged: Dict[int, int] = defaultdict(int)
+    for change in changes:
+        fact = change.fact
+        if change.alert_delta:
+            buckets[(bucket_start(fact.event_timestamp), fact.atm_id, fact.log_level_id,
+                     fact.event_type_id or NO_EVENT_TYPE)] += change.alert_delta
+        if change.unacknowledged_delta:
+            unacknowledged[fact.atm_id] += change.unacknowledged_delta
+
+    statements = []
+    buckets = {key: delta for key, delta in buckets.items() if delta}
+    if buckets:
+        statements.append(_upsert_counters(
+            dialect_name, rollup_table, ["bucket_start", "atm_id", "log_level_id", "event_type_id"], [
+                {"bucket_start": key[0], "atm_id": key[1], "log_level_id": key[2], "event_type_id": key[3],
+                 "log_count": 0, "alert_count": delta}
+                for key, delta in buckets.items()
+            ]))
+    unacknowledged = {atm_id: delta for atm_id, delta in unacknowledged.items() if delta}
+    if unacknowledged:
+        statements.append(_upsert_counters(dialect_name, health_table, ["atm_id"], [
+            {"atm_id": atm_id, "unacknowledged_alerts": delta} for atm_id, delta in unacknowledged.items()
+        ]))
+    return statements
+
+
+# --- Выполнение в сессиях crud / crud_async ---
+def record_logs(db: Session, logs: Iterable) -> None:
+    """Учитывает новые логи в сводках (до commit вызывающей функции)."""
+    for stmt in ingest_statements(db.get_bind().dialect.name, [LogFact.of(log) for log in logs],
+                                  refdata.get_reference_data(db)):
+        db.execute(stmt)
+
+
+async def record_logs_async(db: AsyncSession, logs: Iterable) -> None:
+    facts = [LogFact.of(log) for log in logs]
+    reference = await refdata.get_reference_data_async(db)
+    for stmt in ingest_statements(db.get_bind().dialect.name, facts, reference):
+        await db.execute(stmt)
+
+
+def record_alert_changes(db: Session, changes: Iterable[AlertChange]) -> None:
+    for stmt in alert_change_statements(db.get_bind().dialect.name, changes):
+        db.execute(stmt)
+
+
+async def record_alert_changes_async(db: AsyncSession, changes: Iterable[AlertChange]) -> None:
+    for stmt in alert_change_statements(db.get_bind().dialect.name, changes):
+        await db.execute(stmt)
+
+
+def alert_status_change(row, new_is_alert: bool) -> AlertChange:
+    """
+    Изменение сводок для строки, у которой is_alert действительно сменился на new_is_alert
+    (строка из UPDATE ... RETURNING с условием crud.alert_status_change_conditions).
+    """
+    delta = 1 if new_is_alert else -1
+    return AlertChange(
+        fact=LogFact.of(row),
+        alert_delta=delta,
+        unacknowledged_delta=delta if row.acknowledged_by_user_id is None else 0,
+    )
+
+
+# --- Пересчет ---
+def _unacknowledged_count(atm_id_column):
+    return (
+        select(func.count())
+        .select_from(log_table)
+        .where(log_table.c.atm_id == atm_id_column, log_table.c.is_alert.is_(true()),
+               log_table.c.acknowledged_by_user_id.is_(None))
+        .scalar_subquery()
+    )
+
+
+def refresh_alert_counts(connection: Connection) -> None:
+    """Пересчитывает неподтвержденные алерты (по частичному индексу ix_atm_logs_unacknowledged_alerts)."""
+    connection.execute(update(health_table).values(unacknowledged_alerts=_unacknowledged_count(health_table.c.atm_id)))
+
+
+def prune_buckets(connection: Connection, before: datetime) -> int:
+    """Удаляет почасовые счетчики за периоды, логи которых уже удалены по сроку хранения."""
+    return connection.execute(delete(rollup_table).where(rollup_table.c.bucket_start < before)).rowcount
+
+
+def rebuild(connection: Connection) -> None:
+    """Пересчитывает все сводки по atm_logs (полное сканирование - для ремонта, не для запросов)."""
+    for table in (rollup_table, level_count_table, health_table):
+        connection.execute(delete(table))
+
+    hour = TimeBucket(log_table.c.event_timestamp, "hour")
+    event_type = func.coalesce(log_table.c.event_type_id, literal_column(str(NO_EVENT_TYPE)))
+    alert = case((log_table.c.is_alert.is_(true()), 1), else_=0)
+    connection.execute(insert(rollup_table).from_select(
+        ["bucket_start", "atm_id", "log_level_id", "event_type_id", "log_count", "alert_count"],
+        select(hour, log_table.c.atm_id, log_table.c.log_level_id, event_type, func.count(), func.sum(alert))
+        .group_by(hour, log_table.c.atm_id, log_table.c.log_level_id, event_type)
+    ))
+    connection.execute(insert(level_count_table).from_select(
+        ["atm_id", "log_level_id", "log_count"],
+        select(log_table.c.atm_id, log_table.c.log_level_id, func.count())
+        .group_by(log_table.c.atm_id, log_table.c.log_level_id)
+    ))
+
+    atms = models.ATM.__table__
+    error_levels = select(models.LogLevel.id).where(models.LogLevel.name.in_(ERROR_LEVEL_NAMES))
+
+    def last_error(column):
+        return (
+            select(column)
+            .where(log_table.c.atm_id == atms.c.id, log_table.c.log_level_id.in_(error_levels))
+            .order_by(log_table.c.event_timestamp.desc(), log_table.c.id.desc())
+            .limit(1)
+            .scalar_subquery()
+        )
+
+    last_event = select(func.max(log_table.c.event_timestamp)).where(log_table.c.atm_id == atms.c.id).scalar_subquery()
+    connection.execute(insert(health_table).from_select(
+        ["atm_id", "unacknowledged_alerts", "last_event_at", "last_error_at", "last_error_log_id", "last_error_message"],
+        select(atms.c.id, _unacknowledged_count(atms.c.id), last_event, last_error(log_table.c.event_timestamp),
+               last_error(log_table.c.id), last_error(log_table.c.message))
+        .where(last_event.is_not(None))
+    ))
+
+
+if __name__ == "__main__":
+    import sys
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(name)s - %(message)s")
+    from database import engine
+
+    with engine.begin() as connection:
+        if "--rebuild" in sys.argv:
+            rebuild(connection)
+            logger.info("Rollups rebuilt.")
+        else:
+            refresh_alert_counts(connection)
+            logger.info("Unacknowledged alert counts refreshed.")
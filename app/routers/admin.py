@@ -0,0 +1,41 @@
+# app/routers/admin.py
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+
+import models, profiling, schemas
+from deps import get_current_admin_or_superuser
+
+router = APIRouter()
+
+
+@router.get("/sql-profiles", response_model=List[schemas.SQLRequestProfile])
+async def read_sql_profiles(
+        limit: int = Query(50, ge=1, le=1000),
+        slow_only: bool = Query(False, description="Только профили с запросами дольше SQL_SLOW_QUERY_MS"),
+        current_user_with_admin_rights: models.User = Depends(get_current_admin_or_superuser)
+):
+    """
+    Последние профили SQL из кольцевого буфера, новые первыми (см. profiling.py).
+    Профиль запроса включается заголовком X-SQL-Profile: <SQL_PROFILE_TOKEN> или SQL_PROFILE_ALWAYS,
+    его номер возвращается в заголовке ответа X-SQL-Profile-Id.
+    """
+    return profiling.get_profiles(limit=limit, slow_only=slow_only)
+
+
+@router.get("/sql-profiles/{profile_id}", response_model=schemas.SQLRequestProfile)
+async def read_sql_profile(
+        profile_id: int,
+        current_user_with_admin_rights: models.User = Depends(get_current_admin_or_superuser)
+):
+    profile = profiling.get_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="SQL profile not found (or evicted from the buffer)")
+    return profile
+
+
+@router.delete("/sql-profiles", status_code=status.HTTP_204_NO_CONTENT)
+async def clear_sql_profiles(
+        current_user_with_admin_rights: models.User = Depends(get_current_admin_or_superuser)
+):
+    profiling.clear_profiles()
@@ -1,13 +1,26 @@
 # app/routers/atms.py
-from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
-from sqlalchemy.orm import Session
-from typing import List, Optional
+import json
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status, Query, Response, Request, Header
+from sqlalchemy import select
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from typing import AsyncIterator, List, Literal, Optional, Tuple
 
 # Импортируем все необходимое из наших модулей
 import crud
+import crud_async
 import models
+import refdata
+import caching
+import pagination
+import counts
+import atm_deletion
+import ingest_queue
+import metrics
 import schemas # Убедитесь, что schemas импортирован для response_model и типов входных данных
-from database import get_db
+from database import get_db, get_async_db, get_async_sessionmaker, get_sessionmaker
+from config import settings
 from deps import get_current_user, get_current_admin_or_superuser
 from security import get_api_key # <--- ИМПОРТИРУЕМ ЗАВИСИМОСТЬ ДЛЯ API-КЛЮЧА
 from fastapi.responses import JSONResponse
@@ -19,10 +32,9 @@ router = APIRouter()
 
 # --- Эндпоинт для получения списка статусов ---
 @router.get("/statuses/", response_model=List[schemas.ATMStatus])
-@cache(expire=3600)
+@cache(expire=3600, key_builder=caching.tagged_key_builder(caching.REFDATA_TAG))
 async def read_atm_statuses(db: Session = Depends(get_db)):
-    statuses = db.query(models.ATMStatus).order_by(models.ATMStatus.id).all()
-    return statuses
+    return refdata.get_reference_data(db).sorted_atm_statuses()
 
 
 # --- Эндпоинт для получения списка банкоматов ---
@@ -33,24 +45,89 @@ async def read_atms(
         status_id: Optional[int] = Query(None, description="Filter by status ID"),
         location: Optional[str] = Query(None, description="Search keyword for location"),
         atm_uid: Optional[str] = Query(None, description="Search keyword for ATM UID"),
-        db: Session = Depends(get_db),
+        pagination_mode: Literal["offset", "cursor"] = Query(
+            "offset", alias="pagination", description="'offset' (skip/limit) or 'cursor' (keyset by id)"
+        ),
+        cursor: Optional[str] = Query(None, description="Opaque cursor from X-Next-Cursor / X-Prev-Cursor (implies cursor pagination)"),
+        count: Optional[Literal["exact", "cached", "estimated", "none"]] = Query(
+            None, description="How to compute X-Total-Count; 'none' skips it (overrides X-Count-Mode header)"
+        ),
+        count_mode_header: Optional[Literal["exact", "cached", "estimated", "none"]] = Header(None, alias="X-Count-Mode"),
+        db: AsyncSession = Depends(get_async_db),
         current_user: models.User = Depends(get_current_user)
 ):
-    total_count = crud.get_atms_count(
-        db, status_id=status_id, location_keyword=location, atm_uid_keyword=atm_uid
-    )
-    atms = crud.get_atms(
-        db, skip=skip, limit=limit, status_id=status_id, location_keyword=location, atm_uid_keyword=atm_uid
+    decoded_cursor = None
+    if cursor:
+        try:
+            decoded_cursor = pagination.decode_cursor(cursor, descending=False, key_length=1)
+        except pagination.InvalidCursorError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    filters = dict(status_id=status_id, location_keyword=location, atm_uid_keyword=atm_uid)
+    total_count = await counts.get_total_count(
+        db,
+        mode=counts.resolve_mode(count, count_mode_header),
+        cache_key=counts.make_cache_key("atms", filters),
+        exact_count=lambda: crud_async.get_atms_count(db, **filters),
+        estimate_query=select(models.ATM.id).where(*crud.atm_filter_criteria(**filters))
     )
-    content_to_serialize = jsonable_encoder(atms)
+    headers = {
+        **counts.count_headers(total_count),
+        "Access-Control-Expose-Headers": pagination.EXPOSED_HEADERS
+    }
+    if cursor is not None or pagination_mode == "cursor":
+        page = await crud_async.get_atms_page(
+            db, limit=limit, cursor=decoded_cursor, status_id=status_id, location_keyword=location, atm_uid_keyword=atm_uid
+        )
+        headers.update(pagination.page_headers(page))
+        atms = page.items
+    else:
+        atms = await crud_async.get_atms(
+            db, skip=skip, limit=limit, status_id=status_id, location_keyword=location, atm_uid_keyword=atm_uid
+        )
+    # Вложенный status берем из кеша справочников: число запросов не зависит от размера страницы
+    reference = await refdata.get_reference_data_async(db, atms=atms)
+    content_to_serialize = jsonable_encoder([refdata.atm_to_schema(atm, reference) for atm in atms])
     return JSONResponse(
         content=content_to_serialize,
-        headers={
-            "X-Total-Count": str(total_count),
-            "Access-Control-Expose-Headers": "X-Total-Count"
-        }
+        headers=headers
     )
 
+# --- Сводка по банкоматам ---
+# Объявлен до /{atm_id}, иначе "summary" разбирался бы как atm_id
+@router.get("/summary", response_model=List[schemas.ATMSummary])
+async def read_atms_summary(
+        status_id: Optional[int] = Query(None, description="Filter by status ID"),
+        db: AsyncSession = Depends(get_async_db),
+        current_user: models.User = Depends(get_current_user)
+):
+    """Неподтвержденные алерты, последнее событие, последняя ошибка и число логов по уровням для каждого банкомата."""
+    atms, level_counts = await crud_async.get_atm_summaries(db, status_id=status_id)
+    reference = await refdata.get_reference_data_async(db, atms=[atm for atm, _ in atms])
+    counts_by_atm = {}
+    for level_count in level_counts:
+        level = reference.log_levels.get(level_count.log_level_id)
+        level_name = level.name if level else str(level_count.log_level_id)
+        counts_by_atm.setdefault(level_count.atm_id, {})[level_name] = level_count.log_count
+
+    summaries = []
+    for atm, health in atms:
+        log_counts = counts_by_atm.get(atm.id, {})
+        summaries.append(schemas.ATMSummary(
+            atm_id=atm.id,
+            atm_uid=atm.atm_uid,
+            location_description=atm.location_description,
+            status=reference.atm_statuses[atm.status_id],
+            unacknowledged_alerts=health.unacknowledged_alerts if health else 0,
+            last_event_at=health.last_event_at if health else None,
+            last_error_at=health.last_error_at if health else None,
+            last_error_log_id=health.last_error_log_id if health else None,
+            last_error_message=health.last_error_message if health else None,
+            total_logs=sum(log_counts.values()),
+            log_counts=log_counts,
+        ))
+    return summaries
+
 # --- Эндпоинт создания банкомата ---
 # Убрал дублирование декоратора
 @router.post("/", response_model=schemas.ATM, status_code=status.HTTP_201_CREATED)
@@ -65,8 +142,7 @@ async def create_new_atm(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"ATM with UID {atm_in.atm_uid} already exists."
         )
-    status_obj = db.query(models.ATMStatus).filter(models.ATMStatus.id == atm_in.status_id).first()
-    if not status_obj:
+    if atm_in.status_id not in refdata.get_reference_data(db).atm_statuses:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"ATMStatus with id {atm_in.status_id} not found."
@@ -81,13 +157,20 @@ async def create_new_atm(
 @router.get("/{atm_id}", response_model=schemas.ATM)
 async def read_atm_by_id(
         atm_id: int,
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_async_db),
         current_user: models.User = Depends(get_current_user)
 ):
-    db_atm = crud.get_atm(db, atm_id=atm_id)
+    # Ответ один для всех пользователей; сбрасывается при изменении банкомата (caching.atm_tags)
+    cache_key, cached = await caching.lookup("atm", {"atm_id": atm_id}, caching.atm_tags(atm_id))
+    if cached is not None:
+        return Response(content=cached, media_type="application/json", headers={caching.CACHE_STATUS_HEADER: "HIT"})
+
+    db_atm = await crud_async.get_atm(db, atm_id=atm_id)
     if db_atm is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="ATM not found")
-    return db_atm
+    atm = refdata.atm_to_schema(db_atm, await refdata.get_reference_data_async(db, atms=[db_atm]))
+    await caching.store(cache_key, atm.model_dump_json().encode(), settings.ATM_CACHE_TTL_SECONDS)
+    return atm
 
 
 # --- Эндпоинт обновления банкомата ---
@@ -107,8 +190,7 @@ async def update_existing_atm(
             detail="Not enough permissions to update this ATM"
         )
     if atm_in.status_id is not None:
-        status_obj = db.query(models.ATMStatus).filter(models.ATMStatus.id == atm_in.status_id).first()
-        if not status_obj:
+        if atm_in.status_id not in refdata.get_reference_data(db).atm_statuses:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"ATMStatus with id {atm_in.status_id} not found for update."
@@ -128,55 +210,250 @@ async def update_existing_atm(
 
 
 # --- Эндпоинт удаления банкомата ---
-@router.delete("/{atm_id}", status_code=status.HTTP_204_NO_CONTENT)
+@router.delete("/{atm_id}", response_model=schemas.ATMDeletionJob, status_code=status.HTTP_202_ACCEPTED)
 async def delete_existing_atm(
         atm_id: int,
-        db: Session = Depends(get_db),
+        request: Request,
+        response: Response,
+        background_tasks: BackgroundTasks,
+        archive: bool = Query(False, description="Copy the ATM's logs to atm_logs_archive before deleting them"),
+        db: AsyncSession = Depends(get_async_db),
+        session_factory: sessionmaker = Depends(get_sessionmaker),
         current_user_with_admin_rights: models.User = Depends(get_current_admin_or_superuser)
 ):
-    deleted_atm = crud.delete_atm(db, atm_id=atm_id)
-    if deleted_atm is None:
+    """
+    Удаляет банкомат и его логи фоновой задачей (пачками, см. atm_deletion.py).
+    Ответ 202 с задачей; прогресс - GET /atms/deletions/{job_id} (ссылка в заголовке Location).
+    """
+    if await crud_async.get_atm(db, atm_id=atm_id) is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="ATM not found")
-    return Response(status_code=status.HTTP_204_NO_CONTENT)
+    job = atm_deletion.submit(atm_id, archive=archive)
+    if job.status == "queued":
+        background_tasks.add_task(atm_deletion.run, job, session_factory)
+    response.headers["Location"] = str(request.url_for("read_atm_deletion_job", job_id=job.job_id))
+    return job
+
+
+@router.get("/deletions/{job_id}", response_model=schemas.ATMDeletionJob)
+async def read_atm_deletion_job(
+        job_id: str,
+        current_user_with_admin_rights: models.User = Depends(get_current_admin_or_superuser)
+):
+    job = atm_deletion.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Deletion job not found")
+    return job
 
 
 # --- НОВЫЙ ЭНДПОИНТ: Создание лога для банкомата (защищен API-ключом) ---
 @router.post("/{atm_id}/logs/",
                  response_model=schemas.ATMLog,
                  status_code=status.HTTP_201_CREATED,
+                 responses={status.HTTP_202_ACCEPTED: {"model": schemas.ATMLogQueued}},
                  dependencies=[Depends(get_api_key)]) # <--- ЗАЩИЩАЕМ ЭТОТ ЭНДПОИНТ API-КЛЮЧОМ
 async def create_log_for_specific_atm( # Переименовал для ясности
     atm_id: int,
     log_in: schemas.ATMLogCreate, # Используем схему для создания лога
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    session_factory: async_sessionmaker = Depends(get_async_sessionmaker)
     # current_user здесь не нужен, так как авторизация по API-ключу
 ):
     """
     Создает новую запись лога для указанного банкомата.
     Этот эндпоинт предназначен для использования ATM симуляторами с API-ключом.
+    При LOG_INGEST_MODE=queued лог пишется пачкой фоновым писателем, ответ - 202 (см. ingest_queue.py).
     """
+    if settings.LOG_INGEST_MODE == "queued":
+        return await _enqueue_log(atm_id, log_in, db, session_factory)
+
     # Проверяем, существует ли банкомат
-    db_atm = crud.get_atm(db, atm_id=atm_id)
-    if not db_atm:
+    db_atm = await crud_async.get_atm(db, atm_id=atm_id)
+    if not db_atm or db_atm.deletion_requested_at is not None:  # Удаляемый банкомат логов не принимает
+        metrics.count_log_rejected(None, None, "atm_not_found")
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"ATM with id {atm_id} not found")
 
-    # Проверки для log_level_id и event_type_id (если они не null)
+    # Проверки для log_level_id и event_type_id (если они не null) - по кешу справочников
+    reference = await refdata.get_reference_data_async(db)
     if log_in.log_level_id:
-        log_level = db.query(models.LogLevel).filter(models.LogLevel.id == log_in.log_level_id).first()
-        if not log_level:
+        if log_in.log_level_id not in reference.log_levels:
+            metrics.count_log_rejected(atm_id, None, "unknown_log_level")
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"LogLevel with id {log_in.log_level_id} not found.")
 
     if log_in.event_type_id is not None: # event_type_id может быть NULL
-        event_type = db.query(models.EventType).filter(models.EventType.id == log_in.event_type_id).first()
-        if not event_type:
+        if log_in.event_type_id not in reference.event_types:
+            metrics.count_log_rejected(atm_id, log_in.log_level_id, "unknown_event_type")
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"EventType with id {log_in.event_type_id} not found.")
     
     try:
-        created_log = crud.create_atm_log(db=db, log=log_in, atm_id=atm_id)
-        return created_log
+        created_log = await crud_async.create_atm_log(db=db, log=log_in, atm_id=atm_id)
+        return refdata.log_to_schema(created_log, reference)
     except ValueError as e: # Например, если crud.create_atm_log выбрасывает ValueError
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e: # Общий обработчик на случай других ошибок CRUD
         # Логирование ошибки на сервере было бы здесь полезно
         print(f"Error in create_log_for_specific_atm: {e}")
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal server error while creating log.")
\ No newline at end of file
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal server error while creating log.")
+
+
+async def _enqueue_log(
+        atm_id: int, log_in: schemas.ATMLogCreate, db: AsyncSession, session_factory: async_sessionmaker
+) -> JSONResponse:
+    # Справочники проверяем по кешу; существование банкомата - писатель (без запроса на каждый лог)
+    reference = await refdata.get_reference_data_async(db)
+    if log_in.log_level_id not in reference.log_levels:
+        metrics.count_log_rejected(None, None, "unknown_log_level")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"LogLevel with id {log_in.log_level_id} not found.")
+    if log_in.event_type_id is not None and log_in.event_type_id not in reference.event_types:
+        metrics.count_log_rejected(None, log_in.log_level_id, "unknown_event_type")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"EventType with id {log_in.event_type_id} not found.")
+
+    # Соединение запроса возвращаем в пул до ожидания: иначе ждущие запросы займут пул, нужный писателю
+    await db.close()
+
+    wait_for_flush = settings.LOG_INGEST_DURABILITY == "flush"
+    ingest_queue.queue.ensure_started(session_factory)
+    try:
+        future = ingest_queue.queue.submit(
+            schemas.ATMLogBatchItem(**log_in.model_dump(), atm_id=atm_id), wait_for_flush=wait_for_flush
+        )
+    except ingest_queue.IngestQueueFull:
+        metrics.count_log_rejected(None, log_in.log_level_id, "queue_full")  # Банкомат проверит писатель
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Ingest queue is full, retry later",
+            headers={"Retry-After": "1"}
+        )
+
+    log_id = None
+    if future is not None:
+        try:
+            log_id, error = await future
+        except ingest_queue.IngestWriteFailed:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Log storage is temporarily unavailable, retry later",
+                headers={"Retry-After": "1"}
+            )
+        if error is not None:
+            not_found = error.startswith("ATM with id")
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND if not_found else status.HTTP_400_BAD_REQUEST, detail=error
+            )
+    queued = schemas.ATMLogQueued(
+        status="stored" if future is not None else "queued", id=log_id, queue_depth=ingest_queue.queue.depth()
+    )
+    return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=queued.model_dump())
+
+
+@router.get("/logs/queue", response_model=schemas.IngestQueueStats)
+async def read_ingest_queue_stats(
+        current_user_with_admin_rights: models.User = Depends(get_current_admin_or_superuser)
+):
+    """Глубина очереди приема и счетчики писателя (LOG_INGEST_MODE=queued)."""
+    return ingest_queue.queue.stats()
+
+
+# --- Пакетный прием логов (защищен API-ключом) ---
+NDJSON_MEDIA_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+
+def _parse_batch_record(raw) -> Tuple[Optional[schemas.ATMLogBatchItem], Optional[str]]:
+    """Валидирует одну запись пачки. Возвращает (запись, None) или (None, текст ошибки)."""
+    try:
+        return schemas.ATMLogBatchItem.model_validate(raw), None
+    except ValidationError as e:
+        error = "; ".join(
+            f"{'.'.join(str(part) for part in err['loc']) or 'record'}: {err['msg']}" for err in e.errors()
+        )
+        return None, error
+
+
+async def _iter_ndjson_records(request: Request) -> AsyncIterator[bytes]:
+    """Читает тело запроса потоком и отдает непустые строки NDJSON по одной."""
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if buffer.strip():
+        yield buffer
+
+
+@router.post("/logs/batch",
+             response_model=schemas.ATMLogBatchResult,
+             dependencies=[Depends(get_api_key)])
+async def create_logs_batch(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Пакетный прием логов, в том числе от разных банкоматов в одном запросе.
+    Тело - JSON-массив записей ATMLogBatchItem (ATMLogCreate + atm_id) либо NDJSON
+    (Content-Type: application/x-ndjson), по одной записи на строку.
+    Записи вставляются пачками по LOG_BATCH_CHUNK_SIZE (один INSERT и один commit на пачку).
+    Для каждой записи возвращается accepted/rejected, чтобы отправитель повторил только отказы.
+    """
+    results: List[schemas.ATMLogBatchItemResult] = []
+    pending: List[Tuple[int, schemas.ATMLogBatchItem]] = []
+
+    def reject(index: int, error: str):
+        results.append(schemas.ATMLogBatchItemResult(index=index, status="rejected", error=error))
+
+    def reject_invalid(index: int, error: str):
+        # Значения из невалидной записи в метки не берем: это произвольный ввод отправителя
+        metrics.count_log_rejected(None, None, "invalid")
+        reject(index, error)
+
+    async def accept_or_reject(index: int, raw):
+        item, error = _parse_batch_record(raw)
+        if error is not None:
+            reject_invalid(index, error)
+        else:
+            pending.append((index, item))
+        if len(pending) >= settings.LOG_BATCH_CHUNK_SIZE:
+            await flush()
+
+    async def flush():
+        if not pending:
+            return
+        outcomes = await crud_async.create_atm_logs_bulk(db, [item for _, item in pending])
+        for (index, _), (log_id, error) in zip(pending, outcomes):
+            if error is None:
+                results.append(schemas.ATMLogBatchItemResult(index=index, status="accepted", id=log_id))
+            else:
+                reject(index, error)
+        pending.clear()
+
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type in NDJSON_MEDIA_TYPES:
+        index = 0
+        async for line in _iter_ndjson_records(request):
+            if index >= settings.LOG_BATCH_MAX_SIZE:
+                reject_invalid(index, f"Batch size limit of {settings.LOG_BATCH_MAX_SIZE} records exceeded.")
+            else:
+                try:
+                    raw = json.loads(line)
+                except json.JSONDecodeError as e:
+                    reject_invalid(index, f"Invalid JSON: {e.msg}")
+                else:
+                    await accept_or_reject(index, raw)
+            index += 1
+    else:
+        try:
+            records = json.loads(await request.body())
+        except json.JSONDecodeError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid JSON: {e.msg}")
+        if not isinstance(records, list):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Request body must be a JSON array of log records.")
+        if len(records) > settings.LOG_BATCH_MAX_SIZE:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Batch size limit of {settings.LOG_BATCH_MAX_SIZE} records exceeded."
+            )
+        for index, raw in enumerate(records):
+            await accept_or_reject(index, raw)
+    await flush()
+
+    results.sort(key=lambda r: r.index)
+    accepted = sum(1 for r in results if r.status == "accepted")
+    return schemas.ATMLogBatchResult(accepted=accepted, rejected=len(results) - accepted, results=results)
\ No newline at end of file
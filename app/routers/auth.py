@@ -1,58 +1,91 @@
 # app/routers/auth.py
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
 
-import crud, schemas, models  # Убедись, что models импортирован, если он нужен для current_user типа
-from database import get_db
-from security import create_access_token, verify_password
+import crud_async, schemas, models, throttle  # Убедись, что models импортирован, если он нужен для current_user типа
+from database import get_async_db
+from security import create_access_token, verify_password_async, PasswordHashingBusy
 from config import settings
 from deps import get_current_user  # Наша зависимость для проверки токена
 
 router = APIRouter()
 
 
+def _hashing_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Сервис перегружен, повторите попытку позже",
+        headers={"Retry-After": "1"},
+    )
+
+
 @router.post("/signup", response_model=schemas.User, status_code=status.HTTP_201_CREATED)
 async def signup_new_user(
         user_in: schemas.UserCreate,
-        db: Session = Depends(get_db)
+        request: Request,
+        db: AsyncSession = Depends(get_async_db)
 ):
     # ... (существующий код signup)
-    db_user_by_email = crud.get_user_by_email(db, email=user_in.email)
+    ip_key = throttle.ip_key(request)
+    throttle.ensure_not_throttled((ip_key, settings.LOGIN_MAX_ATTEMPTS_PER_IP))
+
+    db_user_by_email = await crud_async.get_user_by_email(db, email=user_in.email)
     if db_user_by_email:
+        throttle.login_attempts.hit(ip_key)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Почта уже зарегистрирована"
         )
 
-    db_user_by_username = crud.get_user_by_username(db, username=user_in.username)
+    db_user_by_username = await crud_async.get_user_by_username(db, username=user_in.username)
     if db_user_by_username:
+        throttle.login_attempts.hit(ip_key)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Имя пользователя занято"
         )
 
-    created_user = crud.create_user(db=db, user=user_in)
+    try:
+        created_user = await crud_async.create_user(db=db, user=user_in)
+    except PasswordHashingBusy:
+        raise _hashing_busy()
     return created_user
 
 
 @router.post("/login/token", response_model=schemas.Token)
 async def login_for_access_token(
+        request: Request,
         form_data: OAuth2PasswordRequestForm = Depends(),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
-    user = crud.get_user_by_username(db, username=form_data.username)
-    if not user or not verify_password(form_data.password, user.password_hash):
+    # Лимиты проверяются до запроса к БД и bcrypt (см. throttle.py)
+    username_key, ip_key = throttle.username_key(form_data.username), throttle.ip_key(request)
+    throttle.ensure_not_throttled(
+        (username_key, settings.LOGIN_MAX_FAILURES_PER_USERNAME), (ip_key, settings.LOGIN_MAX_ATTEMPTS_PER_IP)
+    )
+
+    user = await crud_async.get_user_by_username(db, username=form_data.username)
+    try:
+        password_ok = user is not None and await verify_password_async(form_data.password, user.password_hash)
+    except PasswordHashingBusy:
+        raise _hashing_busy()
+    if not password_ok:
+        throttle.login_attempts.hit(username_key)
+        throttle.login_attempts.hit(ip_key)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Неправильное имя пользователя или пароль",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+    throttle.login_attempts.reset(username_key)
+
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)  # Используем из settings
     access_token = create_access_token(
-        data={"sub": user.username, "user_id": user.id},
+        # role и ver позволяют проверять токен без запроса к БД (см. usercache.py)
+        data={"sub": user.username, "user_id": user.id, "role": user.role, "ver": user.token_version or 0},
         expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
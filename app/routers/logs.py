@@ -1,28 +1,35 @@
 # app/routers/logs.py
-from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+import asyncio
+import json
+
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response, Header
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from sqlalchemy.orm import Session
-from typing import List, Optional
-from datetime import datetime
+from typing import AsyncIterator, List, Literal, Optional
+from datetime import datetime, timezone
 
-import crud, models, schemas
-from database import get_db
-from deps import get_current_user  # Наша зависимость
+import crud, crud_async, models, schemas, refdata, pagination, counts, search, export, broadcast, caching, histogram
+from config import settings
+from database import get_db, get_async_db, get_async_sessionmaker
+from deps import get_current_user, get_current_user_header_or_query  # Наша зависимость
 from fastapi_cache.decorator import cache
 
 router = APIRouter()
 @router.get("/levels/", response_model=List[schemas.LogLevel])
-@cache(expire=3600)
+@cache(expire=3600, key_builder=caching.tagged_key_builder(caching.REFDATA_TAG))
 async def read_log_levels(
     db: Session = Depends(get_db),
 ):
     """
     Получение списка всех уровней логов.
     """
-    log_levels = crud.get_log_levels(db=db)
-    return log_levels
+    return refdata.get_reference_data(db).sorted_log_levels()
 
 @router.get("/event_types/", response_model=List[schemas.EventType])
-@cache(expire=3600)
+@cache(expire=3600, key_builder=caching.tagged_key_builder(caching.REFDATA_TAG))
 async def read_event_types(
     db: Session = Depends(get_db),
     # current_user: models.User = Depends(get_current_user) # Раскомментируй, если нужна аутентификация
@@ -30,36 +37,35 @@ async def read_event_types(
     """
     Получение списка всех типов событий.
     """
-    event_types = crud.get_event_types(db=db)
-    return event_types
+    return refdata.get_reference_data(db).sorted_event_types()
 
 @router.post("/atms/{atm_id}/logs/", response_model=schemas.ATMLog, status_code=status.HTTP_201_CREATED)
 async def create_log_for_atm(
         atm_id: int,
         log_in: schemas.ATMLogCreate,
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_async_db),
         current_user: models.User = Depends(get_current_user)  # Любой аутентифицированный пользователь
 ):
     """
     Создание новой записи лога для указанного банкомата.
     """
-    db_atm = crud.get_atm(db, atm_id=atm_id)
+    db_atm = await crud_async.get_atm(db, atm_id=atm_id)
     if not db_atm:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="ATM not found")
 
-    # Дополнительные проверки для log_level_id и event_type_id (если ID не существует)
-    log_level = db.query(models.LogLevel).filter(models.LogLevel.id == log_in.log_level_id).first()
-    if not log_level:
+    # Дополнительные проверки для log_level_id и event_type_id (если ID не существует) - по кешу справочников
+    reference = await refdata.get_reference_data_async(db)
+    if log_in.log_level_id not in reference.log_levels:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail=f"LogLevel with id {log_in.log_level_id} not found.")
 
     if log_in.event_type_id is not None:
-        event_type = db.query(models.EventType).filter(models.EventType.id == log_in.event_type_id).first()
-        if not event_type:
+        if log_in.event_type_id not in reference.event_types:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                                 detail=f"EventType with id {log_in.event_type_id} not found.")
 
-    return crud.create_atm_log(db=db, log=log_in, atm_id=atm_id)
+    created_log = await crud_async.create_atm_log(db=db, log=log_in, atm_id=atm_id)
+    return refdata.log_to_schema(created_log, reference)
 
 
 @router.get("/", response_model=List[schemas.ATMLog])
@@ -74,65 +80,360 @@ async def read_logs(
         start_time: Optional[datetime] = Query(None, description="Filter logs from this time (ISO format)"),
         end_time: Optional[datetime] = Query(None, description="Filter logs up to this time (ISO format)"),
         message: Optional[str] = Query(None, description="Search keyword in log message"),
+        is_acknowledged: Optional[bool] = Query(None, description="Filter alerts by acknowledgement (false = open alerts)"),
+        q: Optional[str] = Query(None, description="Full-text search in message: all words must match, 'jam*' matches by prefix"),
+        payload_contains: Optional[str] = Query(
+            None, description='JSON object the payload must contain, e.g. {"error_code": "CJ-001"}'
+        ),
         # Изменим параметр сортировки для соответствия фронтенду (если нужно)
         # или оставим sort_desc и не будем использовать sort_by/sort_order с фронта
-        sort_by: Optional[str] = Query("event_timestamp", description="Field to sort by"), # Пример, если нужна серверная сортировка
+        sort_by: Optional[str] = Query("event_timestamp", description="Field to sort by: 'event_timestamp' or 'relevance' (with q)"), # Пример, если нужна серверная сортировка
         sort_order: Optional[str] = Query("desc", description="Sort order: 'asc' or 'desc'"), # Пример
         # sort_desc: bool = Query(True, description="Sort by event_timestamp descending"), # Старый вариант
-        db: Session = Depends(get_db),
+        pagination_mode: Literal["offset", "cursor"] = Query(
+            "offset", alias="pagination", description="'offset' (skip/limit) or 'cursor' (keyset by event_timestamp, id)"
+        ),
+        cursor: Optional[str] = Query(None, description="Opaque cursor from X-Next-Cursor / X-Prev-Cursor (implies cursor pagination)"),
+        count: Optional[Literal["exact", "cached", "estimated", "none"]] = Query(
+            None, description="How to compute X-Total-Count; 'none' skips it (overrides X-Count-Mode header)"
+        ),
+        count_mode_header: Optional[Literal["exact", "cached", "estimated", "none"]] = Header(None, alias="X-Count-Mode"),
+        db: AsyncSession = Depends(get_async_db),
         current_user: models.User = Depends(get_current_user)
 ):
     """
     Получение списка логов с пагинацией и расширенной фильтрацией.
+    В режиме курсоров (pagination=cursor или передан cursor) skip игнорируется, а ссылки
+    на соседние страницы возвращаются в заголовках X-Next-Cursor / X-Prev-Cursor.
+    Способ подсчета X-Total-Count выбирается параметром count или заголовком X-Count-Mode (см. counts.py).
+    q - полнотекстовый поиск по message (по индексу, в отличие от message), payload_contains - фильтр
+    по содержимому payload (см. search.py); sort_by=relevance упорядочивает результаты поиска по релевантности.
     """
-    # Получаем общее количество для X-Total-Count
-    total_count = crud.get_atm_logs_count(
-        db, atm_id=atm_id, log_level_id=log_level_id,
-        event_type_id=event_type_id, is_alert=is_alert, start_time=start_time,
-        end_time=end_time, message_keyword=message
+    sort_by_timestamp_desc = (sort_by == "event_timestamp" and sort_order == "desc")  # упрощенный вариант для старого crud
+    try:
+        search_terms = search.parse_search_query(q) if q is not None else None
+        payload_pattern = search.parse_payload_filter(payload_contains) if payload_contains is not None else None
+    except search.InvalidSearchQuery as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    order_by_relevance = sort_by == "relevance"
+    if order_by_relevance:
+        if search_terms is None:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="sort_by=relevance requires q.")
+        if cursor is not None or pagination_mode == "cursor":
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail="Relevance ordering is not supported with cursor pagination.")
+        sort_by_timestamp_desc = True  # При равной релевантности - сначала новые
+
+    decoded_cursor = None
+    if cursor:
+        try:
+            decoded_cursor = pagination.decode_cursor(cursor, sort_by_timestamp_desc, key_length=2)
+        except pagination.InvalidCursorError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    # Получаем общее количество для X-Total-Count (точно, из кеша или оценкой планировщика)
+    filters = dict(
+        atm_id=atm_id, log_level_id=log_level_id, event_type_id=event_type_id, is_alert=is_alert,
+        start_time=start_time, end_time=end_time, message_keyword=message, is_acknowledged=is_acknowledged,
+        search_terms=search_terms, payload_contains=payload_pattern
     )
-    response.headers["X-Total-Count"] = str(total_count)
+    count_mode = counts.resolve_mode(count, count_mode_header)
+
+    # Первые страницы без текстового поиска (то, что постоянно обновляет дашборд) берем из общего кеша
+    cache_key = None
+    if decoded_cursor is None and skip == 0 and message is None and search_terms is None and payload_pattern is None:
+        cache_key, cached = await caching.lookup(
+            "logs",
+            dict(filters, limit=limit, sort_by=sort_by, sort_desc=sort_by_timestamp_desc,
+                 pagination=pagination_mode, count=count_mode),
+            caching.log_list_tags(atm_id)
+        )
+        if cached is not None:
+            headers, body = cached.split(b"\n", 1)
+            return Response(content=body, media_type="application/json",
+                            headers={**json.loads(headers), caching.CACHE_STATUS_HEADER: "HIT"})
+
+    total_count = await counts.get_total_count(
+        db,
+        mode=count_mode,
+        cache_key=counts.make_cache_key("atm_logs", filters),
+        exact_count=lambda: crud_async.get_atm_logs_count(db, **filters),
+        estimate_query=select(models.ATMLog.id).where(*crud.atm_log_filter_criteria(**filters))
+    )
+    response.headers.update(counts.count_headers(total_count))
     # Важно для CORS, чтобы фронтенд мог прочитать этот заголовок
-    response.headers["Access-Control-Expose-Headers"] = "X-Total-Count"
+    response.headers["Access-Control-Expose-Headers"] = pagination.EXPOSED_HEADERS
 
 
     # Пример логики для серверной сортировки, если решишь ее использовать:
     # sort_desc_param = True if sort_order == "desc" else False
     # sort_by_param = sort_by # тут нужна валидация поля sort_by
 
-    logs = crud.get_atm_logs(
-        db, skip=skip, limit=limit, atm_id=atm_id, log_level_id=log_level_id,
-        event_type_id=event_type_id, is_alert=is_alert, start_time=start_time,
-        end_time=end_time, message_keyword=message,
-        # sort_by_field=sort_by_param, # передаем поле для сортировки
-        # sort_desc=sort_desc_param # передаем направление
-        sort_by_timestamp_desc=(sort_by == "event_timestamp" and sort_order == "desc") # упрощенный вариант для старого crud
+    if cursor is not None or pagination_mode == "cursor":
+        page = await crud_async.get_atm_logs_page(
+            db, limit=limit, cursor=decoded_cursor, atm_id=atm_id, log_level_id=log_level_id,
+            event_type_id=event_type_id, is_alert=is_alert, start_time=start_time,
+            end_time=end_time, message_keyword=message, is_acknowledged=is_acknowledged,
+            search_terms=search_terms, payload_contains=payload_pattern,
+            sort_by_timestamp_desc=sort_by_timestamp_desc
+        )
+        response.headers.update(pagination.page_headers(page))
+        logs = page.items
+    else:
+        logs = await crud_async.get_atm_logs(
+            db, skip=skip, limit=limit, atm_id=atm_id, log_level_id=log_level_id,
+            event_type_id=event_type_id, is_alert=is_alert, start_time=start_time,
+            end_time=end_time, message_keyword=message, is_acknowledged=is_acknowledged,
+            search_terms=search_terms, payload_contains=payload_pattern,
+            # sort_by_field=sort_by_param, # передаем поле для сортировки
+            # sort_desc=sort_desc_param # передаем направление
+            sort_by_timestamp_desc=sort_by_timestamp_desc,
+            order_by_relevance=order_by_relevance
+        )
+    # Вложенные log_level/event_type берем из кеша справочников, без lazy load на каждую строку
+    reference = await refdata.get_reference_data_async(db, logs)
+    items = [refdata.log_to_schema(log, reference) for log in logs]
+    if cache_key is None:
+        return items
+
+    # Сериализуем один раз: тело уходит и клиенту, и в кеш вместе с заголовками (X-Total-Count, курсоры)
+    body = json.dumps(jsonable_encoder(items)).encode()
+    headers = {name: value for name, value in response.headers.items() if name.lower() != "content-length"}
+    await caching.store(cache_key, json.dumps(headers).encode() + b"\n" + body, settings.LOGS_CACHE_TTL_SECONDS)
+    return Response(content=body, media_type="application/json",
+                    headers={**headers, caching.CACHE_STATUS_HEADER: "MISS"})
+
+
+@router.get("/export")
+async def export_logs(
+        export_format: Literal["ndjson", "csv"] = Query("ndjson", alias="format", description="'ndjson' or 'csv'"),
+        atm_id: Optional[int] = Query(None, description="Filter by ATM ID"),
+        log_level_id: Optional[int] = Query(None, description="Filter by LogLevel ID"),
+        event_type_id: Optional[int] = Query(None, description="Filter by EventType ID"),
+        is_alert: Optional[bool] = Query(None, description="Filter by alert status"),
+        start_time: Optional[datetime] = Query(None, description="Filter logs from this time (ISO format)"),
+        end_time: Optional[datetime] = Query(None, description="Filter logs up to this time (ISO format)"),
+        message: Optional[str] = Query(None, description="Search keyword in log message"),
+        is_acknowledged: Optional[bool] = Query(None, description="Filter alerts by acknowledgement (false = open alerts)"),
+        q: Optional[str] = Query(None, description="Full-text search in message: all words must match, 'jam*' matches by prefix"),
+        payload_contains: Optional[str] = Query(
+            None, description='JSON object the payload must contain, e.g. {"error_code": "CJ-001"}'
+        ),
+        sort_order: Literal["asc", "desc"] = Query("asc", description="Order by event_timestamp: 'asc' or 'desc'"),
+        session_factory: async_sessionmaker = Depends(get_async_sessionmaker),
+        current_user: models.User = Depends(get_current_user)
+):
+    """
+    Выгрузка всех логов, подходящих под фильтры read_logs, в NDJSON или CSV.
+    Ответ отдается потоком по мере чтения из серверного курсора, без пагинации и X-Total-Count (см. export.py).
+    """
+    try:
+        search_terms = search.parse_search_query(q) if q is not None else None
+        payload_pattern = search.parse_payload_filter(payload_contains) if payload_contains is not None else None
+    except search.InvalidSearchQuery as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    filters = dict(
+        atm_id=atm_id, log_level_id=log_level_id, event_type_id=event_type_id, is_alert=is_alert,
+        start_time=start_time, end_time=end_time, message_keyword=message, is_acknowledged=is_acknowledged,
+        search_terms=search_terms, payload_contains=payload_pattern
+    )
+    return StreamingResponse(
+        export.stream_logs(session_factory, export_format, filters, sort_by_timestamp_desc=(sort_order == "desc")),
+        media_type=export.EXPORT_FORMATS[export_format],
+        headers={"Content-Disposition": f'attachment; filename="atm_logs.{export_format}"'}
+    )
+
+
+@router.get("/histogram", response_model=schemas.LogHistogram)
+async def read_logs_histogram(
+        bucket: Literal["1m", "1h", "1d"] = Query("1h", description="Bucket size: '1m', '1h' or '1d' (UTC)"),
+        group_by: Optional[Literal["level", "event_type", "atm"]] = Query(None, description="Split counts by level, event type or ATM"),
+        atm_id: Optional[int] = Query(None, description="Filter by ATM ID"),
+        log_level_id: Optional[int] = Query(None, description="Filter by LogLevel ID"),
+        event_type_id: Optional[int] = Query(None, description="Filter by EventType ID"),
+        is_alert: Optional[bool] = Query(None, description="Filter by alert status"),
+        start_time: Optional[datetime] = Query(None, description="Filter logs from this time (ISO format)"),
+        end_time: Optional[datetime] = Query(None, description="Filter logs up to this time (ISO format)"),
+        message: Optional[str] = Query(None, description="Search keyword in log message"),
+        is_acknowledged: Optional[bool] = Query(None, description="Filter alerts by acknowledgement (false = open alerts)"),
+        q: Optional[str] = Query(None, description="Full-text search in message: all words must match, 'jam*' matches by prefix"),
+        payload_contains: Optional[str] = Query(
+            None, description='JSON object the payload must contain, e.g. {"error_code": "CJ-001"}'
+        ),
+        db: AsyncSession = Depends(get_async_db),
+        current_user: models.User = Depends(get_current_user)
+):
+    """
+    Число логов, подходящих под фильтры read_logs, по интервалам времени (для графиков).
+    Пустые интервалы не возвращаются. Закрытые часы для 1h/1d берутся из сводок (см. histogram.py).
+    """
+    try:
+        search_terms = search.parse_search_query(q) if q is not None else None
+        payload_pattern = search.parse_payload_filter(payload_contains) if payload_contains is not None else None
+    except search.InvalidSearchQuery as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    filters = dict(
+        atm_id=atm_id, log_level_id=log_level_id, event_type_id=event_type_id, is_alert=is_alert,
+        start_time=start_time, end_time=end_time, message_keyword=message, is_acknowledged=is_acknowledged,
+        search_terms=search_terms, payload_contains=payload_pattern
+    )
+    now = datetime.now(timezone.utc)
+    bucket_count = histogram.bucket_count(bucket, filters, now)
+    if bucket == "1m" and bucket_count is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="start_time is required for bucket=1m")
+    if bucket_count is not None and bucket_count > settings.LOG_HISTOGRAM_MAX_BUCKETS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Time range spans {bucket_count} buckets, the limit is {settings.LOG_HISTOGRAM_MAX_BUCKETS}; use a larger bucket"
+        )
+    return await histogram.get_histogram(db, bucket, group_by, filters, now=now)
+
+
+# --- Массовые операции над алертами (объявлены до /{log_id}/..., иначе "bulk" разбирался бы как log_id) ---
+def _bulk_target(selection: schemas.LogBulkSelection) -> dict:
+    if selection.ids is not None:
+        return dict(log_ids=sorted(set(selection.ids)))
+    f = selection.filter
+    return dict(
+        filters=dict(
+            atm_id=f.atm_id, log_level_id=f.log_level_id, event_type_id=f.event_type_id,
+            start_time=f.start_time, end_time=f.end_time, message_keyword=f.message
+        ),
+        limit=settings.LOG_BULK_UPDATE_MAX_ROWS
+    )
+
+
+async def _bulk_result(db: AsyncSession, selection: schemas.LogBulkSelection, rows: List, skip_reason) -> schemas.LogBulkUpdateResult:
+    updated_ids = sorted(row.id for row in rows)
+    skipped = []
+    if selection.ids is not None:
+        missing = sorted(set(selection.ids) - set(updated_ids))
+        states = await crud_async.get_log_alert_states(db, missing)
+        skipped = [
+            schemas.LogBulkSkipped(id=log_id, reason=skip_reason(states[log_id]) if log_id in states else "not_found")
+            for log_id in missing
+        ]
+    return schemas.LogBulkUpdateResult(
+        updated=len(updated_ids),
+        updated_ids=updated_ids,
+        skipped=skipped,
+        has_more=selection.filter is not None and len(updated_ids) >= settings.LOG_BULK_UPDATE_MAX_ROWS
+    )
+
+
+@router.patch("/bulk/acknowledge", response_model=schemas.LogBulkUpdateResult)
+async def acknowledge_log_alerts_bulk(
+        selection: schemas.LogBulkAcknowledge,
+        db: AsyncSession = Depends(get_async_db),
+        current_user: models.User = Depends(get_current_user)
+):
+    """
+    Подтверждение алертов списком ID или по фильтру (например, все открытые алерты банкомата до момента T).
+    Уже подтвержденные и не-алерты пропускаются; по фильтру за раз обрабатывается до LOG_BULK_UPDATE_MAX_ROWS.
+    """
+    rows = await crud_async.acknowledge_alerts_bulk(db, user_id=current_user.id, **_bulk_target(selection))
+    return await _bulk_result(
+        db, selection, rows,
+        lambda state: "not_alert" if not state[0] else "already_acknowledged"
+    )
+
+
+@router.patch("/bulk/alert_status", response_model=schemas.LogBulkUpdateResult)
+async def set_logs_alert_status_bulk(
+        selection: schemas.LogBulkAlertStatus,
+        db: AsyncSession = Depends(get_async_db),
+        current_user: models.User = Depends(get_current_user)
+):
+    """Установка или снятие флага 'is_alert' списку логов или логам по фильтру."""
+    rows = await crud_async.update_alert_status_bulk(db, is_alert=selection.is_alert, **_bulk_target(selection))
+    return await _bulk_result(db, selection, rows, lambda state: "unchanged")
+
+
+SSE_MAX_EVENTS_PER_CHUNK = 100
+
+
+def _sse_log_event(event: broadcast.LogEvent) -> str:
+    return f"id: {event.id}\nevent: log\ndata: {event.data}\n\n"
+
+
+async def _sse_events(subscription: broadcast.Subscription) -> AsyncIterator[str]:
+    """События SSE из подписки; раз в LOG_STREAM_HEARTBEAT_SECONDS - комментарий, чтобы прокси не рвали соединение."""
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.get(), timeout=settings.LOG_STREAM_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            # Накопившиеся события отдаем одним куском
+            events = [event]
+            while event is not broadcast.DROPPED and not subscription.queue.empty() \
+                    and len(events) < SSE_MAX_EVENTS_PER_CHUNK:
+                event = subscription.queue.get_nowait()
+                events.append(event)
+            chunk = "".join(_sse_log_event(e) for e in events if e is not broadcast.DROPPED)
+            if event is broadcast.DROPPED:
+                yield chunk + 'event: dropped\ndata: {"reason": "slow consumer"}\n\n'
+                return
+            yield chunk
+    finally:
+        broadcast.bus.unsubscribe(subscription)
+
+
+@router.get("/stream")
+async def stream_new_logs(
+        atm_id: Optional[List[int]] = Query(None, description="Only these ATM IDs (repeat the parameter for several)"),
+        log_level_id: Optional[List[int]] = Query(None, description="Only these LogLevel IDs"),
+        is_alert: Optional[bool] = Query(None, description="Filter by alert status"),
+        current_user: models.User = Depends(get_current_user_header_or_query)
+):
+    """
+    Поток новых логов (Server-Sent Events) вместо периодического опроса списка.
+    Каждый принятый лог, подходящий под фильтры, приходит событием log (data - JSON как в read_logs, id - id лога).
+    Если клиент не успевает читать, приходит событие dropped и поток закрывается: нужно переподключиться
+    и догрузить пропущенное через read_logs. Токен - в заголовке Authorization или параметре access_token.
+    """
+    log_filter = broadcast.LogFilter(
+        atm_ids=frozenset(atm_id or ()), log_level_ids=frozenset(log_level_id or ()), is_alert=is_alert
+    )
+    try:
+        subscription = broadcast.bus.subscribe(log_filter)
+    except OverflowError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e),
+                            headers={"Retry-After": "5"})
+    return StreamingResponse(
+        _sse_events(subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}  # Без буферизации в nginx
     )
-    return logs
 
 
 @router.get("/{log_id}", response_model=schemas.ATMLog)
 async def read_log_by_id(
         log_id: int,
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_async_db),
         current_user: models.User = Depends(get_current_user)
 ):
     """
     Получение информации о конкретной записи лога.
     """
-    db_log = crud.get_atm_log(db, log_id=log_id)
+    db_log = await crud_async.get_atm_log(db, log_id=log_id)
     if db_log is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Log entry not found")
-    return db_log
+    return refdata.log_to_schema(db_log, await refdata.get_reference_data_async(db, [db_log]))
 
 
 @router.patch("/{log_id}/acknowledge", response_model=schemas.ATMLog)
 async def acknowledge_log_alert(
         log_id: int,
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_async_db),
         current_user: models.User = Depends(get_current_user)
 ):
-    db_log = crud.get_atm_log(db, log_id=log_id)
+    db_log = await crud_async.get_atm_log(db, log_id=log_id)
     if db_log is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Log entry not found")
     if not db_log.is_alert:  # Проверка здесь
@@ -140,21 +441,26 @@ async def acknowledge_log_alert(
     if db_log.acknowledged_by_user_id is not None:  # Проверка, что еще не подтвержден
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Alert already acknowledged")
 
-    return crud.acknowledge_alert(db=db, db_log=db_log, user_id=current_user.id)
+    try:
+        acknowledged_log = await crud_async.acknowledge_alert(db=db, db_log=db_log, user_id=current_user.id)
+    except ValueError:  # Параллельный запрос подтвердил алерт после проверки выше
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Alert already acknowledged")
+    return refdata.log_to_schema(acknowledged_log, await refdata.get_reference_data_async(db, [acknowledged_log]))
 
 
 @router.patch("/{log_id}/alert_status", response_model=schemas.ATMLog)
 async def set_log_alert_status(
         log_id: int,
         set_alert: bool = Query(..., alias="isAlert", description="Set to true to mark as alert, false to unmark"),
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_async_db),
         current_user: models.User = Depends(get_current_user)  # Возможно, только админ или спец. роль?
 ):
     """
     Установка или снятие флага 'is_alert' для записи лога.
     """
-    db_log = crud.get_atm_log(db, log_id=log_id)
+    db_log = await crud_async.get_atm_log(db, log_id=log_id)
     if db_log is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Log entry not found")
 
-    return crud.update_log_alert_status(db=db, db_log=db_log, is_alert=set_alert)
\ No newline at end of file
+    updated_log = await crud_async.update_log_alert_status(db=db, db_log=db_log, is_alert=set_alert)
+    return refdata.log_to_schema(updated_log, await refdata.get_reference_data_async(db, [updated_log]))
\ No newline at end of file
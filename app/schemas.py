@@ -1,6 +1,6 @@
 # app/schemas.py
-from pydantic import BaseModel, EmailStr, Field, field_validator
-from typing import Optional, List
+from pydantic import BaseModel, EmailStr, Field, field_validator, model_validator
+from typing import Dict, Optional, List
 from datetime import datetime
 from typing import Literal
 import re
@@ -153,6 +153,37 @@ class ATM(ATMBase):  # Схема для чтения ATM
         from_attributes = True
 
 
+class ATMSummary(BaseModel):  # Сводка по банкомату (GET /atms/summary, таблицы сводок rollups.py)
+    atm_id: int
+    atm_uid: str
+    location_description: Optional[str] = None
+    status: ATMStatus
+    unacknowledged_alerts: int = 0
+    last_event_at: Optional[datetime] = None
+    last_error_at: Optional[datetime] = None
+    last_error_log_id: Optional[int] = None
+    last_error_message: Optional[str] = None
+    total_logs: int = 0
+    log_counts: Dict[str, int] = {}  # Число логов по имени уровня (DEBUG, INFO, ...)
+
+
+class ATMDeletionJob(BaseModel):  # Фоновое удаление банкомата (atm_deletion.py)
+    job_id: str
+    atm_id: int
+    archive: bool
+    status: Literal["queued", "running", "completed", "failed"]
+    total_logs: Optional[int] = None  # Число логов на момент старта
+    deleted_logs: int = 0
+    archived_logs: int = 0
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
 # --- Схемы для ATMLog ---
 class ATMLogBase(BaseModel):
     event_timestamp: datetime
@@ -169,6 +200,72 @@ class ATMLogCreate(ATMLogBase):
     pass
 
 
+class ATMLogBatchItem(ATMLogCreate):
+    # В пакетном приеме одна пачка может содержать логи разных банкоматов
+    atm_id: int
+
+
+class ATMLogBatchItemResult(BaseModel):
+    index: int  # Позиция записи во входном массиве / строке NDJSON (с нуля)
+    status: Literal["accepted", "rejected"]
+    id: Optional[int] = None  # ID созданного лога, если запись принята
+    error: Optional[str] = None  # Причина отказа, если запись отклонена
+
+
+class ATMLogBatchResult(BaseModel):
+    accepted: int
+    rejected: int
+    results: List[ATMLogBatchItemResult]
+
+
+class ATMLogQueued(BaseModel):  # Ответ 202 при LOG_INGEST_MODE=queued (ingest_queue.py)
+    status: Literal["queued", "stored"]  # stored - пачка уже записана (LOG_INGEST_DURABILITY=flush)
+    id: Optional[int] = None
+    queue_depth: int
+
+
+class IngestQueueStats(BaseModel):
+    mode: str
+    durability: str
+    running: bool
+    depth: int
+    capacity: int
+    enqueued: int
+    written: int
+    rejected: int
+    flushes: int
+    last_flush_rows: int
+    last_flush_ms: float
+
+
+class SQLStatementProfile(BaseModel):  # Запрос к БД в профиле (profiling.py)
+    statement: str
+    parameters: Optional[str] = None
+    duration_ms: float
+    executemany: bool = False
+    slow: bool = False  # Дольше SQL_SLOW_QUERY_MS
+    plan: Optional[str] = None  # EXPLAIN (ANALYZE, BUFFERS), если включен
+
+    class Config:
+        from_attributes = True
+
+
+class SQLRequestProfile(BaseModel):
+    id: int
+    trigger: Literal["header", "always", "slow"]
+    method: str
+    path: str
+    route: Optional[str] = None
+    status_code: Optional[int] = None
+    started_at: datetime
+    duration_ms: Optional[float] = None
+    db_ms: float
+    statements: List[SQLStatementProfile]
+
+    class Config:
+        from_attributes = True
+
+
 class ATMLogUpdate(BaseModel):  # Для обновления, например, статуса алерта
     message: Optional[str] = None
     payload: Optional[dict] = None
@@ -193,6 +290,68 @@ class ATMLog(ATMLogBase):  # Схема для чтения лога
         from_attributes = True
 
 
+class LogHistogramBucket(BaseModel):
+    bucket_start: datetime  # Начало интервала (UTC)
+    group_id: Optional[int] = None  # ID уровня / типа события / банкомата при group_by
+    group_name: Optional[str] = None  # Имя уровня или типа события
+    count: int
+
+
+class LogHistogram(BaseModel):  # GET /logs/histogram (histogram.py)
+    bucket: Literal["1m", "1h", "1d"]
+    group_by: Optional[Literal["level", "event_type", "atm"]] = None
+    source: Literal["rollup", "raw"]  # rollup - закрытые часы взяты из сводок atm_log_rollups
+    buckets: List[LogHistogramBucket]
+
+
+# --- Массовые операции над логами (PATCH /logs/acknowledge, /logs/alert_status) ---
+class LogBulkFilter(BaseModel):
+    atm_id: Optional[int] = None
+    log_level_id: Optional[int] = None
+    event_type_id: Optional[int] = None
+    start_time: Optional[datetime] = None
+    end_time: Optional[datetime] = None
+    message: Optional[str] = None  # Подстрока сообщения (как параметр message в GET /logs/)
+
+    @model_validator(mode="after")
+    def require_condition(self):
+        if all(value is None for value in self.model_dump().values()):
+            raise ValueError("Filter must set at least one condition")
+        return self
+
+
+class LogBulkSelection(BaseModel):
+    """Логи для массовой операции: список ID или фильтр (ровно одно из двух)."""
+    ids: Optional[List[int]] = Field(None, min_length=1, max_length=10000)
+    filter: Optional[LogBulkFilter] = None
+
+    @model_validator(mode="after")
+    def require_one_selector(self):
+        if (self.ids is None) == (self.filter is None):
+            raise ValueError("Specify either 'ids' or 'filter'")
+        return self
+
+
+class LogBulkAcknowledge(LogBulkSelection):
+    pass
+
+
+class LogBulkAlertStatus(LogBulkSelection):
+    is_alert: bool
+
+
+class LogBulkSkipped(BaseModel):
+    id: int
+    reason: Literal["not_found", "not_alert", "already_acknowledged", "unchanged"]
+
+
+class LogBulkUpdateResult(BaseModel):
+    updated: int
+    updated_ids: List[int]
+    skipped: List[LogBulkSkipped] = []  # Только для выбора по ids
+    has_more: bool = False  # По фильтру обновлено LOG_BULK_UPDATE_MAX_ROWS строк - повторите запрос
+
+
 # --- Схемы для токенов (аутентификация) ---
 class Token(BaseModel):
     access_token: str
@@ -202,6 +361,8 @@ class Token(BaseModel):
 class TokenData(BaseModel):  # Для декодирования данных из токена
     username: Optional[str] = None
     user_id: Optional[int] = None  # Добавим user_id для удобства
+    role: Optional[str] = None
+    token_version: Optional[int] = None  # claim "ver", сверяется с users.token_version
 
 class UserRoleUpdate(BaseModel):
     role: Literal["operator", "admin"] = Field(..., description="New role for the user: 'operator' or 'admin'")
\ No newline at end of file
@@ -0,0 +1,154 @@
+# app/search.py
+"""
+Полнотекстовый поиск по message и фильтр по содержимому payload для списка логов.
+
+На PostgreSQL:
+  - поиск: to_tsvector('simple', message) @@ to_tsquery('simple', ...) - по GIN-индексу
+    ix_atm_logs_message_tsv (migrations/0003_log_search.sql); слово с * на конце ищется по префиксу;
+  - ранжирование: ts_rank_cd по тем же tsvector/tsquery;
+  - payload: payload @> '{"error_code": "CJ-001"}'::jsonb - по GIN-индексу ix_atm_logs_payload.
+Словарь 'simple' без стемминга: в логах много кодов и идентификаторов, их нельзя "нормализовать".
+Конфигурация подставляется в SQL литералом, а не параметром - иначе выражение не совпадет с индексом.
+
+На других СУБД (SQLite в тестах) те же условия компилируются в LIKE / json_extract.
+"""
+import json
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, Tuple
+
+from sqlalchemy import Boolean, Float, bindparam
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ColumnElement
+
+TS_CONFIG = "simple"
+MAX_SEARCH_TERMS = 16
+_TERM_RE = re.compile(r"[\w.-]+")
+
+
+class InvalidSearchQuery(ValueError):
+    """Строка поиска или фильтр payload не разбираются."""
+
+
+@dataclass(frozen=True)
+class SearchTerm:
+    text: str
+    prefix: bool  # Искать все слова, начинающиеся с text
+
+
+def parse_search_query(query: str) -> Tuple[SearchTerm, ...]:
+    """
+    Разбирает строку поиска: слова через пробел (все обязательны), "jam*" - поиск по префиксу.
+    Спецсимволы tsquery отбрасываются, так что пользовательский ввод не ломает запрос.
+    """
+    terms = []
+    for token in query.split():
+        prefix = token.endswith("*")
+        for part in _TERM_RE.findall(token.lower()):
+            terms.append(SearchTerm(text=part, prefix=prefix))
+    if not terms:
+        raise InvalidSearchQuery("Search query must contain at least one word.")
+    if len(terms) > MAX_SEARCH_TERMS:
+        raise InvalidSearchQuery(f"Search query is limited to {MAX_SEARCH_TERMS} words.")
+    return tuple(terms)
+
+
+def to_tsquery_text(terms: Tuple[SearchTerm, ...]) -> str:
+    """Текст для to_tsquery: 'card' & 'jam':*"""
+    return " & ".join(f"'{term.text}'" + (":*" if term.prefix else "") for term in terms)
+
+
+def parse_payload_filter(raw: str) -> Dict[str, Any]:
+    """Разбирает JSON-объект для фильтра по payload, например {"error_code": "CJ-001"}."""
+    try:
+        value = json.loads(raw)
+    except ValueError:
+        raise InvalidSearchQuery("payload_contains must be a JSON object.")
+    if not isinstance(value, dict) or not value:
+        raise InvalidSearchQuery("payload_contains must be a non-empty JSON object.")
+    return value
+
+
+# --- Выражения SQL ---
+class MessageMatch(ColumnElement):
+    """message соответствует поисковому запросу."""
+    type = Boolean()
+    inherit_cache = False
+
+    def __init__(self, column, terms: Tuple[SearchTerm, ...]):
+        self.column = column
+        self.terms = terms
+
+
+class MessageRank(ColumnElement):
+    """Релевантность message поисковому запросу (больше - лучше)."""
+    type = Float()
+    inherit_cache = False
+
+    def __init__(self, column, terms: Tuple[SearchTerm, ...]):
+        self.column = column
+        self.terms = terms
+
+
+class PayloadContains(ColumnElement):
+    """payload содержит все пары ключ-значение из образца."""
+    type = Boolean()
+    inherit_cache = False
+
+    def __init__(self, column, pattern: Dict[str, Any]):
+        self.column = column
+        self.pattern = pattern
+
+
+def _tsquery_sql(element, compiler, **kw) -> Tuple[str, str]:
+    column = compiler.process(element.column, **kw)
+    query = compiler.process(bindparam(None, to_tsquery_text(element.terms), unique=True), **kw)
+    return f"to_tsvector('{TS_CONFIG}', {column})", f"to_tsquery('{TS_CONFIG}', {query})"
+
+
+@compiles(MessageMatch, "postgresql")
+def _message_match_pg(element, compiler, **kw):
+    vector, query = _tsquery_sql(element, compiler, **kw)
+    return f"{vector} @@ {query}"
+
+
+@compiles(MessageMatch)
+def _message_match_default(element, compiler, **kw):
+    column = compiler.process(element.column, **kw)
+    conditions = [
+        f"lower({column}) LIKE {compiler.process(bindparam(None, f'%{term.text}%', unique=True), **kw)}"
+        for term in element.terms
+    ]
+    return "(" + " AND ".join(conditions) + ")"
+
+
+@compiles(MessageRank, "postgresql")
+def _message_rank_pg(element, compiler, **kw):
+    vector, query = _tsquery_sql(element, compiler, **kw)
+    return f"ts_rank_cd({vector}, {query})"
+
+
+@compiles(MessageRank)
+def _message_rank_default(element, compiler, **kw):
+    return "0.0"  # Без полнотекстового поиска все совпадения равнозначны (не "0": ORDER BY 0 - номер столбца)
+
+
+@compiles(PayloadContains, "postgresql")
+def _payload_contains_pg(element, compiler, **kw):
+    column = compiler.process(element.column, **kw)
+    pattern = compiler.process(bindparam(None, json.dumps(element.pattern), unique=True), **kw)
+    return f"{column} @> CAST({pattern} AS JSONB)"
+
+
+@compiles(PayloadContains)
+def _payload_contains_default(element, compiler, **kw):
+    # Только ключи верхнего уровня - достаточно для SQLite в тестах
+    column = compiler.process(element.column, **kw)
+    conditions = []
+    for key, value in element.pattern.items():
+        path = compiler.process(bindparam(None, f'$."{key}"', unique=True), **kw)
+        if isinstance(value, (dict, list)):  # json_extract возвращает вложенные значения JSON-текстом
+            value = json.dumps(value, separators=(",", ":"))
+        expected = compiler.process(bindparam(None, value, unique=True), **kw)
+        conditions.append(f"json_extract({column}, {path}) = {expected}")
+    return "(" + " AND ".join(conditions) + ")"
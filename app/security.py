@@ -1,5 +1,8 @@
 # app/security.py
+import asyncio
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from typing import Optional, Set
 
@@ -34,10 +37,42 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+# --- bcrypt вне цикла событий ---
+# Один хеш bcrypt - 100-300 мс CPU. В цикле событий это останавливает все запросы воркера,
+# поэтому из асинхронного кода хеширование выполняется в отдельном пуле потоков (bcrypt отпускает GIL).
+# Пул ограничен PASSWORD_HASH_WORKERS потоками, очередь - PASSWORD_HASH_MAX_PENDING задачами:
+# сверх этого запрос сразу получает PasswordHashingBusy (503), а не копится в памяти.
+class PasswordHashingBusy(Exception):
+    """Очередь хеширования паролей заполнена."""
+
+
+_password_executor = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+_password_slots = threading.BoundedSemaphore(settings.PASSWORD_HASH_MAX_PENDING)
+
+
+async def _run_in_password_pool(func, *args):
+    if not _password_slots.acquire(blocking=False):
+        raise PasswordHashingBusy()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_password_executor, func, *args)
+    finally:
+        _password_slots.release()
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """verify_password() в пуле хеширования."""
+    return await _run_in_password_pool(verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """get_password_hash() в пуле хеширования."""
+    return await _run_in_password_pool(get_password_hash, password)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """
     Создает JWT токен доступа.
-    :param data: Данные для кодирования в токен (обычно {'sub': username, 'user_id': id}).
+    :param data: Данные для кодирования в токен (обычно {'sub': username, 'user_id': id, 'role': ..., 'ver': ...}).
     :param expires_delta: Время жизни токена. Если None, используется значение по умолчанию.
     """
     to_encode = data.copy()
@@ -64,7 +99,9 @@ def decode_access_token(token: str) -> Optional[TokenData]:
         if username is None or user_id is None:
             return None
 
-        return TokenData(username=username, user_id=user_id)
+        return TokenData(
+            username=username, user_id=user_id, role=payload.get("role"), token_version=payload.get("ver")
+        )
     except JWTError:
         return None
 
@@ -0,0 +1,94 @@
+# app/throttle.py
+"""
+Ограничение частоты попыток входа и регистрации (в памяти процесса).
+
+Каждая попытка стоит хеша bcrypt, поэтому шквал логинов может занять пул хеширования
+и процессор воркера, отнимая их у приема логов. Счетчики ведутся в скользящем окне
+LOGIN_THROTTLE_WINDOW_SECONDS:
+  - по имени пользователя - неудачные попытки (подбор пароля к одной учетной записи),
+    успешный вход счетчик сбрасывает;
+  - по IP клиента - неудачные попытки входа и регистрации (перебор учетных записей с одного адреса).
+Проверка выполняется до обращения к БД и bcrypt, ответ при превышении - 429 с Retry-After.
+За прокси (nginx) IP клиента берется из X-Forwarded-For: ProxyHeadersMiddleware в main.py
+доверяет заголовку только от адресов FORWARDED_ALLOW_IPS, иначе все клиенты делили бы адрес прокси.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Hashable, Optional
+
+from fastapi import HTTPException, Request, status
+
+from config import settings
+
+
+class SlidingWindowLimiter:
+    """Отметки времени попыток по ключам; ключей не больше max_keys (самые давние вытесняются)."""
+
+    def __init__(self, max_keys: int = 100000):
+        self._max_keys = max_keys
+        self._hits: "OrderedDict[Hashable, Deque[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _prune(self, key: Hashable, now: float, window: float) -> Deque[float]:
+        hits = self._hits.get(key)
+        if hits is None:
+            return deque()
+        while hits and now - hits[0] >= window:
+            hits.popleft()
+        if not hits:
+            del self._hits[key]
+        return hits
+
+    def retry_after(self, key: Hashable, limit: int, window: float) -> Optional[int]:
+        """Через сколько секунд ключ снова можно использовать, или None, если лимит не исчерпан."""
+        now = time.monotonic()
+        with self._lock:
+            hits = self._prune(key, now, window)
+            if len(hits) < limit:
+                return None
+            return max(1, math.ceil(window - (now - hits[-limit])))
+
+    def hit(self, key: Hashable) -> None:
+        with self._lock:
+            self._hits.setdefault(key, deque()).append(time.monotonic())
+            self._hits.move_to_end(key)
+            while len(self._hits) > self._max_keys:
+                self._hits.popitem(last=False)
+
+    def reset(self, key: Hashable) -> None:
+        with self._lock:
+            self._hits.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._hits.clear()
+
+
+login_attempts = SlidingWindowLimiter()
+
+
+def client_ip(request: Request) -> str:
+    return request.client.host if request.client else "unknown"
+
+
+def username_key(username: str) -> tuple:
+    return ("username", username.strip().lower())
+
+
+def ip_key(request: Request) -> tuple:
+    return ("ip", client_ip(request))
+
+
+def ensure_not_throttled(*keys_and_limits) -> None:
+    """Принимает пары (ключ, лимит); если хотя бы один лимит исчерпан - 429."""
+    window = settings.LOGIN_THROTTLE_WINDOW_SECONDS
+    waits = [login_attempts.retry_after(key, limit, window) for key, limit in keys_and_limits]
+    waits = [wait for wait in waits if wait is not None]
+    if waits:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Слишком много попыток, повторите позже",
+            headers={"Retry-After": str(max(waits))},
+        )
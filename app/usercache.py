@@ -0,0 +1,131 @@
+# app/usercache.py
+"""
+Кеш пользователей для проверки JWT в памяти процесса.
+
+Токен содержит user_id, роль (claim "role") и версию (claim "ver" = users.token_version на момент логина).
+deps.get_current_user берет пользователя отсюда и запрашивает БД только при промахе или по истечении
+USER_CACHE_TTL_SECONDS, так что обычный аутентифицированный запрос не делает лишних запросов.
+Токен принимается, только если его роль и версия совпадают с текущими у пользователя:
+смена роли (crud.update_user_role) увеличивает token_version, и старые токены отзываются.
+Токены без этих claims (выданные до их появления) считаются версией 0 с ролью из users.
+Запись в users через ORM сразу сбрасывает запись кеша в этом процессе (события Session, как в refdata.py);
+в других воркерах изменение вступит в силу не позже чем через TTL.
+"""
+import threading
+import time
+from dataclasses import dataclass, fields
+from datetime import datetime
+from itertools import chain
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+import models, schemas
+from config import settings
+
+
+@dataclass(frozen=True)
+class CachedUser:
+    """Снимок строки users (без связей), из которого для каждого запроса собирается свой models.User."""
+    id: int
+    username: str
+    email: str
+    password_hash: str
+    role: str
+    token_version: int
+    created_at: Optional[datetime]
+    updated_at: Optional[datetime]
+
+    @classmethod
+    def from_model(cls, db_user: models.User) -> "CachedUser":
+        values = {f.name: getattr(db_user, f.name) for f in fields(cls)}
+        values["token_version"] = values["token_version"] or 0
+        return cls(**values)
+
+    def to_model(self) -> models.User:
+        # Новый несвязанный с сессией объект: запросы не делят между собой один ORM-экземпляр
+        return models.User(**{f.name: getattr(self, f.name) for f in fields(self)})
+
+    def accepts(self, token_data: schemas.TokenData) -> bool:
+        """
+        Токен выпущен для текущей роли и версии пользователя. У токенов, выданных до появления
+        claims "role" и "ver", версия считается 0, а роль берется из users: такие сессии
+        действуют до первой смены роли, а не обрываются при выкладке.
+        """
+        if token_data.role is not None and token_data.role != self.role:
+            return False
+        return (token_data.token_version or 0) == self.token_version
+
+
+_lock = threading.Lock()
+_entries: Dict[int, Tuple[float, CachedUser]] = {}  # user_id -> (time.monotonic() загрузки, снимок)
+_generation = 0  # Увеличивается при каждой инвалидации
+
+
+def get_cached_user(user_id: int) -> Optional[CachedUser]:
+    entry = _entries.get(user_id)
+    if entry is None or time.monotonic() - entry[0] > settings.USER_CACHE_TTL_SECONDS:
+        return None
+    return entry[1]
+
+
+def current_generation() -> int:
+    """Запоминается перед чтением пользователя из БД и передается в store_user()."""
+    return _generation
+
+
+def store_user(db_user: models.User, generation: int) -> CachedUser:
+    """
+    Кладет пользователя в кеш. Если с начала чтения (generation) прошла инвалидация,
+    прочитанная строка могла устареть - снимок возвращается, но не кешируется.
+    """
+    cached = CachedUser.from_model(db_user)
+    with _lock:
+        if generation != _generation:
+            return cached
+        if len(_entries) >= settings.USER_CACHE_MAX_ENTRIES:
+            _entries.pop(next(iter(_entries)))  # Самая старая запись
+        _entries[cached.id] = (time.monotonic(), cached)
+    return cached
+
+
+def invalidate_user(user_id: Optional[int] = None) -> None:
+    """Сбрасывает пользователя (или весь кеш, если user_id не задан)."""
+    global _generation
+    with _lock:
+        _generation += 1
+        if user_id is None:
+            _entries.clear()
+        else:
+            _entries.pop(user_id, None)
+
+
+# --- Инвалидация при записи в users ---
+@event.listens_for(Session, "after_flush")
+def _track_user_writes(session, flush_context):
+    user_ids = {
+        obj.id for obj in chain(session.new, session.dirty, session.deleted) if isinstance(obj, models.User)
+    }
+    if user_ids:
+        session.info.setdefault("usercache_dirty", set()).update(user_ids)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_user_bulk_writes(orm_execute_state):
+    # query(User).update()/delete() - какие строки затронуты, неизвестно, сбрасываем весь кеш
+    if orm_execute_state.is_select:
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and issubclass(mapper.class_, models.User):
+        orm_execute_state.session.info.setdefault("usercache_dirty", set()).add(None)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    user_ids = session.info.pop("usercache_dirty", set())
+    if None in user_ids:
+        invalidate_user()
+        return
+    for user_id in user_ids:
+        invalidate_user(user_id)
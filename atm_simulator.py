@@ -1,10 +1,17 @@
 # atm_simulator.py
+import argparse
+import asyncio
 import os
 import random
+import sys
 import time
+import httpx
 import requests
 import json
+import math
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
+from typing import Dict, List, Optional
 
 # --- КОНФИГУРАЦИЯ ---
 # Получаем из переменных окружения
@@ -12,13 +19,12 @@ ATM_ID_IN_DB = os.environ.get("ATM_ID_IN_DB")
 API_BASE_URL = os.environ.get("API_BASE_URL", "http://localhost:8000/api/v1") # Для локального теста без Docker
 SIMULATOR_API_KEY = os.environ.get("SIMULATOR_API_KEY")
 
-# Проверки обязательных переменных окружения
-if not ATM_ID_IN_DB:
-    print("CRITICAL: ATM_ID_IN_DB environment variable not set. Exiting.")
-    exit(1)
+# Режим: single - один банкомат на процесс (по умолчанию), fleet - нагрузочный парк банкоматов
+SIMULATOR_MODE = os.environ.get("SIMULATOR_MODE", "single")
 
 # LOG_ENDPOINT формируется на основе API_BASE_URL и ATM_ID_IN_DB
 LOG_ENDPOINT = f"{API_BASE_URL}/atms/{ATM_ID_IN_DB}/logs/"
+BATCH_ENDPOINT = f"{API_BASE_URL}/atms/logs/batch"
 
 # --- Справочники ID (на основе ваших данных) ---
 LOG_LEVEL_IDS = {
@@ -47,8 +53,9 @@ EVENT_TYPE_IDS = {
 
 # --- Функции симулятора ---
 
-def generate_log_entry():
-    """Генерирует случайную запись лога."""
+def generate_log_entry(atm_id=None, alerts_only=False):
+    """Генерирует случайную запись лога. alerts_only - только аварийные события (сценарий инцидента)."""
+    atm_id = ATM_ID_IN_DB if atm_id is None else atm_id
     now_utc_iso = datetime.now(timezone.utc).isoformat()
 
     # Список возможных событий с их атрибутами
@@ -75,10 +82,12 @@ def generate_log_entry():
         ("Routine maintenance check passed", LOG_LEVEL_IDS["DEBUG"], None, False, {"check_module": "dispenser_self_test"})
     ]
 
+    if alerts_only:
+        possible_events = [event for event in possible_events if event[3]]
     chosen_event = random.choice(possible_events)
     message_base, log_level_id, event_type_id, is_alert, payload_data = chosen_event
     
-    message = f"{message_base} (ATM_ID: {ATM_ID_IN_DB})"
+    message = f"{message_base} (ATM_ID: {atm_id})"
     if payload_data:
         # Добавляем немного вариативности в payload, если он есть
         payload_data["timestamp_details"] = {"sec": datetime.now().second, "ms": datetime.now().microsecond // 1000}
@@ -121,8 +130,282 @@ def send_log(log_data):
     except requests.exceptions.RequestException as e:
         print(f"ATM {ATM_ID_IN_DB}: Error sending log: {e}")
 
-# --- Основной цикл симулятора ---
-if __name__ == "__main__":
+# --- Режим парка банкоматов (нагрузочное тестирование) ---
+# Один процесс имитирует тысячи банкоматов: события генерируются пуассоновским потоком с заданной
+# интенсивностью (открытая модель нагрузки - генератор не ждет ответов сервера), отправку выполняют
+# concurrency корутин через один httpx.AsyncClient с пулом keep-alive соединений.
+
+def parse_atm_ids(spec: str) -> List[int]:
+    """'1-1000' или '1,2,5-9' -> список ID банкоматов."""
+    atm_ids = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            low, high = part.split("-", 1)
+            atm_ids.extend(range(int(low), int(high) + 1))
+        else:
+            atm_ids.append(int(part))
+    if not atm_ids:
+        raise ValueError(f"No ATM ids in '{spec}'.")
+    return atm_ids
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Перцентиль методом ближайшего ранга."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = math.ceil(q / 100 * len(ordered))
+    return ordered[min(max(rank, 1), len(ordered)) - 1]
+
+
+class Scenario:
+    """
+    Сценарий нагрузки: множитель базовой интенсивности и источник события в момент t (секунды от старта).
+      steady   - ровный поток от случайных банкоматов парка;
+      burst    - каждые burst_every секунд на burst_duration секунд поток растет в burst_factor раз;
+      incident - с incident_start на incident_duration секунд доля incident_share банкоматов
+                 (например, потерявший связь регион) засыпает сервер аварийными событиями,
+                 общий поток растет в burst_factor раз.
+    """
+    NAMES = ("steady", "burst", "incident")
+
+    def __init__(self, name: str, atm_ids: List[int], burst_factor: float = 10.0,
+                 burst_every: float = 60.0, burst_duration: float = 5.0,
+                 incident_start: float = 10.0, incident_duration: float = 30.0, incident_share: float = 0.05):
+        if name not in self.NAMES:
+            raise ValueError(f"Unknown scenario '{name}', expected one of {', '.join(self.NAMES)}.")
+        self.name = name
+        self.atm_ids = atm_ids
+        self.burst_factor = burst_factor
+        self.burst_every = burst_every
+        self.burst_duration = burst_duration
+        self.incident_start = incident_start
+        self.incident_duration = incident_duration
+        self.incident_atm_ids = random.sample(atm_ids, max(1, int(len(atm_ids) * incident_share)))
+
+    def active(self, t: float) -> bool:
+        """Идет ли всплеск / инцидент в момент t."""
+        if self.name == "burst":
+            return t % self.burst_every < self.burst_duration
+        if self.name == "incident":
+            return self.incident_start <= t < self.incident_start + self.incident_duration
+        return False
+
+    def rate_multiplier(self, t: float) -> float:
+        return self.burst_factor if self.active(t) else 1.0
+
+    def next_event(self, t: float) -> dict:
+        """Запись лога для пакетного эндпоинта (ATMLogBatchItem: поля ATMLogCreate + atm_id)."""
+        # Во время инцидента сверх обычного потока (доля 1/burst_factor) идут аварии затронутых банкоматов
+        if self.name == "incident" and self.active(t) and random.random() >= 1 / self.burst_factor:
+            atm_id = random.choice(self.incident_atm_ids)
+            record = generate_log_entry(atm_id, alerts_only=True)
+        else:
+            atm_id = random.choice(self.atm_ids)
+            record = generate_log_entry(atm_id)
+        record["atm_id"] = atm_id
+        return record
+
+
+@dataclass
+class FleetConfig:
+    atm_ids: List[int]
+    rate: float = 100.0  # Событий в секунду по всему парку (вне всплесков)
+    duration: float = 60.0  # Секунд генерации
+    concurrency: int = 100  # Одновременных запросов = размер пула соединений
+    batch_size: int = 0  # 0 - по одному POST /atms/{id}/logs/ на событие, иначе POST /atms/logs/batch
+    batch_linger: float = 0.05  # Максимальное ожидание набора пачки, секунд
+    scenario: str = "steady"
+    burst_factor: float = 10.0
+    burst_every: float = 60.0
+    burst_duration: float = 5.0
+    incident_start: float = 10.0
+    incident_duration: float = 30.0
+    incident_share: float = 0.05
+    queue_size: int = 10000  # Очередь отправки; при переполнении события отбрасываются (dropped)
+    timeout: float = 15.0
+    api_base_url: str = API_BASE_URL
+    api_key: Optional[str] = SIMULATOR_API_KEY
+
+
+@dataclass
+class FleetStats:
+    generated: int = 0
+    accepted: int = 0  # Логи, принятые сервером (201/202 или accepted в ответе пакета)
+    rejected: int = 0  # Логи, отклоненные сервером (4xx или rejected в ответе пакета)
+    failed: int = 0  # Логи в запросах с 5xx/429, таймаутом или ошибкой соединения
+    dropped: int = 0  # Логи, не отправленные из-за переполненной очереди (сервер не успевает)
+    requests: int = 0
+    status_codes: Dict[str, int] = field(default_factory=dict)
+    latencies: List[float] = field(default_factory=list)  # Время ответа на запрос
+    delays: List[float] = field(default_factory=list)  # От планового момента события до ответа (с ожиданием в очереди)
+
+
+async def _send(client, config: FleetConfig, stats: FleetStats, records: List[dict], scheduled_at: float):
+    started = time.perf_counter()
+    try:
+        if config.batch_size:
+            response = await client.post("atms/logs/batch", json=records)
+        else:
+            record = dict(records[0])
+            response = await client.post(f"atms/{record.pop('atm_id')}/logs/", json=record)
+    except httpx.HTTPError as e:
+        code = type(e).__name__
+        stats.failed += len(records)
+    else:
+        code = str(response.status_code)
+        if response.status_code in (200, 201, 202):
+            if config.batch_size:
+                result = response.json()
+                stats.accepted += result["accepted"]
+                stats.rejected += result["rejected"]
+            else:
+                stats.accepted += 1
+        elif response.status_code >= 500 or response.status_code == 429:
+            stats.failed += len(records)
+        else:
+            stats.rejected += len(records)
+    finished = time.perf_counter()
+    stats.requests += 1
+    stats.status_codes[code] = stats.status_codes.get(code, 0) + 1
+    stats.latencies.append(finished - started)
+    stats.delays.append(finished - scheduled_at)
+
+
+async def run_fleet(config: FleetConfig, transport=None) -> dict:
+    """Прогоняет сценарий и возвращает отчет (build_report). transport - для тестов (httpx.ASGITransport)."""
+    scenario = Scenario(
+        config.scenario, config.atm_ids, burst_factor=config.burst_factor,
+        burst_every=config.burst_every, burst_duration=config.burst_duration,
+        incident_start=config.incident_start, incident_duration=config.incident_duration,
+        incident_share=config.incident_share,
+    )
+    stats = FleetStats()
+    outbox: asyncio.Queue = asyncio.Queue(maxsize=config.queue_size)
+    headers = {"X-API-Key": config.api_key} if config.api_key else {}
+    limits = httpx.Limits(max_connections=config.concurrency, max_keepalive_connections=config.concurrency)
+
+    def enqueue(records: List[dict], scheduled_at: float):
+        try:
+            outbox.put_nowait((records, scheduled_at))
+        except asyncio.QueueFull:
+            stats.dropped += len(records)
+
+    async with httpx.AsyncClient(base_url=config.api_base_url.rstrip("/") + "/", headers=headers,
+                                 limits=limits, timeout=config.timeout, transport=transport) as client:
+        async def worker():
+            while True:
+                job = await outbox.get()
+                if job is None:
+                    return
+                await _send(client, config, stats, *job)
+
+        workers = [asyncio.create_task(worker()) for _ in range(config.concurrency)]
+        start = time.perf_counter()
+        next_at = 0.0  # Плановый момент следующего события, секунд от старта
+        batch: List[dict] = []
+        batch_started = 0.0
+        while next_at < config.duration:
+            due = start + next_at
+            if batch and batch_started + config.batch_linger < due:
+                await asyncio.sleep(max(batch_started + config.batch_linger - time.perf_counter(), 0))
+                enqueue(batch, batch_started)
+                batch = []
+            # sleep(0) при отставании от графика отдает управление отправителям
+            await asyncio.sleep(max(due - time.perf_counter(), 0))
+
+            record = scenario.next_event(next_at)
+            stats.generated += 1
+            if config.batch_size:
+                if not batch:
+                    batch_started = due
+                batch.append(record)
+                if len(batch) >= config.batch_size:
+                    enqueue(batch, batch_started)
+                    batch = []
+            else:
+                enqueue([record], due)
+            next_at += random.expovariate(config.rate * scenario.rate_multiplier(next_at))
+
+        if batch:
+            enqueue(batch, batch_started)
+        for _ in workers:
+            await outbox.put(None)
+        await asyncio.gather(*workers)
+        elapsed = time.perf_counter() - start
+    return build_report(config, stats, elapsed)
+
+
+def build_report(config: FleetConfig, stats: FleetStats, elapsed: float) -> dict:
+    def summary(values: List[float]) -> Dict[str, Optional[float]]:
+        points = {f"p{q:g}": percentile(values, q) for q in (50, 90, 99, 99.9)}
+        points["max"] = max(values) if values else None
+        return {name: None if value is None else round(value * 1000, 2) for name, value in points.items()}
+
+    return {
+        "scenario": config.scenario,
+        "atms": len(config.atm_ids),
+        "endpoint": "batch" if config.batch_size else "single",
+        "target_rate": config.rate,
+        "elapsed_s": round(elapsed, 3),
+        "generated": stats.generated,
+        "accepted": stats.accepted,
+        "rejected": stats.rejected,
+        "failed": stats.failed,
+        "dropped": stats.dropped,
+        "requests": stats.requests,
+        "status_codes": dict(sorted(stats.status_codes.items())),
+        "accepted_per_s": round(stats.accepted / elapsed, 1) if elapsed else 0.0,
+        "requests_per_s": round(stats.requests / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": summary(stats.latencies),
+        "delay_ms": summary(stats.delays),
+    }
+
+
+def print_report(report: dict):
+    print("-" * 30)
+    print(f"Scenario: {report['scenario']}, ATMs: {report['atms']}, endpoint: {report['endpoint']}, "
+          f"target rate: {report['target_rate']}/s, elapsed: {report['elapsed_s']} s")
+    print(f"Logs: generated {report['generated']}, accepted {report['accepted']}, rejected {report['rejected']}, "
+          f"failed {report['failed']}, dropped {report['dropped']}")
+    print(f"Throughput: {report['accepted_per_s']} logs/s accepted, {report['requests_per_s']} requests/s")
+    print(f"Status codes: {report['status_codes']}")
+    for title, key in (("Request latency, ms", "latency_ms"), ("Event-to-response delay, ms", "delay_ms")):
+        print(f"{title}: " + ", ".join(f"{name} {value}" for name, value in report[key].items()))
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    env = os.environ.get
+    parser = argparse.ArgumentParser(description="ATM log simulator: one ATM (single) or a load-generating fleet.")
+    parser.add_argument("--mode", choices=("single", "fleet"), default=SIMULATOR_MODE)
+    parser.add_argument("--atm-ids", default=env("FLEET_ATM_IDS", "1-1000"), help="e.g. 1-1000 or 1,2,5-9")
+    parser.add_argument("--rate", type=float, default=float(env("FLEET_RATE", "100")), help="events/s across the fleet")
+    parser.add_argument("--duration", type=float, default=float(env("FLEET_DURATION", "60")), help="seconds")
+    parser.add_argument("--concurrency", type=int, default=int(env("FLEET_CONCURRENCY", "100")))
+    parser.add_argument("--batch-size", type=int, default=int(env("FLEET_BATCH_SIZE", "0")),
+                        help="0 - one request per log, N - POST /atms/logs/batch with up to N logs")
+    parser.add_argument("--batch-linger-ms", type=float, default=50.0)
+    parser.add_argument("--scenario", choices=Scenario.NAMES, default=env("FLEET_SCENARIO", "steady"))
+    parser.add_argument("--burst-factor", type=float, default=10.0)
+    parser.add_argument("--burst-every", type=float, default=60.0)
+    parser.add_argument("--burst-duration", type=float, default=5.0)
+    parser.add_argument("--incident-start", type=float, default=10.0)
+    parser.add_argument("--incident-duration", type=float, default=30.0)
+    parser.add_argument("--incident-share", type=float, default=0.05)
+    parser.add_argument("--queue-size", type=int, default=10000)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    return parser.parse_args(argv)
+
+
+def run_single():
+    # Проверки обязательных переменных окружения
+    if not ATM_ID_IN_DB:
+        print("CRITICAL: ATM_ID_IN_DB environment variable not set. Exiting.")
+        exit(1)
+
     print(f"ATM Simulator {ATM_ID_IN_DB} starting...")
     print(f"Target API Base URL: {API_BASE_URL}")
     print(f"Target Log Endpoint: {LOG_ENDPOINT}")
@@ -149,4 +432,33 @@ if __name__ == "__main__":
         except Exception as e:
             print(f"ATM {ATM_ID_IN_DB}: An unexpected error occurred in the main loop: {e}")
             print(f"ATM {ATM_ID_IN_DB}: Restarting loop after 10 seconds...")
-            time.sleep(10)
\ No newline at end of file
+            time.sleep(10)
+
+
+def run_fleet_cli(args: argparse.Namespace):
+    config = FleetConfig(
+        atm_ids=parse_atm_ids(args.atm_ids), rate=args.rate, duration=args.duration,
+        concurrency=args.concurrency, batch_size=args.batch_size, batch_linger=args.batch_linger_ms / 1000,
+        scenario=args.scenario, burst_factor=args.burst_factor, burst_every=args.burst_every,
+        burst_duration=args.burst_duration, incident_start=args.incident_start,
+        incident_duration=args.incident_duration, incident_share=args.incident_share,
+        queue_size=args.queue_size,
+    )
+    print(f"ATM fleet simulator: {len(config.atm_ids)} ATMs, {config.rate}/s for {config.duration} s, "
+          f"scenario {config.scenario}, target {config.api_base_url}")
+    report = asyncio.run(run_fleet(config))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    # Ненулевой код, если часть логов не дошла: удобно для CI-прогонов нагрузки
+    sys.exit(1 if report["failed"] or report["dropped"] else 0)
+
+
+# --- Основной цикл симулятора ---
+if __name__ == "__main__":
+    arguments = parse_args()
+    if arguments.mode == "fleet":
+        run_fleet_cli(arguments)
+    else:
+        run_single()
@@ -0,0 +1,350 @@
+# benchmarks/bench_api.py
+"""
+Нагрузочные замеры горячих путей API на синтетических данных.
+
+Скрипт наполняет БД (PostgreSQL или SQLite) банкоматами и логами до заданного объема и гоняет
+приложение в том же процессе через httpx.ASGITransport - без сети и uvicorn, но с настоящими
+роутерами, middleware и БД:
+  - ingest: POST /api/v1/atms/{id}/logs/ (create_log_for_specific_atm) с заданной конкурентностью,
+    при --ingest-batch-size - еще и POST /api/v1/atms/logs/batch; пропускная способность и задержки;
+  - read: GET /api/v1/logs/ и GET /api/v1/atms/ на основных комбинациях фильтров; p50/p95/p99.
+Аутентификация (JWT, API-ключ) подменяется через dependency_overrides, кеш ответов не
+инициализируется: замеряется путь до БД, а не попадание в кеш.
+
+Результаты пишутся в JSON (--output). С --compare baseline.json скрипт сравнивает прогон с базовым
+и завершается с кодом 1, если p95 чтения вырос или пропускная способность приема упала больше
+чем на --tolerance.
+
+Запуск из корня проекта:
+    python benchmarks/bench_api.py --database-url sqlite:///bench.db --atms 200 --logs 1000000 \\
+        --output bench-results.json [--compare baseline.json]
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "app"))
+
+PERCENTILES = (50, 95, 99)
+SEED_CHUNK_ROWS = 10000
+
+# Справочники для пустой БД: те же ID, что у atm_simulator.py
+LOG_LEVELS = {1: "DEBUG", 2: "INFO", 3: "WARN", 4: "ERROR", 5: "CRITICAL"}
+EVENT_TYPES = {
+    1: "CASH_WITHDRAWAL", 2: "DEPOSIT", 3: "BALANCE_INQUIRY", 4: "PAYMENT", 5: "SYSTEM_BOOT",
+    6: "SYSTEM_SHUTDOWN", 7: "COMPONENT_FAILURE", 8: "LOW_CASH_LEVEL", 9: "TAMPER_DETECTED",
+    10: "INVALID_PIN_ATTEMPT", 11: "CARD_JAMMED", 12: "PRINTER_ERROR", 13: "COMMUNICATION_ERROR",
+}
+MESSAGES = ("Successful cash withdrawal", "Card jammed in reader", "Printer error: out of paper",
+            "Communication error with processing center", "Balance inquiry performed")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark ingest and query hot paths of the API.")
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL", "sqlite:///bench.db"))
+    parser.add_argument("--atms", type=int, default=100, help="ATMs in the dataset")
+    parser.add_argument("--logs", type=int, default=100000, help="atm_logs rows in the dataset (seeded up to this)")
+    parser.add_argument("--random-seed", type=int, default=42)
+    parser.add_argument("--ingest-requests", type=int, default=2000)
+    parser.add_argument("--ingest-batch-size", type=int, default=0, help="also benchmark /atms/logs/batch with N logs per request")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--read-requests", type=int, default=50, help="measured requests per read scenario")
+    parser.add_argument("--warmup", type=int, default=3, help="unmeasured requests per read scenario")
+    parser.add_argument("--skip-ingest", action="store_true")
+    parser.add_argument("--skip-read", action="store_true")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="baseline JSON from a previous run")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression (0.2 = 20%%)")
+    return parser.parse_args()
+
+
+def percentile(values: list, q: float) -> float:
+    """Перцентиль методом ближайшего ранга."""
+    ordered = sorted(values)
+    rank = math.ceil(q / 100 * len(ordered))
+    return ordered[min(max(rank, 1), len(ordered)) - 1]
+
+
+def latency_summary(latencies: list) -> dict:
+    summary = {f"p{q}_ms": round(percentile(latencies, q) * 1000, 3) for q in PERCENTILES}
+    summary["mean_ms"] = round(sum(latencies) / len(latencies) * 1000, 3)
+    summary["max_ms"] = round(max(latencies) * 1000, 3)
+    return summary
+
+
+# --- Наполнение БД ---
+
+def seed_reference_data(engine, atm_count: int) -> None:
+    from sqlalchemy import func, select
+    from sqlalchemy.orm import Session
+    import models
+
+    with Session(engine) as db:
+        if not db.scalar(select(func.count()).select_from(models.ATMStatus)):
+            db.add(models.ATMStatus(id=1, name="active"))
+        if not db.scalar(select(func.count()).select_from(models.LogLevel)):
+            db.add_all(models.LogLevel(id=i, name=name, severity_order=i) for i, name in LOG_LEVELS.items())
+        if not db.scalar(select(func.count()).select_from(models.EventType)):
+            db.add_all(models.EventType(id=i, name=name) for i, name in EVENT_TYPES.items())
+        db.flush()
+        status_id = db.scalar(select(func.min(models.ATMStatus.id)))
+        existing = db.scalar(select(func.count()).select_from(models.ATM))
+        db.add_all(
+            # atm_uid - только цифры (проверка в schemas.ATM)
+            models.ATM(atm_uid=str(90000000 + n), location_description=f"Benchmark site {n % 50}", status_id=status_id)
+            for n in range(existing, atm_count)
+        )
+        db.commit()
+
+
+def seed_logs(engine, target: int, rng: random.Random) -> int:
+    """Добавляет логи до target строк. На PostgreSQL - одним INSERT ... SELECT generate_series."""
+    from sqlalchemy import func, insert, select
+    import models, rollups
+
+    with engine.connect() as connection:
+        missing = target - connection.scalar(select(func.count()).select_from(models.ATMLog))
+    if missing <= 0:
+        return 0
+
+    started = time.perf_counter()
+    if engine.dialect.name == "postgresql":
+        import explain_read_logs
+        explain_read_logs.seed_logs(engine, missing)
+    else:
+        with engine.connect() as connection:
+            atm_ids = list(connection.scalars(select(models.ATM.id)))
+            level_ids = list(connection.scalars(select(models.LogLevel.id)))
+            event_type_ids = list(connection.scalars(select(models.EventType.id)))
+        now = datetime.now(timezone.utc)
+        for offset in range(0, missing, SEED_CHUNK_ROWS):
+            rows = [
+                {
+                    "atm_id": rng.choice(atm_ids),
+                    "event_timestamp": now - timedelta(seconds=n),
+                    "log_level_id": rng.choice(level_ids),
+                    "event_type_id": rng.choice(event_type_ids),
+                    "message": f"{rng.choice(MESSAGES)} #{n}",
+                    "payload": {"error_code": "CJ-001"} if n % 97 == 0 else None,
+                    "is_alert": n % 50 == 0,
+                }
+                for n in range(offset, min(offset + SEED_CHUNK_ROWS, missing))
+            ]
+            with engine.begin() as connection:
+                connection.execute(insert(models.ATMLog), rows)
+    # Сводки (rollups.py) по заново наполненной таблице
+    with engine.begin() as connection:
+        rollups.rebuild(connection)
+    print(f"Seeded {missing} logs in {time.perf_counter() - started:.1f}s")
+    return missing
+
+
+# --- Замеры ---
+
+def read_scenarios(atm_id: int, log_level_id: int, event_type_id: int) -> list:
+    """(имя, путь, параметры) основных комбинаций фильтров read_logs и read_atms."""
+    end_time = datetime.now(timezone.utc)
+    start_time = (end_time - timedelta(hours=1)).isoformat()
+    end_time = end_time.isoformat()
+    logs, atms = "/api/v1/logs/", "/api/v1/atms/"
+    return [
+        ("read_logs: no filters", logs, {}),
+        ("read_logs: atm_id", logs, {"atm_id": atm_id}),
+        ("read_logs: log_level_id", logs, {"log_level_id": log_level_id}),
+        ("read_logs: event_type_id", logs, {"event_type_id": event_type_id}),
+        ("read_logs: time range", logs, {"start_time": start_time, "end_time": end_time}),
+        ("read_logs: atm_id + time range", logs, {"atm_id": atm_id, "start_time": start_time, "end_time": end_time}),
+        ("read_logs: open alerts", logs, {"is_alert": "true", "is_acknowledged": "false"}),
+        ("read_logs: message keyword", logs, {"message": "jammed"}),
+        ("read_logs: full-text q", logs, {"q": "printer*"}),
+        ("read_logs: payload contains", logs, {"payload_contains": json.dumps({"error_code": "CJ-001"})}),
+        ("read_logs: cursor pagination", logs, {"pagination": "cursor", "count": "none"}),
+        ("read_logs: exact count", logs, {"count": "exact"}),
+        ("read_atms: no filters", atms, {}),
+        ("read_atms: status_id", atms, {"status_id": 1}),
+        ("read_atms: location keyword", atms, {"location": "site 7"}),
+        ("read_atms: cursor pagination", atms, {"pagination": "cursor", "count": "none"}),
+    ]
+
+
+async def bench_read(client, scenarios: list, requests: int, warmup: int) -> dict:
+    results = {}
+    for name, path, params in scenarios:
+        for _ in range(warmup):
+            await client.get(path, params=params)
+        latencies, errors = [], 0
+        for _ in range(requests):
+            started = time.perf_counter()
+            response = await client.get(path, params=params)
+            latencies.append(time.perf_counter() - started)
+            errors += response.status_code != 200
+        results[name] = dict(latency_summary(latencies), requests=requests, errors=errors)
+        print(f"{name:<36} p50 {results[name]['p50_ms']:>9.2f} ms   p95 {results[name]['p95_ms']:>9.2f} ms   "
+              f"p99 {results[name]['p99_ms']:>9.2f} ms   errors {errors}")
+    return results
+
+
+async def bench_ingest(client, atm_ids: list, requests: int, concurrency: int, batch_size: int,
+                       rng: random.Random) -> dict:
+    """requests запросов с concurrency одновременных; batch_size > 0 - пакетный эндпоинт."""
+    latencies, errors = [], 0
+    pending = iter(range(requests))
+
+    def record() -> dict:
+        return {
+            "event_timestamp": datetime.now(timezone.utc).isoformat(),
+            "message": f"{rng.choice(MESSAGES)} (benchmark)",
+            "log_level_id": rng.choice(list(LOG_LEVELS)),
+            "event_type_id": rng.choice(list(EVENT_TYPES)),
+            "payload": {"benchmark": True},
+        }
+
+    async def worker():
+        nonlocal errors
+        for _ in pending:
+            atm_id = rng.choice(atm_ids)
+            started = time.perf_counter()
+            if batch_size:
+                body = [dict(record(), atm_id=rng.choice(atm_ids)) for _ in range(batch_size)]
+                response = await client.post("/api/v1/atms/logs/batch", json=body)
+                failed = response.status_code != 200 or response.json()["rejected"] > 0
+            else:
+                response = await client.post(f"/api/v1/atms/{atm_id}/logs/", json=record())
+                failed = response.status_code not in (201, 202)
+            latencies.append(time.perf_counter() - started)
+            errors += failed
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    logs = requests * (batch_size or 1)
+    result = dict(latency_summary(latencies), requests=requests, logs=logs, errors=errors, concurrency=concurrency,
+                  elapsed_s=round(elapsed, 3), logs_per_s=round(logs / elapsed, 1))
+    endpoint = f"batch of {batch_size}" if batch_size else "single"
+    print(f"ingest ({endpoint}): {result['logs_per_s']} logs/s, p50 {result['p50_ms']} ms, "
+          f"p95 {result['p95_ms']} ms, p99 {result['p99_ms']} ms, errors {errors}")
+    return result
+
+
+async def run_benchmarks(args, atm_ids: list, filter_values: tuple, rng: random.Random) -> dict:
+    import httpx
+    import ingest_queue, models
+    from database import async_engine
+    from deps import get_current_user
+    from main import app
+    from security import get_api_key
+
+    app.dependency_overrides[get_current_user] = lambda: models.User(id=0, username="benchmark")
+    app.dependency_overrides[get_api_key] = lambda: "benchmark"
+    results = {"ingest": {}, "read": {}}
+    # Исключение приложения - ответ 500 и ошибка в результатах, а не остановка всего прогона
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            if not args.skip_read:
+                results["read"] = await bench_read(client, read_scenarios(*filter_values), args.read_requests, args.warmup)
+            if not args.skip_ingest:
+                results["ingest"]["single"] = await bench_ingest(
+                    client, atm_ids, args.ingest_requests, args.concurrency, 0, rng
+                )
+                if args.ingest_batch_size:
+                    results["ingest"]["batch"] = await bench_ingest(
+                        client, atm_ids, max(1, args.ingest_requests // args.ingest_batch_size), args.concurrency,
+                        args.ingest_batch_size, rng
+                    )
+    finally:
+        await ingest_queue.queue.stop()
+        await async_engine.dispose()
+    return results
+
+
+# --- Сравнение с базовым прогоном ---
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Регрессии: p95 чтения выше базового или пропускная способность приема ниже больше чем на tolerance."""
+    regressions = []
+    for name, current in results.get("read", {}).items():
+        before = baseline.get("read", {}).get(name)
+        if before and current["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {before['p95_ms']} -> {current['p95_ms']} ms")
+    for name, current in results.get("ingest", {}).items():
+        before = baseline.get("ingest", {}).get(name)
+        if before and current["logs_per_s"] < before["logs_per_s"] * (1 - tolerance):
+            regressions.append(f"ingest {name}: {before['logs_per_s']} -> {current['logs_per_s']} logs/s")
+    return regressions
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main() -> int:
+    args = parse_args()
+    # Настройки приложения читаются из окружения при импорте config
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ.setdefault("RUN_MIGRATIONS_ON_STARTUP", "false")
+
+    from sqlalchemy import func, select
+    import migrate, models
+    from database import Base, engine
+
+    rng = random.Random(args.random_seed)
+    Base.metadata.create_all(bind=engine)
+    migrate.apply_migrations(engine)
+    seed_reference_data(engine, args.atms)
+    seed_logs(engine, args.logs, rng)
+
+    with engine.connect() as connection:
+        atm_ids = list(connection.scalars(select(models.ATM.id).order_by(models.ATM.id).limit(args.atms)))
+        total_logs = connection.scalar(select(func.count()).select_from(models.ATMLog))
+        filter_values = (
+            connection.scalar(select(func.min(models.ATMLog.atm_id))) or atm_ids[0],
+            connection.scalar(select(func.max(models.ATMLog.log_level_id))) or 1,
+            connection.scalar(select(func.min(models.ATMLog.event_type_id))) or 1,
+        )
+    print(f"Dataset: {len(atm_ids)} ATMs, {total_logs} logs ({engine.dialect.name})\n")
+
+    results = asyncio.run(run_benchmarks(args, atm_ids, filter_values, rng))
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_revision": git_revision(),
+            "dialect": engine.dialect.name,
+            "atms": len(atm_ids),
+            "logs": total_logs,
+            "python": platform.python_version(),
+            "concurrency": args.concurrency,
+        },
+        **results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        regressions = compare(report, json.loads(Path(args.compare).read_text()), args.tolerance)
+        if regressions:
+            print(f"\nRegressions over {args.tolerance:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"\nNo regressions over {args.tolerance:.0%} against {args.compare}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
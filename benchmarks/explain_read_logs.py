@@ -0,0 +1,145 @@
+# benchmarks/explain_read_logs.py
+"""
+Проверка планов запросов GET /api/v1/logs/ на PostgreSQL.
+
+Для каждой комбинации фильтров read_logs строится тот же SELECT, что и в crud.get_atm_logs
+(первая страница, ORDER BY event_timestamp DESC, id DESC LIMIT 100), и выполняется
+EXPLAIN (FORMAT JSON). Скрипт печатает узлы сканирования atm_logs и использованный индекс
+и завершается с кодом 1, если хотя бы один запрос читает atm_logs последовательным сканированием.
+
+На маленькой таблице планировщик честно выбирает Seq Scan, поэтому для осмысленной проверки
+таблицу можно наполнить синтетическими логами: --seed 1000000.
+
+Запуск из корня проекта:
+    python benchmarks/explain_read_logs.py [--database-url postgresql://...] [--seed N] [--analyze]
+"""
+import argparse
+import json
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+
+from sqlalchemy import create_engine, func, select  # noqa: E402
+
+from config import settings  # noqa: E402
+import crud, migrate, models, search  # noqa: E402
+
+SCAN_NODE_TYPES = ("Seq Scan", "Index Scan", "Index Only Scan", "Bitmap Heap Scan", "Bitmap Index Scan")
+
+# Параметры подставляет psycopg2 (pyformat), поэтому оператор остатка записан как %%
+SEED_SQL = """
+INSERT INTO atm_logs (atm_id, event_timestamp, log_level_id, event_type_id, message, payload, is_alert)
+SELECT
+    atm_ids[1 + (n %% array_length(atm_ids, 1))],
+    now() - (n || ' seconds')::interval,
+    level_ids[1 + (n %% array_length(level_ids, 1))],
+    event_type_ids[1 + ((n / 7) %% array_length(event_type_ids, 1))],
+    'Synthetic benchmark event #' || n,
+    NULL,
+    (n %% 50 = 0)
+FROM generate_series(1, %(rows)s) AS n,
+     (SELECT array_agg(id) AS atm_ids FROM atms) a,
+     (SELECT array_agg(id) AS level_ids FROM log_levels) l,
+     (SELECT array_agg(id) AS event_type_ids FROM event_types) e
+"""
+
+
+def seed_logs(engine, rows: int) -> None:
+    started = time.perf_counter()
+    with engine.begin() as connection:
+        connection.exec_driver_sql(SEED_SQL, {"rows": rows})
+        connection.exec_driver_sql("ANALYZE atm_logs")
+    print(f"Seeded {rows} synthetic logs in {time.perf_counter() - started:.1f}s")
+
+
+def filter_combinations(engine) -> list:
+    """Комбинации фильтров read_logs со значениями, которые реально есть в БД."""
+    with engine.connect() as connection:
+        atm_id = connection.scalar(select(func.min(models.ATMLog.atm_id)))
+        log_level_id = connection.scalar(select(func.max(models.ATMLog.log_level_id)))
+        event_type_id = connection.scalar(select(func.min(models.ATMLog.event_type_id)))
+    end_time = datetime.now(timezone.utc)
+    start_time = end_time - timedelta(hours=1)
+    return [
+        ("no filters", {}),
+        ("atm_id", {"atm_id": atm_id}),
+        ("log_level_id", {"log_level_id": log_level_id}),
+        ("event_type_id", {"event_type_id": event_type_id}),
+        ("time range", {"start_time": start_time, "end_time": end_time}),
+        ("atm_id + time range", {"atm_id": atm_id, "start_time": start_time, "end_time": end_time}),
+        ("log_level_id + time range", {"log_level_id": log_level_id, "start_time": start_time, "end_time": end_time}),
+        ("atm_id + log_level_id", {"atm_id": atm_id, "log_level_id": log_level_id}),
+        ("open alerts", {"is_alert": True, "is_acknowledged": False}),
+        ("atm_id + open alerts", {"atm_id": atm_id, "is_alert": True, "is_acknowledged": False}),
+        ("message keyword", {"message_keyword": "error"}),
+        ("full-text q", {"search_terms": search.parse_search_query("synthetic event*")}),
+        ("payload contains", {"payload_contains": {"error_code": "CJ-001"}}),
+    ]
+
+
+def collect_scans(plan: dict, found: list) -> list:
+    """Обходит дерево плана и собирает узлы сканирования atm_logs."""
+    if plan.get("Node Type") in SCAN_NODE_TYPES and plan.get("Relation Name", "atm_logs") == "atm_logs":
+        found.append((plan["Node Type"], plan.get("Index Name")))
+    for child in plan.get("Plans", []):
+        collect_scans(child, found)
+    return found
+
+
+def explain(connection, stmt, analyze: bool) -> dict:
+    compiled = stmt.compile(dialect=connection.dialect)
+    options = "ANALYZE, BUFFERS, FORMAT JSON" if analyze else "FORMAT JSON"
+    plan = connection.exec_driver_sql(f"EXPLAIN ({options}) {compiled}", compiled.params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="EXPLAIN every read_logs filter combination.")
+    parser.add_argument("--database-url", default=settings.DATABASE_URL)
+    parser.add_argument("--seed", type=int, default=0, help="Insert N synthetic logs before explaining")
+    parser.add_argument("--analyze", action="store_true", help="Use EXPLAIN ANALYZE and report execution time")
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url)
+    if engine.dialect.name != "postgresql":
+        print("This benchmark needs PostgreSQL.")
+        return 2
+
+    migrate.apply_migrations(engine)
+    if args.seed:
+        seed_logs(engine, args.seed)
+
+    uses_seq_scan = False
+    with engine.connect() as connection:
+        total = connection.scalar(select(func.count()).select_from(models.ATMLog))
+        print(f"atm_logs rows: {total}\n")
+        print(f"{'filters':<28} {'scan':<18} {'index':<42} {'time, ms':>9}")
+        for name, filters in filter_combinations(engine):
+            stmt = (
+                select(models.ATMLog)
+                .where(*crud.atm_log_filter_criteria(**filters))
+                .order_by(*crud.atm_log_ordering(True))
+                .limit(100)
+            )
+            result = explain(connection, stmt, args.analyze)
+            scans = collect_scans(result["Plan"], [])
+            elapsed = f"{result['Execution Time']:.2f}" if "Execution Time" in result else "-"
+            for node_type, index_name in scans:
+                uses_seq_scan = uses_seq_scan or node_type == "Seq Scan"
+                print(f"{name:<28} {node_type:<18} {index_name or '-':<42} {elapsed:>9}")
+                name, elapsed = "", ""
+
+    if uses_seq_scan:
+        print("\nSome filter combinations read atm_logs with a sequential scan.")
+        return 1
+    print("\nAll filter combinations use an index.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -47,4 +47,105 @@ def client():
     with TestClient(app) as c:
         yield c
     # После тестов (если нужно очистить):
-    # Base.metadata.drop_all(bind=engine_test) # Осторожно, если тесты параллельные
\ No newline at end of file
+    # Base.metadata.drop_all(bind=engine_test) # Осторожно, если тесты параллельные
+
+# --- Сессия для тестов на уровне crud ---
+# Роутеры импортируют модули приложения "плоско" (import models, import crud),
+# поэтому и таблицы берем из того же database.Base, на котором объявлены модели.
+import database as app_database
+import models as app_models
+
+
+def seed_reference_rows(session):
+    """Минимальные справочники (как в lab4.sql) и два банкомата."""
+    session.add_all([
+        app_models.ATMStatus(id=1, name="active"),
+        app_models.LogLevel(id=1, name="DEBUG", severity_order=1),
+        app_models.LogLevel(id=2, name="INFO", severity_order=2),
+        app_models.LogLevel(id=4, name="ERROR", severity_order=4),
+        app_models.EventType(id=1, name="CASH_WITHDRAWAL", category="TRANSACTION"),
+        app_models.EventType(id=11, name="CARD_JAMMED", category="OPERATIONAL_ISSUE"),
+    ])
+    session.add_all([
+        app_models.ATM(id=1, atm_uid="1001", status_id=1),
+        app_models.ATM(id=2, atm_uid="1002", status_id=1),
+    ])
+    session.commit()
+
+
+@pytest.fixture()
+def db():
+    engine = create_engine(
+        "sqlite:///:memory:",
+        poolclass=StaticPool,
+        connect_args={"check_same_thread": False}
+    )
+    app_database.Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    seed_reference_rows(session)
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+
+# --- Клиент API поверх SQLite-файла (синхронный и асинхронный движки смотрят в одну БД) ---
+import asyncio
+import deps as app_deps
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+
+@pytest.fixture()
+def api(tmp_path):
+    """
+    TestClient с подмененными get_db / get_async_db и пользователем-администратором.
+    api.session - синхронная сессия для подготовки данных, api.statements - выполненные запросы SQL.
+    """
+    db_file = tmp_path / "api.db"
+    sync_engine = create_engine(f"sqlite:///{db_file}", connect_args={"check_same_thread": False})
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{db_file}")
+    app_database.Base.metadata.create_all(bind=sync_engine)
+    SyncSession = sessionmaker(autocommit=False, autoflush=False, bind=sync_engine)
+    session = SyncSession()
+    seed_reference_rows(session)
+
+    statements = []
+    record = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(sync_engine, "before_cursor_execute", record)
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+
+    def override_sync_db():
+        sync_db = SyncSession()
+        try:
+            yield sync_db
+        finally:
+            sync_db.close()
+
+    async def override_async_db():
+        async with AsyncSession(async_engine, expire_on_commit=False) as async_db:
+            yield async_db
+
+    admin = app_models.User(id=1, username="admin", email="admin@example.com", password_hash="-", role="admin")
+    overrides = {
+        app_database.get_db: override_sync_db,
+        app_database.get_async_db: override_async_db,
+        app_database.get_async_sessionmaker: lambda: async_sessionmaker(bind=async_engine, expire_on_commit=False),
+        app_database.get_sessionmaker: lambda: SyncSession,
+        app_deps.get_current_user: lambda: admin,
+        app_deps.get_current_admin_or_superuser: lambda: admin,
+    }
+    app.dependency_overrides.update(overrides)
+    client = TestClient(app)
+    client.session = session
+    client.statements = statements
+    try:
+        yield client
+    finally:
+        for dependency in overrides:
+            app.dependency_overrides.pop(dependency, None)
+        session.close()
+        sync_engine.dispose()
+        # Соединения aiosqlite держат свои потоки: без dispose процесс pytest не завершится
+        asyncio.run(async_engine.dispose())
@@ -0,0 +1,77 @@
+# tests/test_alert_rules.py
+import json
+from datetime import datetime, timezone
+
+import pytest
+from pydantic import ValidationError
+
+import alert_rules
+import crud
+import refdata
+import schemas
+import security
+from app.main import app
+
+
+def make_log(**overrides) -> schemas.ATMLogBatchItem:
+    data = {
+        "atm_id": 1,
+        "event_timestamp": datetime(2025, 5, 11, 12, 0, tzinfo=timezone.utc),
+        "message": "event",
+        "log_level_id": 2,
+    }
+    data.update(overrides)
+    return schemas.ATMLogBatchItem(**data)
+
+
+def test_load_rules(tmp_path):
+    assert alert_rules.load_rules("") == alert_rules.DEFAULT_RULES
+    rules = [{"name": "jam", "event_types": ["CARD_JAMMED"], "payload": [{"path": "a.b", "op": "gte", "value": 3}]}]
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps(rules), encoding="utf-8")
+    assert alert_rules.load_rules(str(path)) == alert_rules.load_rules(json.dumps(rules))
+    assert alert_rules.load_rules(str(path))[0].payload[0].op == "gte"
+    with pytest.raises(ValidationError):
+        alert_rules.load_rules('[{"name": "bad", "payload": [{"path": "x", "op": "like"}]}]')
+
+
+def test_classify_batch(db, monkeypatch):
+    monkeypatch.setattr(alert_rules, "rules", alert_rules.load_rules(json.dumps([
+        {"name": "errors", "min_severity": 4},
+        {"name": "jam-code", "levels": ["INFO"], "event_categories": ["OPERATIONAL_ISSUE"],
+         "payload": [{"path": "error_code", "op": "in", "value": ["CJ-001", "CJ-002"]}]},
+        {"name": "low-cash", "event_types": ["CASH_WITHDRAWAL"],
+         "payload": [{"path": "cash.remaining", "op": "lt", "value": 20}, {"path": "cash.manual", "op": "exists", "value": False}]},
+    ])))
+    reference = refdata.get_reference_data(db)
+    logs = [
+        make_log(log_level_id=4),
+        make_log(log_level_id=1, is_alert=True),  # Флаг клиента сохраняется
+        make_log(event_type_id=11, payload={"error_code": "CJ-002"}),
+        make_log(event_type_id=11, payload={"error_code": "XX"}),
+        make_log(log_level_id=1, event_type_id=11, payload={"error_code": "CJ-001"}),
+        make_log(event_type_id=1, payload={"cash": {"remaining": 5}}),
+        make_log(event_type_id=1, payload={"cash": {"remaining": "5"}}),  # Несравнимые типы
+        make_log(event_type_id=1, payload={"cash": {"remaining": 5, "manual": True}}),
+        make_log(event_type_id=1),
+        make_log(),
+    ]
+    assert alert_rules.classify(logs, reference) == [True, True, True, False, False, True, False, False, False, False]
+
+
+def test_ingest_sets_is_alert_without_trigger(api, db, monkeypatch):
+    monkeypatch.setattr(alert_rules, "rules", alert_rules.load_rules(
+        '[{"name": "jam", "event_types": ["CARD_JAMMED"]}]'
+    ))
+    results = crud.create_atm_logs_bulk(db, [make_log(log_level_id=4), make_log(event_type_id=11)])
+    assert [crud.get_atm_log(db, log_id).is_alert for log_id, _ in results] == [False, True]
+    assert crud.create_atm_log(db, schemas.ATMLogCreate(**make_log(event_type_id=11).model_dump()), atm_id=1).is_alert
+
+    app.dependency_overrides[security.get_api_key] = lambda: "test-key"
+    try:
+        record = {"event_timestamp": "2025-05-11T12:00:00Z", "message": "m", "log_level_id": 2, "event_type_id": 11}
+        response = api.post("/api/v1/atms/1/logs/", json=record)
+        assert response.status_code == 201 and response.json()["is_alert"] is True
+        assert api.post("/api/v1/atms/1/logs/", json=dict(record, event_type_id=1)).json()["is_alert"] is False
+    finally:
+        app.dependency_overrides.pop(security.get_api_key, None)
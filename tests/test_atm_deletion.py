@@ -0,0 +1,88 @@
+# tests/test_atm_deletion.py
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import false, func, select
+
+import atm_deletion
+import crud
+import models
+import schemas
+import security
+from app.main import app
+
+
+def add_logs(session, atm_id: int, count: int):
+    start = datetime(2025, 5, 11, 12, 0, tzinfo=timezone.utc)
+    crud.create_atm_logs_bulk(session, [
+        schemas.ATMLogBatchItem(atm_id=atm_id, event_timestamp=start + timedelta(minutes=i), message=f"event {i}",
+                                log_level_id=2)
+        for i in range(count)
+    ])
+
+
+def count(session, model, **criteria) -> int:
+    session.expire_all()
+    return session.scalar(select(func.count()).select_from(model).filter_by(**criteria))
+
+
+def test_delete_atm_archives_logs_in_chunks(api, monkeypatch):
+    add_logs(api.session, 1, 7)
+    add_logs(api.session, 2, 2)
+    monkeypatch.setattr(atm_deletion.settings, "ATM_DELETE_CHUNK_SIZE", 3)
+    api.statements.clear()
+
+    response = api.delete("/api/v1/atms/1?archive=true")
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+    assert response.headers["location"].endswith(f"/api/v1/atms/deletions/{job_id}")
+
+    # TestClient выполняет фоновую задачу до возврата ответа
+    job = api.get(f"/api/v1/atms/deletions/{job_id}").json()
+    assert (job["status"], job["total_logs"], job["deleted_logs"], job["archived_logs"]) == ("completed", 7, 7, 7)
+    deletes = [s for s in api.statements if s.startswith("DELETE FROM atm_logs")]
+    assert len(deletes) == 3  # Пачки 3 + 3 + 1, без загрузки логов в ORM
+
+    assert api.get("/api/v1/atms/1").status_code == 404
+    assert count(api.session, models.ATMLog, atm_id=1) == 0
+    assert count(api.session, models.ATMLog, atm_id=2) == 2
+    assert count(api.session, models.ATMLogArchive, atm_id=1) == 7
+    assert {row.message for row in api.session.scalars(select(models.ATMLogArchive))} == {f"event {i}" for i in range(7)}
+
+
+def test_delete_atm_without_archive_and_unknown_ids(api):
+    add_logs(api.session, 2, 3)
+    job = api.delete("/api/v1/atms/2").json()
+    assert (job["status"], job["archive"]) == ("queued", False)
+    assert api.get(f"/api/v1/atms/deletions/{job['job_id']}").json()["deleted_logs"] == 3
+    assert count(api.session, models.ATMLogArchive) == 0
+
+    assert api.delete("/api/v1/atms/2").status_code == 404
+    assert api.get("/api/v1/atms/deletions/unknown").status_code == 404
+
+
+def test_final_transaction_archives_logs_left_after_chunks(api, monkeypatch):
+    add_logs(api.session, 1, 4)
+    # Пачки ничего не находят - как если бы логи пришли после последней пачки
+    monkeypatch.setattr(atm_deletion, "_next_chunk", lambda atm_id: select(models.ATMLog.id).where(false()))
+
+    job_id = api.delete("/api/v1/atms/1?archive=true").json()["job_id"]
+    job = api.get(f"/api/v1/atms/deletions/{job_id}").json()
+    assert (job["status"], job["total_logs"], job["deleted_logs"], job["archived_logs"]) == ("completed", 4, 4, 4)
+    assert count(api.session, models.ATMLogArchive, atm_id=1) == 4
+    assert count(api.session, models.ATM, id=1) == 0
+
+
+def test_atm_being_deleted_rejects_new_logs(api):
+    atm = api.session.get(models.ATM, 1)
+    atm.deletion_requested_at = datetime.now(timezone.utc)
+    api.session.commit()
+
+    app.dependency_overrides[security.get_api_key] = lambda: "test-key"
+    try:
+        record = {"event_timestamp": "2025-05-11T12:00:00Z", "message": "late", "log_level_id": 2}
+        assert api.post("/api/v1/atms/1/logs/", json=record).status_code == 404
+        batch = api.post("/api/v1/atms/logs/batch", json=[dict(record, atm_id=1), dict(record, atm_id=2)]).json()
+    finally:
+        app.dependency_overrides.pop(security.get_api_key, None)
+    assert batch["accepted"] == 1
+    assert count(api.session, models.ATMLog, atm_id=1) == 0
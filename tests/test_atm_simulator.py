@@ -0,0 +1,55 @@
+# tests/test_atm_simulator.py
+import asyncio
+
+import httpx
+import pytest
+from sqlalchemy import func, select
+
+import models
+import security
+from app.main import app
+
+pytest.importorskip("requests")  # Зависимость однобанкоматного режима симулятора (requirements_simulator.txt)
+import atm_simulator  # noqa: E402
+
+
+@pytest.fixture()
+def keyed_api(api):
+    app.dependency_overrides[security.get_api_key] = lambda: "test-key"
+    yield api
+    app.dependency_overrides.pop(security.get_api_key, None)
+
+
+def test_helpers():
+    assert atm_simulator.parse_atm_ids("1-3, 7") == [1, 2, 3, 7]
+    assert atm_simulator.percentile([5, 1, 3, 2, 4], 50) == 3
+    assert atm_simulator.percentile([5, 1, 3, 2, 4], 99) == 5
+    assert atm_simulator.percentile([], 50) is None
+
+    scenario = atm_simulator.Scenario("incident", list(range(1, 101)), burst_factor=10,
+                                      incident_start=5, incident_duration=10, incident_share=0.1)
+    assert (scenario.rate_multiplier(1), scenario.rate_multiplier(6), scenario.rate_multiplier(15)) == (1, 10, 1)
+    alerts = [scenario.next_event(6) for _ in range(200)]
+    assert sum(record["atm_id"] in scenario.incident_atm_ids for record in alerts) > 150
+    with pytest.raises(ValueError):
+        atm_simulator.Scenario("unknown", [1])
+
+
+@pytest.mark.parametrize("batch_size", [0, 5])
+def test_fleet_run_reports_throughput_and_latency(keyed_api, batch_size):
+    config = atm_simulator.FleetConfig(
+        atm_ids=[1, 2], rate=200, duration=0.3, concurrency=4, batch_size=batch_size,
+        api_base_url="http://test/api/v1", api_key="test-key",
+    )
+    report = asyncio.run(atm_simulator.run_fleet(config, transport=httpx.ASGITransport(app=app)))
+
+    assert report["generated"] > 0 and report["dropped"] == 0 and report["failed"] == 0
+    # Часть событий симулятора ссылается на уровни, которых нет в тестовых справочниках
+    assert report["accepted"] + report["rejected"] == report["generated"]
+    stored = keyed_api.session.scalar(select(func.count()).select_from(models.ATMLog))
+    assert stored == report["accepted"] > 0
+    assert report["endpoint"] == ("batch" if batch_size else "single")
+    if not batch_size:
+        assert report["requests"] == report["generated"]
+    assert set(report["latency_ms"]) == {"p50", "p90", "p99", "p99.9", "max"}
+    assert report["latency_ms"]["p50"] <= report["latency_ms"]["max"] <= report["delay_ms"]["max"]
@@ -0,0 +1,86 @@
+# tests/test_broadcast.py
+import asyncio
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+import broadcast
+import schemas
+import security
+from app.main import app
+from config import settings
+from routers import logs as logs_router
+
+LEVEL_INFO = schemas.LogLevel(id=2, name="INFO", severity_order=2)
+
+
+def make_log(log_id: int, atm_id: int = 1, is_alert: bool = False) -> schemas.ATMLog:
+    moment = datetime(2025, 5, 11, tzinfo=timezone.utc)
+    return schemas.ATMLog(
+        id=log_id, atm_id=atm_id, event_timestamp=moment, recorded_at=moment, message=f"event {log_id}",
+        is_alert=is_alert, log_level_id=2, log_level=LEVEL_INFO
+    )
+
+
+def test_bus_filters_and_drops_slow_consumers(monkeypatch):
+    monkeypatch.setattr(settings, "LOG_STREAM_QUEUE_SIZE", 2)
+
+    async def scenario():
+        alerts = broadcast.bus.subscribe(broadcast.LogFilter(atm_ids=frozenset({1}), is_alert=True))
+        everything = broadcast.bus.subscribe(broadcast.LogFilter())
+        broadcast.bus.publish([make_log(1), make_log(2, is_alert=True), make_log(3, atm_id=2, is_alert=True)])
+
+        assert (await alerts.get()).id == 2
+        assert alerts.queue.empty()
+        # В очереди everything два события - третье не поместилось, подписка закрыта
+        assert everything.dropped and everything not in broadcast.bus.subscriptions
+        assert await everything.get() is broadcast.DROPPED
+        broadcast.bus.unsubscribe(alerts)
+
+    asyncio.run(scenario())
+
+
+def test_sse_events_format_and_unsubscribe():
+    async def scenario():
+        subscription = broadcast.bus.subscribe(broadcast.LogFilter())
+        events = logs_router._sse_events(subscription)
+        assert await events.__anext__() == "retry: 3000\n\n"
+        broadcast.bus.publish([make_log(7), make_log(8)])
+        chunk = await events.__anext__()
+        assert chunk.startswith("id: 7\nevent: log\ndata: ")
+        assert chunk.count("event: log") == 2
+        assert json.loads(chunk.split("data: ")[1].split("\n")[0])["message"] == "event 7"
+        await events.aclose()
+        assert subscription not in broadcast.bus.subscriptions
+
+    asyncio.run(scenario())
+
+
+@pytest.fixture()
+def ingest(api):
+    app.dependency_overrides[security.get_api_key] = lambda: "test-key"
+    yield api
+    app.dependency_overrides.pop(security.get_api_key, None)
+
+
+def test_ingested_logs_are_published(ingest):
+    record = {"event_timestamp": "2025-05-11T12:00:00Z", "message": "card jam", "log_level_id": 4, "is_alert": True}
+
+    async def scenario():
+        subscription = broadcast.bus.subscribe(broadcast.LogFilter(atm_ids=frozenset({2})))
+        try:
+            # Приложение в TestClient работает в своем потоке и цикле событий - публикация идет через call_soon_threadsafe
+            assert (await asyncio.to_thread(ingest.post, "/api/v1/atms/2/logs/", json=record)).status_code == 201
+            batch = [dict(record, atm_id=1, message="other atm"), dict(record, atm_id=2, message="batch")]
+            assert (await asyncio.to_thread(ingest.post, "/api/v1/atms/logs/batch", json=batch)).json()["accepted"] == 2
+
+            single = await asyncio.wait_for(subscription.get(), timeout=1)
+            batched = await asyncio.wait_for(subscription.get(), timeout=1)
+            assert [json.loads(e.data)["message"] for e in (single, batched)] == ["card jam", "batch"]
+            assert json.loads(batched.data)["log_level"]["name"] == "ERROR" and batched.id > single.id
+            assert subscription.queue.empty()
+        finally:
+            broadcast.bus.unsubscribe(subscription)
+
+    asyncio.run(scenario())
@@ -0,0 +1,75 @@
+# tests/test_bulk_alerts.py
+from datetime import datetime, timedelta, timezone
+
+import crud
+import models
+import schemas
+from routers import logs as logs_router
+
+START = datetime(2025, 5, 11, 12, 0, tzinfo=timezone.utc)
+
+
+def add_logs(session):
+    """6 логов банкомата 1: алерты CARD_JAMMED - четные, INFO - нечетные."""
+    results = crud.create_atm_logs_bulk(session, [
+        schemas.ATMLogBatchItem(
+            atm_id=1, event_timestamp=START + timedelta(minutes=i), message=f"event {i}",
+            log_level_id=4 if i % 2 == 0 else 2, event_type_id=11 if i % 2 == 0 else None, is_alert=i % 2 == 0
+        )
+        for i in range(6)
+    ])
+    return [log_id for log_id, _ in results]
+
+
+def open_alerts(api) -> int:
+    api.session.expire_all()
+    return api.session.get(models.ATMHealth, 1).unacknowledged_alerts
+
+
+def test_bulk_acknowledge_by_ids_reports_skipped(api):
+    ids = add_logs(api.session)
+    assert api.patch(f"/api/v1/logs/{ids[0]}/acknowledge").status_code == 200
+
+    response = api.patch("/api/v1/logs/bulk/acknowledge", json={"ids": [ids[0], ids[1], ids[2], ids[4], 999]})
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["updated"], body["updated_ids"], body["has_more"]) == (2, [ids[2], ids[4]], False)
+    assert {s["id"]: s["reason"] for s in body["skipped"]} == {
+        ids[0]: "already_acknowledged", ids[1]: "not_alert", 999: "not_found"
+    }
+    assert open_alerts(api) == 0
+    assert api.get(f"/api/v1/logs/{ids[2]}").json()["acknowledged_by_user_id"] == 1
+
+
+def test_bulk_acknowledge_by_filter_in_chunks(api, monkeypatch):
+    ids = add_logs(api.session)
+    monkeypatch.setattr(logs_router.settings, "LOG_BULK_UPDATE_MAX_ROWS", 2)
+    selection = {"filter": {"atm_id": 1, "event_type_id": 11, "end_time": (START + timedelta(minutes=10)).isoformat()}}
+
+    first = api.patch("/api/v1/logs/bulk/acknowledge", json=selection).json()
+    assert (first["updated_ids"], first["has_more"], first["skipped"]) == ([ids[0], ids[2]], True, [])
+    second = api.patch("/api/v1/logs/bulk/acknowledge", json=selection).json()
+    assert (second["updated_ids"], second["has_more"]) == ([ids[4]], False)
+    assert api.patch("/api/v1/logs/bulk/acknowledge", json=selection).json()["updated"] == 0
+    assert open_alerts(api) == 0
+
+
+def test_bulk_alert_status_keeps_rollups_consistent(api):
+    ids = add_logs(api.session)
+    response = api.patch("/api/v1/logs/bulk/alert_status", json={"ids": ids[:2], "is_alert": True})
+    assert response.json()["updated_ids"] == [ids[1]]
+    assert response.json()["skipped"] == [{"id": ids[0], "reason": "unchanged"}]
+    assert open_alerts(api) == 4
+
+    response = api.patch("/api/v1/logs/bulk/alert_status", json={"filter": {"message": "event"}, "is_alert": False})
+    assert response.json()["updated"] == 4
+    assert open_alerts(api) == 0
+    histogram = api.get("/api/v1/logs/histogram?bucket=1d&is_alert=true&start_time=2025-05-11T00:00:00Z").json()
+    assert histogram["buckets"] == []
+
+
+def test_bulk_selection_validation(api):
+    assert api.patch("/api/v1/logs/bulk/acknowledge", json={}).status_code == 422
+    assert api.patch("/api/v1/logs/bulk/acknowledge", json={"ids": [1], "filter": {"atm_id": 1}}).status_code == 422
+    assert api.patch("/api/v1/logs/bulk/acknowledge", json={"filter": {}}).status_code == 422
+    assert api.patch("/api/v1/logs/bulk/alert_status", json={"ids": [1]}).status_code == 422
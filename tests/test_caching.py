@@ -0,0 +1,126 @@
+# tests/test_caching.py
+import asyncio
+from datetime import datetime, timezone
+
+import httpx
+import pytest
+
+import caching
+import crud
+import models
+import schemas
+from app.main import app
+from config import settings
+
+
+@pytest.fixture()
+def cached_api(api):
+    asyncio.run(caching.init_cache(url=""))  # Хранилище в памяти процесса вместо Redis
+    yield api
+    asyncio.run(caching.close_cache())
+
+
+def test_tag_invalidation_changes_key():
+    async def scenario():
+        await caching.init_cache(url="")
+        try:
+            before = await caching.tagged_key("atm", {"atm_id": 1}, caching.atm_tags(1))
+            caching.invalidate_tags({"atm:2"})
+            assert await caching.tagged_key("atm", {"atm_id": 1}, caching.atm_tags(1)) == before
+            caching.invalidate_tags({"atm:1"})
+            assert await caching.tagged_key("atm", {"atm_id": 1}, caching.atm_tags(1)) != before
+        finally:
+            await caching.close_cache()
+
+    asyncio.run(scenario())
+    with pytest.raises(ValueError):
+        caching.create_backend("memcached://localhost")
+
+
+def test_atm_detail_is_cached_until_atm_changes(cached_api):
+    first = cached_api.get("/api/v1/atms/1")
+    cached_api.statements.clear()
+    second = cached_api.get("/api/v1/atms/1")
+    assert second.headers[caching.CACHE_STATUS_HEADER] == "HIT"
+    assert second.json() == first.json() and cached_api.statements == []
+
+    db_atm = crud.get_atm(cached_api.session, atm_id=1)
+    crud.update_atm(cached_api.session, db_atm, schemas.ATMUpdate(location_description="Lobby"))
+    assert cached_api.get("/api/v1/atms/1").json()["location_description"] == "Lobby"
+
+
+def test_log_list_cache_keeps_headers_and_is_invalidated_per_atm(cached_api, monkeypatch):
+    url_all, url_atm1 = "/api/v1/logs/?count=exact", "/api/v1/logs/?count=exact&atm_id=1"
+    assert cached_api.get(url_all).headers[caching.CACHE_STATUS_HEADER] == "MISS"
+    cached_api.get(url_atm1)
+    hit = cached_api.get(url_all)
+    assert hit.headers[caching.CACHE_STATUS_HEADER] == "HIT" and hit.headers["X-Total-Count"] == "0"
+
+    crud.create_atm_logs_bulk(cached_api.session, [schemas.ATMLogBatchItem(
+        atm_id=2, event_timestamp=datetime(2025, 5, 11, tzinfo=timezone.utc), message="new", log_level_id=2
+    )])
+    assert cached_api.get(url_atm1).headers[caching.CACHE_STATUS_HEADER] == "HIT"  # Лог другого банкомата
+    assert cached_api.get("/api/v1/logs/?count=exact&atm_id=2").json()[0]["message"] == "new"
+    # Общий список вставкой не сбрасывается - новые логи появляются в нем по TTL
+    assert cached_api.get(url_all).headers[caching.CACHE_STATUS_HEADER] == "HIT"
+    monotonic = caching.time.monotonic
+    monkeypatch.setattr(caching.time, "monotonic", lambda: monotonic() + settings.LOGS_CACHE_TTL_SECONDS + 1)
+    fresh = cached_api.get(url_all)
+    monkeypatch.undo()
+    assert fresh.headers["X-Total-Count"] == "1" and fresh.json()[0]["message"] == "new"
+
+    # Изменение существующего лога сбрасывает и общий список
+    crud.update_log_alert_status(cached_api.session, cached_api.session.get(models.ATMLog, fresh.json()[0]["id"]), True)
+    assert cached_api.get(url_all).headers[caching.CACHE_STATUS_HEADER] == "MISS"
+    # Поиск по тексту не кешируется
+    assert caching.CACHE_STATUS_HEADER not in cached_api.get("/api/v1/logs/?message=new").headers
+
+
+def test_reference_endpoints_are_invalidated_by_writes(cached_api):
+    assert len(cached_api.get("/api/v1/logs/levels/").json()) == 3
+    cached_api.session.add(models.LogLevel(id=5, name="CRITICAL", severity_order=5))
+    cached_api.session.commit()
+    assert [level["name"] for level in cached_api.get("/api/v1/logs/levels/").json()][-1] == "CRITICAL"
+
+
+class SlowTagBackend(caching.RedisCacheBackend):
+    """Как Redis: версии тегов увеличиваются после commit асинхронно и с задержкой."""
+
+    def __init__(self):
+        self.memory = caching.MemoryCacheBackend()
+        self._loop = asyncio.get_running_loop()
+        self._pending = set()
+
+    async def get(self, key):
+        return await self.memory.get(key)
+
+    async def get_many(self, keys):
+        return await self.memory.get_many(keys)
+
+    async def set(self, key, value, expire=None):
+        await self.memory.set(key, value, expire)
+
+    async def _incr_many(self, keys):
+        await asyncio.sleep(0.05)
+        self.memory.invalidate_soon(keys)
+
+    async def close(self):
+        pass
+
+
+def test_write_response_waits_for_tag_invalidation(api):
+    async def scenario():
+        await caching.init_cache(url="")
+        caching._backend = SlowTagBackend()
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+                await client.get("/api/v1/atms/1")
+                assert (await client.get("/api/v1/atms/1")).headers[caching.CACHE_STATUS_HEADER] == "HIT"
+                assert (await client.put("/api/v1/atms/1", json={"location_description": "Lobby"})).status_code == 200
+                return await client.get("/api/v1/atms/1")
+        finally:
+            await caching.close_cache()
+
+    response = asyncio.run(scenario())
+    assert caching.CACHE_STATUS_HEADER not in response.headers
+    assert response.json()["location_description"] == "Lobby"
@@ -0,0 +1,15 @@
+# tests/test_database.py
+import pytest
+
+from database import to_async_database_url
+
+
+def test_to_async_database_url_switches_driver():
+    assert to_async_database_url("postgresql://u:p@db:5432/lab4") == "postgresql+asyncpg://u:p@db:5432/lab4"
+    assert to_async_database_url("postgresql+psycopg2://u:p@db/lab4") == "postgresql+asyncpg://u:p@db/lab4"
+    assert to_async_database_url("sqlite:///./test.db") == "sqlite+aiosqlite:///./test.db"
+
+
+def test_to_async_database_url_unknown_backend():
+    with pytest.raises(ValueError):
+        to_async_database_url("mysql://u:p@db/lab4")
@@ -0,0 +1,49 @@
+# tests/test_export.py
+import csv
+import io
+import json
+from datetime import datetime, timedelta, timezone
+
+import export
+import models
+
+
+def add_logs(session, count: int):
+    start = datetime(2025, 5, 11, 12, 0, tzinfo=timezone.utc)
+    session.add_all([
+        models.ATMLog(atm_id=1 + i % 2, event_timestamp=start + timedelta(seconds=i), message=f"event {i}",
+                      log_level_id=(2, 4)[i % 2], event_type_id=(1, 11, None)[i % 3])
+        for i in range(count)
+    ])
+    session.commit()
+
+
+def test_export_ndjson_streams_filtered_logs_in_one_query(api, monkeypatch):
+    add_logs(api.session, 30)
+    monkeypatch.setattr(export.settings, "LOG_EXPORT_CHUNK_SIZE", 4)
+    api.get("/api/v1/logs/export?atm_id=1")  # Прогрев кеша справочников
+    api.statements.clear()
+
+    response = api.get("/api/v1/logs/export?atm_id=1&log_level_id=2")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert 'filename="atm_logs.ndjson"' in response.headers["content-disposition"]
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert len(rows) == 15
+    assert all(row["atm_id"] == 1 and row["log_level"]["name"] == "INFO" for row in rows)
+    assert [row["message"] for row in rows[:2]] == ["event 0", "event 2"]  # По умолчанию по возрастанию времени
+    assert len(api.statements) == 1  # Один SELECT, без COUNT(*) и постраничных запросов
+
+
+def test_export_csv_and_invalid_filters(api):
+    add_logs(api.session, 6)
+    response = api.get("/api/v1/logs/export?format=csv&sort_order=desc&q=event")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [row["message"] for row in rows] == [f"event {i}" for i in range(5, -1, -1)]
+    assert rows[0]["log_level"] == "ERROR" and rows[0]["event_type"] == ""
+
+    assert api.get("/api/v1/logs/export?q=***").status_code == 400
+    assert api.get("/api/v1/logs/export?payload_contains=[1]").status_code == 400
+    assert api.get("/api/v1/logs/export?format=xml").status_code == 422
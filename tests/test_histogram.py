@@ -0,0 +1,52 @@
+# tests/test_histogram.py
+from datetime import datetime, timedelta, timezone
+
+import crud
+import schemas
+
+START = datetime(2025, 5, 11, 10, 0, tzinfo=timezone.utc)
+
+
+def add_logs(session):
+    """По 12 логов в 10:00-11:55 и 12:00-12:55 (каждые 10 минут), ERROR - каждый третий."""
+    crud.create_atm_logs_bulk(session, [
+        schemas.ATMLogBatchItem(
+            atm_id=1 + i % 2, event_timestamp=START + timedelta(minutes=10 * i), message=f"event {i}",
+            log_level_id=4 if i % 3 == 0 else 2, event_type_id=11 if i % 3 == 0 else None, is_alert=i % 3 == 0
+        )
+        for i in range(18)
+    ])
+
+
+def counts(response):
+    assert response.status_code == 200, response.text
+    body = response.json()
+    return body["source"], [(b["bucket_start"][11:16], b["group_name"] or b["group_id"], b["count"]) for b in body["buckets"]]
+
+
+def test_histogram_combines_rollups_and_raw_edges(api):
+    add_logs(api.session)
+    # 10:30 - 12:30: часы 11:00 из сводок, края 10:30-11:00 и 12:00-12:30 - по atm_logs
+    params = "start_time=2025-05-11T10:30:00Z&end_time=2025-05-11T12:30:00Z"
+    source, buckets = counts(api.get(f"/api/v1/logs/histogram?bucket=1h&group_by=level&{params}"))
+    assert source == "rollup"
+    assert buckets == [("10:00", "INFO", 2), ("10:00", "ERROR", 1), ("11:00", "INFO", 4), ("11:00", "ERROR", 2),
+                       ("12:00", "INFO", 2), ("12:00", "ERROR", 2)]
+
+    # Тот же результат при подсчете только по atm_logs (фильтр, которого нет в сводках)
+    assert counts(api.get(f"/api/v1/logs/histogram?bucket=1h&group_by=level&{params}&is_acknowledged=false"))[1] == buckets
+
+    source, buckets = counts(api.get(f"/api/v1/logs/histogram?bucket=1d&group_by=event_type&is_alert=true&atm_id=1"))
+    assert (source, buckets) == ("rollup", [("00:00", "CARD_JAMMED", 3)])
+
+
+def test_histogram_minute_buckets_and_limits(api):
+    add_logs(api.session)
+    source, buckets = counts(api.get(
+        "/api/v1/logs/histogram?bucket=1m&group_by=atm&start_time=2025-05-11T10:00:00Z&end_time=2025-05-11T10:25:00Z"
+    ))
+    assert (source, buckets) == ("raw", [("10:00", 1, 1), ("10:10", 2, 1), ("10:20", 1, 1)])
+
+    assert api.get("/api/v1/logs/histogram?bucket=1m").status_code == 400
+    assert api.get("/api/v1/logs/histogram?bucket=1m&start_time=2025-01-01T00:00:00Z").status_code == 400
+    assert api.get("/api/v1/logs/histogram?bucket=1w").status_code == 422
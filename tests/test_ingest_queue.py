@@ -0,0 +1,128 @@
+# tests/test_ingest_queue.py
+import asyncio
+
+import httpx
+import pytest
+from sqlalchemy import func, select
+
+import ingest_queue
+import models
+import profiling
+import schemas
+import security
+from app.main import app
+
+RECORD = {"event_timestamp": "2025-05-11T12:00:00Z", "message": "queued", "log_level_id": 2}
+
+
+@pytest.fixture()
+def queued(api, monkeypatch):
+    """Режим queued со свежей очередью; запросы идут через ASGITransport в одном цикле событий с писателем."""
+    monkeypatch.setattr(ingest_queue.settings, "LOG_INGEST_MODE", "queued")
+    monkeypatch.setattr(ingest_queue, "queue", ingest_queue.IngestQueue(maxsize=100, flush_rows=8, flush_interval_ms=20))
+    app.dependency_overrides[security.get_api_key] = lambda: "test-key"
+    yield api
+    app.dependency_overrides.pop(security.get_api_key, None)
+
+
+def run_requests(scenario):
+    async def wrapper():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            result = await scenario(client)
+        await ingest_queue.queue.stop()
+        return result
+    return asyncio.run(wrapper())
+
+
+def stored_logs(api) -> int:
+    return api.session.scalar(select(func.count()).select_from(models.ATMLog))
+
+
+def test_flush_durability_groups_commits_and_returns_ids(queued, monkeypatch):
+    monkeypatch.setattr(ingest_queue.settings, "LOG_INGEST_DURABILITY", "flush")
+
+    async def scenario(client):
+        responses = await asyncio.gather(*[
+            client.post(f"/api/v1/atms/{1 + i % 2}/logs/", json=dict(RECORD, message=f"event {i}")) for i in range(20)
+        ])
+        missing = await client.post("/api/v1/atms/99/logs/", json=RECORD)
+        bad_level = await client.post("/api/v1/atms/1/logs/", json=dict(RECORD, log_level_id=3))
+        return responses, missing, bad_level
+
+    responses, missing, bad_level = run_requests(scenario)
+    assert {r.status_code for r in responses} == {202}
+    assert {r.json()["status"] for r in responses} == {"stored"}
+    assert len({r.json()["id"] for r in responses}) == 20
+    assert missing.status_code == 404 and bad_level.status_code == 400
+
+    stats = ingest_queue.queue.stats()
+    assert (stats.written, stats.rejected, stats.depth, stats.running) == (20, 1, 0, False)
+    assert stats.flushes <= 4  # 21 запись пачками до 8, а не commit на каждую
+    assert stored_logs(queued) == 20
+    assert queued.get("/api/v1/atms/logs/queue").json()["written"] == 20
+
+
+def test_enqueue_durability_acknowledges_before_write(queued, monkeypatch):
+    monkeypatch.setattr(ingest_queue.settings, "LOG_INGEST_DURABILITY", "enqueue")
+
+    async def scenario(client):
+        response = await client.post("/api/v1/atms/1/logs/", json=RECORD)
+        return response, stored_logs(queued)
+
+    response, stored_before_flush = run_requests(scenario)
+    assert response.status_code == 202
+    assert response.json() == {"status": "queued", "id": None, "queue_depth": 1}
+    assert stored_before_flush == 0
+    assert stored_logs(queued) == 1  # Дописано при остановке очереди
+
+
+def test_write_failure_is_retryable_without_details(queued, monkeypatch):
+    monkeypatch.setattr(ingest_queue.settings, "LOG_INGEST_DURABILITY", "flush")
+
+    async def failing_bulk(db, logs):
+        raise RuntimeError('relation "atm_logs" does not exist')
+
+    monkeypatch.setattr(ingest_queue.crud_async, "create_atm_logs_bulk", failing_bulk)
+
+    async def scenario(client):
+        return await client.post("/api/v1/atms/1/logs/", json=RECORD)
+
+    response = run_requests(scenario)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert "atm_logs" not in response.text
+    assert ingest_queue.queue.stats().rejected == 1
+
+
+def test_writer_does_not_inherit_request_context(queued, monkeypatch):
+    monkeypatch.setattr(ingest_queue.settings, "LOG_INGEST_DURABILITY", "enqueue")
+    monkeypatch.setattr(profiling.settings, "SQL_PROFILE_TOKEN", "secret")
+    profiling.clear_profiles()
+
+    async def scenario(client):
+        # Первый запрос профилируется и запускает писателя, следующие пачки пишутся уже без него
+        first = await client.post("/api/v1/atms/1/logs/", json=RECORD, headers={"X-SQL-Profile": "secret"})
+        for i in range(3):
+            await client.post("/api/v1/atms/2/logs/", json=dict(RECORD, message=f"event {i}"))
+            await asyncio.sleep(0.05)
+        return first
+
+    first = run_requests(scenario)
+    assert stored_logs(queued) == 4
+    profile = profiling.get_profile(int(first.headers["x-sql-profile-id"]))
+    assert not any("atm_logs" in s.statement for s in profile.statements)
+    profiling.clear_profiles()
+
+
+def test_full_queue_rejects_without_blocking():
+    queue = ingest_queue.IngestQueue(maxsize=1, flush_rows=8, flush_interval_ms=20)
+    item = schemas.ATMLogBatchItem(atm_id=1, **RECORD)
+
+    async def scenario():
+        queue.ensure_started(session_factory=None)
+        queue.submit(item, wait_for_flush=False)
+        with pytest.raises(ingest_queue.IngestQueueFull):
+            queue.submit(item, wait_for_flush=False)
+        queue._writer.cancel()
+
+    asyncio.run(scenario())
@@ -0,0 +1,119 @@
+# tests/test_logs.py
+from datetime import datetime, timezone
+
+import pytest
+
+import crud
+import models
+import pagination
+import schemas
+import search
+
+
+def make_batch_item(**overrides) -> schemas.ATMLogBatchItem:
+    data = {
+        "atm_id": 1,
+        "event_timestamp": datetime(2025, 5, 11, 12, 0, tzinfo=timezone.utc),
+        "message": "Card jammed in reader",
+        "log_level_id": 4,
+        "event_type_id": 11,
+        "payload": {"error_code": "CJ-001"},
+    }
+    data.update(overrides)
+    return schemas.ATMLogBatchItem(**data)
+
+
+def test_create_atm_logs_bulk_reports_per_record_results(db):
+    logs = [
+        make_batch_item(atm_id=1),
+        make_batch_item(atm_id=999),  # Несуществующий банкомат
+        make_batch_item(atm_id=2, log_level_id=2, event_type_id=None),
+        make_batch_item(atm_id=2, event_type_id=12345),  # Несуществующий тип события
+    ]
+    results = crud.create_atm_logs_bulk(db, logs)
+
+    assert [log_id is not None for log_id, _ in results] == [True, False, True, False]
+    assert "ATM with id 999 not found" in results[1][1]
+    assert "EventType with id 12345 not found" in results[3][1]
+
+    stored = {log.id: log for log in db.query(models.ATMLog).all()}
+    assert set(stored) == {results[0][0], results[2][0]}
+    assert stored[results[0][0]].atm_id == 1
+    assert stored[results[2][0]].atm_id == 2
+    assert stored[results[0][0]].payload == {"error_code": "CJ-001"}
+
+
+def test_create_atm_logs_bulk_empty(db):
+    assert crud.create_atm_logs_bulk(db, []) == []
+
+
+def test_get_atm_logs_filters_open_alerts(db):
+    ids = [log_id for log_id, _ in crud.create_atm_logs_bulk(db, [make_batch_item() for _ in range(3)])]
+    # Уровень ERROR - алерт по правилам alert_rules по умолчанию
+    assert all(log.is_alert for log in db.query(models.ATMLog).all())
+    crud.acknowledge_alert(db, crud.get_atm_log(db, ids[0]), user_id=1)
+
+    open_alerts = crud.get_atm_logs(db, is_alert=True, is_acknowledged=False)
+    assert sorted(log.id for log in open_alerts) == sorted(ids[1:])
+    assert crud.get_atm_logs_count(db, is_alert=True, is_acknowledged=True) == 1
+
+
+def test_get_atm_logs_search_and_payload_filters(db):
+    results = crud.create_atm_logs_bulk(db, [
+        make_batch_item(message="Card jammed in reader", payload={"error_code": "CJ-001"}),
+        make_batch_item(message="Cash cassette low", payload={"error_code": "CL-002", "cassette": 2}),
+        make_batch_item(message="Card reader jammed again", payload={"error_code": "CJ-001", "retry": True}),
+    ])
+    ids = [log_id for log_id, _ in results]
+
+    found = crud.get_atm_logs(db, search_terms=search.parse_search_query("JAMM* card"))
+    assert sorted(log.id for log in found) == [ids[0], ids[2]]
+
+    found = crud.get_atm_logs(db, payload_contains={"error_code": "CJ-001", "retry": True})
+    assert [log.id for log in found] == [ids[2]]
+    assert crud.get_atm_logs_count(db, payload_contains={"cassette": 2}) == 1
+
+    # На SQLite релевантность одинакова, порядок - по времени, затем по id
+    ranked = crud.get_atm_logs(db, search_terms=search.parse_search_query("card"), order_by_relevance=True)
+    assert [log.id for log in ranked] == [ids[2], ids[0]]
+
+
+def test_parse_search_query_rejects_empty_and_bad_payload():
+    with pytest.raises(search.InvalidSearchQuery):
+        search.parse_search_query(" & ! ")
+    with pytest.raises(search.InvalidSearchQuery):
+        search.parse_payload_filter("[1, 2]")
+    terms = search.parse_search_query("Card jam*")
+    assert search.to_tsquery_text(terms) == "'card' & 'jam':*"
+
+
+def test_get_atm_logs_page_walks_forward_and_back(db):
+    base = datetime(2025, 5, 11, 12, 0)
+    # Два лога с одинаковым временем проверяют, что id разрешает ничьи
+    timestamps = [base.replace(minute=m) for m in (0, 1, 1, 2, 3)]
+    crud.create_atm_logs_bulk(db, [make_batch_item(event_timestamp=ts) for ts in timestamps])
+    expected = [log.id for log in crud.get_atm_logs(db, limit=100)]
+
+    seen = []
+    cursor = None
+    while True:
+        page = crud.get_atm_logs_page(db, limit=2, cursor=cursor)
+        seen.extend(log.id for log in page.items)
+        if page.next_cursor is None:
+            break
+        cursor = pagination.decode_cursor(page.next_cursor, descending=True, key_length=2)
+    assert seen == expected
+
+    # С последней страницы назад - получаем предыдущие две записи в том же порядке
+    back = crud.get_atm_logs_page(
+        db, limit=2, cursor=pagination.decode_cursor(page.prev_cursor, descending=True, key_length=2)
+    )
+    assert [log.id for log in back.items] == expected[2:4]
+
+
+def test_decode_cursor_rejects_foreign_sort_order():
+    token = pagination.encode_cursor((datetime(2025, 1, 1), 10), pagination.NEXT, descending=True)
+    with pytest.raises(pagination.InvalidCursorError):
+        pagination.decode_cursor(token, descending=False, key_length=2)
+    with pytest.raises(pagination.InvalidCursorError):
+        pagination.decode_cursor("not-a-cursor", descending=True, key_length=2)
@@ -0,0 +1,84 @@
+# tests/test_logs_batch.py
+import json
+
+import pytest
+from sqlalchemy import func, select
+
+import models
+import security
+from app.main import app
+from config import settings
+
+RECORD = {"event_timestamp": "2025-05-11T12:00:00Z", "message": "event", "log_level_id": 2}
+NDJSON = {"Content-Type": "application/x-ndjson"}
+
+
+@pytest.fixture()
+def ingest(api):
+    app.dependency_overrides[security.get_api_key] = lambda: "test-key"
+    yield api
+    app.dependency_overrides.pop(security.get_api_key, None)
+
+
+def stored_messages(api) -> list:
+    return sorted(api.session.scalars(select(models.ATMLog.message)))
+
+
+def statuses(response) -> list:
+    return [(r["index"], r["status"]) for r in response.json()["results"]]
+
+
+def test_json_array_batch_reports_each_record(ingest, monkeypatch):
+    monkeypatch.setattr(settings, "LOG_BATCH_CHUNK_SIZE", 2)
+    ingest.statements.clear()
+    batch = [
+        dict(RECORD, atm_id=1, message="a"),
+        dict(RECORD, atm_id=99, message="missing atm"),
+        {"atm_id": 1, "message": "no timestamp", "log_level_id": 2},
+        dict(RECORD, atm_id=2, message="b"),
+        dict(RECORD, atm_id=2, message="c", event_type_id=12345),
+    ]
+    response = ingest.post("/api/v1/atms/logs/batch", json=batch)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["accepted"], body["rejected"]) == (2, 3)
+    assert statuses(response) == [(0, "accepted"), (1, "rejected"), (2, "rejected"), (3, "accepted"), (4, "rejected")]
+    errors = {r["index"]: r["error"] for r in body["results"] if r["status"] == "rejected"}
+    assert errors[1] == "ATM with id 99 not found"
+    assert errors[2].startswith("event_timestamp:")
+    assert "EventType with id 12345" in errors[4]
+    assert all(r["id"] for r in body["results"] if r["status"] == "accepted")
+    assert stored_messages(ingest) == ["a", "b"]
+    # Пачками по LOG_BATCH_CHUNK_SIZE
+    assert sum(s.startswith("INSERT INTO atm_logs") for s in ingest.statements) == 2
+
+
+def test_ndjson_batch_rejects_malformed_lines(ingest, monkeypatch):
+    monkeypatch.setattr(settings, "LOG_BATCH_MAX_SIZE", 4)
+    lines = [
+        json.dumps(dict(RECORD, atm_id=1, message="first")),
+        "",  # Пустые строки пропускаются
+        "{not json",
+        json.dumps({"atm_id": "x"}),
+        json.dumps(dict(RECORD, atm_id=2, message="second")),
+        json.dumps(dict(RECORD, atm_id=2, message="over limit")),
+    ]
+    response = ingest.post("/api/v1/atms/logs/batch", content="\n".join(lines) + "\n", headers=NDJSON)
+
+    assert response.status_code == 200
+    assert statuses(response) == [(0, "accepted"), (1, "rejected"), (2, "rejected"), (3, "accepted"), (4, "rejected")]
+    errors = {r["index"]: r["error"] for r in response.json()["results"] if r["status"] == "rejected"}
+    assert errors[1].startswith("Invalid JSON")
+    assert "atm_id" in errors[2]
+    assert errors[4] == "Batch size limit of 4 records exceeded."
+    assert stored_messages(ingest) == ["first", "second"]
+
+
+def test_json_batch_size_limit_and_malformed_body(ingest, monkeypatch):
+    monkeypatch.setattr(settings, "LOG_BATCH_MAX_SIZE", 2)
+    oversize = ingest.post("/api/v1/atms/logs/batch", json=[dict(RECORD, atm_id=1)] * 3)
+    assert oversize.status_code == 413
+    assert ingest.post("/api/v1/atms/logs/batch", content="[{", headers={"Content-Type": "application/json"}).status_code == 400
+    assert ingest.post("/api/v1/atms/logs/batch", json=dict(RECORD, atm_id=1)).status_code == 400
+    assert ingest.session.scalar(select(func.count()).select_from(models.ATMLog)) == 0
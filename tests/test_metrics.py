@@ -0,0 +1,101 @@
+# tests/test_metrics.py
+import pytest
+from sqlalchemy import create_engine, text
+
+import database
+import metrics
+import security
+from app.main import app
+
+
+def test_registry_renders_prometheus_text():
+    registry = metrics.Registry()
+    requests = registry.register(metrics.Counter("demo_requests_total", "Requests.", ["route"]))
+    latency = registry.register(metrics.Histogram("demo_latency_seconds", "Latency.", buckets=(0.1, 1.0)))
+    requests.inc(route='/a"b')
+    requests.inc(2, route='/a"b')
+    for value in (0.05, 0.1, 0.5, 3):
+        latency.observe(value)
+
+    lines = registry.render().splitlines()
+    assert "# TYPE demo_requests_total counter" in lines
+    assert 'demo_requests_total{route="/a\\"b"} 3' in lines
+    assert 'demo_latency_seconds_bucket{le="0.1"} 2' in lines
+    assert 'demo_latency_seconds_bucket{le="1"} 3' in lines
+    assert 'demo_latency_seconds_bucket{le="+Inf"} 4' in lines
+    assert "demo_latency_seconds_count 4" in lines
+    with pytest.raises(ValueError):
+        registry.register(metrics.Gauge("demo_requests_total", "Requests.", ["route"]))
+
+
+def test_engine_options_and_pool_wait_metrics(tmp_path, monkeypatch):
+    assert database.engine_options("sqlite:///x.db") == {}
+    options = database.engine_options("postgresql+asyncpg://u:p@db/app", is_async=True)
+    assert options["poolclass"] is database.TimedAsyncAdaptedQueuePool
+    assert (options["pool_size"], options["pool_pre_ping"]) == (database.settings.DB_POOL_SIZE, True)
+    assert "connect_args" not in options
+
+    monkeypatch.setattr(database.settings, "DB_PGBOUNCER", True)
+    assert database.engine_options("postgresql+asyncpg://u:p@db/app", is_async=True)["connect_args"]["statement_cache_size"] == 0
+    assert "connect_args" not in database.engine_options("postgresql://u:p@db/app")
+
+    waits_before = database.POOL_WAIT.count(pool="sync")
+    engine = create_engine(f"sqlite:///{tmp_path / 'pool.db'}", poolclass=database.TimedQueuePool, pool_size=1)
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+    engine.dispose()  # Пересозданный пул сохраняет класс и имя в метриках
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+    assert database.POOL_WAIT.count(pool="sync") == waits_before + 2
+    engine.dispose()
+
+
+def test_metrics_endpoint(api):
+    response = api.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert "# TYPE db_pool_wait_seconds histogram" in response.text
+    assert "# TYPE db_pool_timeouts_total counter" in response.text
+
+
+def test_request_and_ingest_metrics(api):
+    app.dependency_overrides[security.get_api_key] = lambda: "test-key"
+    try:
+        route = "/api/v1/atms/{atm_id}/logs/"
+        requests_before = metrics.HTTP_REQUESTS.value(method="POST", route=route, status=201)
+        queries_before = metrics.HTTP_DB_QUERIES.count(method="POST", route=route)
+        accepted_before = metrics.LOGS_ACCEPTED.value(atm_id="1", log_level_id="2")
+        rejected_before = metrics.LOGS_REJECTED.value(atm_id="unknown", log_level_id="unknown", reason="atm_not_found")
+        level_before = metrics.LOGS_REJECTED.value(atm_id="1", log_level_id="unknown", reason="unknown_log_level")
+        invalid_before = metrics.LOGS_REJECTED.value(atm_id="unknown", log_level_id="unknown", reason="invalid")
+
+        record = {"event_timestamp": "2025-05-11T12:00:00Z", "message": "m", "log_level_id": 2}
+        assert api.post("/api/v1/atms/1/logs/", json=record).status_code == 201
+        assert api.post("/api/v1/atms/99/logs/", json=record).status_code == 404
+        batch = api.post("/api/v1/atms/logs/batch", json=[
+            dict(record, atm_id=1), dict(record, atm_id=99), dict(record, atm_id=1, log_level_id=12345), {"atm_id": "x"}
+        ])
+        assert batch.json()["accepted"] == 1
+        api.get("/no/such/path/42")
+    finally:
+        app.dependency_overrides.pop(security.get_api_key, None)
+
+    assert metrics.HTTP_REQUESTS.value(method="POST", route=route, status=201) == requests_before + 1
+    assert metrics.HTTP_REQUESTS.value(method="POST", route=route, status=404) >= 1
+    # Запросы AsyncSession учтены в HTTP-запросе, который их выполнил
+    assert metrics.HTTP_DB_QUERIES.count(method="POST", route=route) == queries_before + 2
+    assert metrics.LOGS_ACCEPTED.value(atm_id="1", log_level_id="2") == accepted_before + 2
+    # Непроверенные id клиента в метки не попадают
+    assert metrics.LOGS_REJECTED.value(atm_id="unknown", log_level_id="unknown", reason="atm_not_found") == rejected_before + 2
+    assert metrics.LOGS_REJECTED.value(atm_id="1", log_level_id="unknown", reason="unknown_log_level") == level_before + 1
+    assert metrics.LOGS_REJECTED.value(atm_id="unknown", log_level_id="unknown", reason="invalid") == invalid_before + 1
+
+    text = api.get("/metrics").text
+    assert 'http_request_duration_seconds_count{method="POST",route="/api/v1/atms/{atm_id}/logs/"}' in text
+    assert 'route="unmatched"' in text and "/no/such/path" not in text
+    assert 'atm_id="99"' not in text and 'log_level_id="12345"' not in text
+    assert "http_request_db_seconds_bucket" in text
+    db_queries = next(line for line in text.splitlines()
+                      if line.startswith(f'http_request_db_queries_sum{{method="POST",route="{route}"}}'))
+    assert float(db_queries.split()[-1]) > 0
+    assert "ingest_queue_depth 0" in text
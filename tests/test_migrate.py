@@ -0,0 +1,64 @@
+# tests/test_migrate.py
+from sqlalchemy import create_engine
+
+import migrate
+
+
+def test_discover_migrations_sorted_and_named():
+    migrations = migrate.discover_migrations()
+    versions = [version for version, _ in migrations]
+    assert versions == sorted(versions)
+    assert "0001_atm_logs_indexes" in versions
+
+
+def test_split_statements_skips_comments():
+    sql = (
+        "-- migrate: no-transaction\n"
+        "-- комментарий\n"
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS a ON t (x);\n"
+        "\n"
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS b ON t (y)\n"
+        "    WHERE z;\n"
+    )
+    statements = migrate._split_statements(sql)
+    assert len(statements) == 2
+    assert statements[1].endswith("WHERE z")
+
+
+def test_index_migration_is_split_into_single_statements():
+    _, path = next(m for m in migrate.discover_migrations() if m[0] == "0001_atm_logs_indexes")
+    sql = path.read_text(encoding="utf-8")
+    assert sql.startswith(migrate.NO_TRANSACTION_MARKER)
+    statements = migrate._split_statements(sql)
+    assert all(";" not in statement for statement in statements)
+    assert sum("CREATE INDEX CONCURRENTLY" in statement for statement in statements) == 5
+
+
+def test_manual_migration_is_skipped_on_startup():
+    versions = [version for version, _ in migrate.discover_migrations()]
+    assert migrate.is_manual(dict(migrate.discover_migrations())["0002_partition_atm_logs"])
+    done = {"0001_atm_logs_indexes"}
+    # Несекционированная БД доходит при старте до последней миграции, пропуская только 0002
+    on_startup = [version for version, _ in migrate.pending_migrations(done, include_manual=False)]
+    assert on_startup == versions[2:]
+    assert on_startup[-1] == "0008_atms_deletion_requested_at"
+    assert [version for version, _ in migrate.pending_migrations(done)] == versions[1:]
+    # Позже ручная миграция применяется отдельно (python migrate.py)
+    assert migrate.pending_migrations(set(on_startup) | done) == [
+        (version, path) for version, path in migrate.discover_migrations() if version == "0002_partition_atm_logs"
+    ]
+    assert migrate.pending_migrations(set(on_startup) | done, include_manual=False) == []
+
+
+def test_apply_migrations_skips_non_postgres():
+    assert migrate.apply_migrations(create_engine("sqlite://")) == []
+
+
+def test_search_migration_builds_indexes_concurrently():
+    _, path = next(m for m in migrate.discover_migrations() if m[0] == "0003_log_search")
+    sql = path.read_text(encoding="utf-8")
+    assert sql.startswith(migrate.NO_TRANSACTION_MARKER)
+    indexes = [s for s in migrate._split_statements(sql) if s.upper().startswith("CREATE INDEX")]
+    assert len(indexes) == 3
+    assert all(migrate.concurrent_index_table(statement) == "public.atm_logs" for statement in indexes)
+    assert migrate.concurrent_index_table("CREATE EXTENSION IF NOT EXISTS pg_trgm") is None
@@ -0,0 +1,52 @@
+# tests/test_partitions.py
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import create_engine
+
+import crud
+import pagination
+import partitions
+
+
+def test_period_boundaries_in_utc():
+    moment = datetime(2025, 12, 31, 23, 30, tzinfo=timezone.utc)
+    month = partitions.period_start(moment, "month")
+    assert month == datetime(2025, 12, 1, tzinfo=timezone.utc)
+    assert partitions.next_period(month, "month") == datetime(2026, 1, 1, tzinfo=timezone.utc)
+    assert partitions.partition_name(month, "month") == "atm_logs_p2025_12"
+
+    day = partitions.period_start(moment, "day")
+    assert partitions.next_period(day, "day") == datetime(2026, 1, 1, tzinfo=timezone.utc)
+    assert partitions.partition_name(day, "day") == "atm_logs_p2025_12_31"
+
+    with pytest.raises(ValueError):
+        partitions.period_start(moment, "week")
+
+
+def test_overlap_with_partition_of_other_length():
+    monthly = partitions.Partition(
+        name="atm_logs_p2025_05",
+        start=datetime(2025, 5, 1, tzinfo=timezone.utc),
+        end=datetime(2025, 6, 1, tzinfo=timezone.utc),
+    )
+    day = datetime(2025, 5, 31, tzinfo=timezone.utc)
+    assert partitions._overlaps(day, partitions.next_period(day, "day"), [monthly])
+    assert not partitions._overlaps(monthly.end, partitions.next_period(monthly.end, "day"), [monthly])
+
+
+def test_parse_bound_with_hour_offset():
+    assert partitions.parse_bound("2025-05-01 00:00:00+00") == datetime(2025, 5, 1, tzinfo=timezone.utc)
+    assert partitions.parse_bound("2025-05-01 00:00:00+00:00") == datetime(2025, 5, 1, tzinfo=timezone.utc)
+
+
+def test_run_maintenance_skips_non_postgres():
+    assert partitions.run_maintenance(create_engine("sqlite://")) == {"created": [], "removed": []}
+
+
+def test_keyset_criteria_bounds_partition_key():
+    cursor = pagination.Cursor(key=(datetime(2025, 5, 11, tzinfo=timezone.utc), 10), direction=pagination.NEXT, descending=True)
+    sql = str(pagination.keyset_criteria(crud.ATM_LOG_KEYSET_COLUMNS, cursor))
+    # Отдельное условие на event_timestamp рядом со сравнением row values - для отсечения секций
+    assert "atm_logs.event_timestamp <=" in sql
+    assert "(atm_logs.event_timestamp, atm_logs.id) <" in sql
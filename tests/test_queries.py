@@ -0,0 +1,72 @@
+# tests/test_queries.py
+"""Число SQL-запросов на страницу списка не должно зависеть от числа строк (нет N+1)."""
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import event
+
+import crud
+import models
+import schemas
+
+
+def add_logs(session, count: int):
+    start = datetime(2025, 5, 11, 12, 0, tzinfo=timezone.utc)
+    session.add_all([
+        models.ATMLog(atm_id=1 + i % 2, event_timestamp=start + timedelta(seconds=i), message=f"event {i}",
+                      log_level_id=(2, 4)[i % 2], event_type_id=(1, 11, None)[i % 3])
+        for i in range(count)
+    ])
+    session.commit()
+
+
+def add_atms(session, count: int):
+    session.add_all([models.ATM(atm_uid=str(5000 + i), status_id=1) for i in range(count)])
+    session.commit()
+
+
+def queries_for(api, url: str) -> int:
+    api.get(url)  # Прогрев кеша справочников
+    api.statements.clear()
+    response = api.get(url)
+    assert response.status_code == 200
+    return len(api.statements)
+
+
+def test_log_list_query_count_is_constant(api):
+    add_logs(api.session, 3)
+    small = queries_for(api, "/api/v1/logs/?count=exact&limit=1000")
+    add_logs(api.session, 200)
+    large = queries_for(api, "/api/v1/logs/?count=exact&limit=1000")
+    assert small == large == 2  # COUNT(*) + страница
+
+    response = api.get("/api/v1/logs/?limit=5&count=none")
+    assert all(log["log_level"]["name"] in ("INFO", "ERROR") for log in response.json())
+
+
+def test_log_cursor_page_query_count_is_constant(api):
+    add_logs(api.session, 50)
+    assert queries_for(api, "/api/v1/logs/?pagination=cursor&count=none&limit=10") == 1
+    assert queries_for(api, "/api/v1/logs/?pagination=cursor&count=none&limit=50") == 1
+
+
+def test_atm_list_and_detail_query_count(api):
+    small = queries_for(api, "/api/v1/atms/?count=none")
+    add_atms(api.session, 100)
+    large = queries_for(api, "/api/v1/atms/?count=none&limit=1000")
+    assert small == large == 1
+
+    response = api.get("/api/v1/atms/?count=none&limit=3")
+    assert [atm["status"]["name"] for atm in response.json()] == ["active"] * 3
+    assert queries_for(api, "/api/v1/atms/1") == 1
+
+
+def test_sync_crud_lists_load_relationships_in_constant_queries(db):
+    add_logs(db, 30)
+    statements = []
+    event.listen(db.get_bind(), "before_cursor_execute", lambda conn, cursor, statement, *args: statements.append(statement))
+
+    logs = [schemas.ATMLog.model_validate(log) for log in crud.get_atm_logs(db, limit=100)]
+    atms = [schemas.ATM.model_validate(atm) for atm in crud.get_atms(db)]
+
+    assert len(logs) == 30 and len(atms) == 2
+    assert len(statements) == 5  # Логи + 2 selectinload, банкоматы + 1 selectinload
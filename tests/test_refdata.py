@@ -0,0 +1,44 @@
+# tests/test_refdata.py
+from datetime import datetime, timezone
+
+from sqlalchemy import event
+
+import models
+import refdata
+
+
+def count_queries(db):
+    """Подписывается на выполнение SQL и возвращает список, куда пишутся запросы."""
+    statements = []
+    event.listen(db.get_bind(), "before_cursor_execute",
+                 lambda conn, cursor, statement, *args: statements.append(statement))
+    return statements
+
+
+def test_log_to_schema_uses_cache_without_queries(db):
+    db.add(models.ATMLog(atm_id=1, event_timestamp=datetime.now(timezone.utc), message="jam",
+                         log_level_id=4, event_type_id=11))
+    db.commit()
+    reference = refdata.get_reference_data(db)
+    db_log = db.query(models.ATMLog).first()
+
+    statements = count_queries(db)
+    log = refdata.log_to_schema(db_log, reference)
+
+    assert statements == []
+    assert log.log_level.name == "ERROR"
+    assert log.event_type.name == "CARD_JAMMED"
+
+
+def test_reference_data_invalidated_on_write(db):
+    before = refdata.get_reference_data(db)
+    assert 5 not in before.log_levels
+
+    db.add(models.LogLevel(id=5, name="CRITICAL", severity_order=5))
+    db.commit()
+
+    after = refdata.get_reference_data(db)
+    assert after.version > before.version
+    assert after.log_levels[5].name == "CRITICAL"
+    # Повторный вызов без записей отдает тот же снимок
+    assert refdata.get_reference_data(db) is after
@@ -0,0 +1,96 @@
+# tests/test_rollups.py
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import crud
+import models
+import rollups
+import schemas
+import security
+from app.main import app
+
+
+@pytest.fixture()
+def ingest(api):
+    app.dependency_overrides[security.get_api_key] = lambda: "test-key"
+    yield api
+    app.dependency_overrides.pop(security.get_api_key, None)
+
+
+def test_sync_ingest_and_acknowledge_update_rollups(db):
+    start = datetime(2025, 5, 11, 12, 10, tzinfo=timezone.utc)
+    crud.create_atm_log(db, schemas.ATMLogCreate(
+        event_timestamp=start, message="boot", log_level_id=2, event_type_id=1), atm_id=1)
+    results = crud.create_atm_logs_bulk(db, [
+        schemas.ATMLogBatchItem(atm_id=1, event_timestamp=start.replace(minute=50), message="jam",
+                                log_level_id=4, event_type_id=11, is_alert=True),
+        schemas.ATMLogBatchItem(atm_id=1, event_timestamp=start.replace(hour=13), message="late",
+                                log_level_id=2, is_alert=False),
+        schemas.ATMLogBatchItem(atm_id=1, event_timestamp=start.replace(minute=40), message="older jam",
+                                log_level_id=4, is_alert=True),
+    ])
+    jam_id = results[0][0]
+
+    buckets = {
+        (row.bucket_start.replace(tzinfo=timezone.utc).hour, row.log_level_id, row.event_type_id): (row.log_count, row.alert_count)
+        for row in db.scalars(select(models.ATMLogRollup))
+    }
+    assert buckets == {(12, 2, 1): (1, 0), (12, 4, 11): (1, 1), (12, 4, 0): (1, 1), (13, 2, 0): (1, 0)}
+    assert {(c.log_level_id, c.log_count) for c in db.scalars(select(models.ATMLevelCount))} == {(2, 2), (4, 2)}
+
+    health = db.get(models.ATMHealth, 1)
+    assert health.unacknowledged_alerts == 2
+    assert health.last_event_at.hour == 13
+    assert (health.last_error_log_id, health.last_error_message) == (jam_id, "jam")
+
+    # Параллельный запрос загрузил тот же алерт до подтверждения: второй раз сводки не уменьшаются
+    with Session(db.get_bind()) as concurrent:
+        stale_jam = crud.get_atm_log(concurrent, jam_id)
+        crud.acknowledge_alert(db, crud.get_atm_log(db, jam_id), user_id=1)
+        with pytest.raises(ValueError):
+            crud.acknowledge_alert(concurrent, stale_jam, user_id=2)
+    db.expire_all()
+    assert db.get(models.ATMHealth, 1).unacknowledged_alerts == 1
+    assert crud.get_atm_log(db, jam_id).acknowledged_by_user_id == 1
+    # Два параллельных переключения is_alert по устаревшему логу: сводки меняются один раз
+    with Session(db.get_bind()) as concurrent:
+        stale_log = crud.get_atm_log(concurrent, results[1][0])
+        crud.update_log_alert_status(db, crud.get_atm_log(db, results[1][0]), is_alert=True)
+        assert crud.update_log_alert_status(concurrent, stale_log, is_alert=True).is_alert is True
+    db.expire_all()
+    assert db.get(models.ATMHealth, 1).unacknowledged_alerts == 2
+    assert db.get(models.ATMLogRollup, (datetime(2025, 5, 11, 13), 1, 2, 0)).alert_count == 1
+
+    # Полный пересчет дает те же числа, что и инкрементальное обновление
+    rebuilt_from = {(r.atm_id, r.log_level_id, r.event_type_id, r.log_count, r.alert_count)
+                    for r in db.scalars(select(models.ATMLogRollup))}
+    rollups.rebuild(db.connection())
+    db.expire_all()
+    assert {(r.atm_id, r.log_level_id, r.event_type_id, r.log_count, r.alert_count)
+            for r in db.scalars(select(models.ATMLogRollup))} == rebuilt_from
+    assert db.get(models.ATMHealth, 1).unacknowledged_alerts == 2
+
+
+def test_atm_summary_endpoint_reads_rollups(ingest):
+    record = {"event_timestamp": "2025-05-11T12:00:00Z", "message": "card jam", "log_level_id": 4, "is_alert": True}
+    created = ingest.post("/api/v1/atms/2/logs/", json=record).json()
+    batch = [dict(record, atm_id=2, message="debug", log_level_id=1, is_alert=False),
+             dict(record, atm_id=2, event_timestamp="2025-05-11T11:00:00Z", message="old error")]
+    assert ingest.post("/api/v1/atms/logs/batch", json=batch).json()["accepted"] == 2
+    assert ingest.patch(f"/api/v1/logs/{created['id']}/acknowledge").status_code == 200
+
+    ingest.get("/api/v1/atms/summary")  # Прогрев кеша справочников
+    ingest.statements.clear()
+    response = ingest.get("/api/v1/atms/summary")
+    assert response.status_code == 200
+    assert not any("atm_logs" in statement for statement in ingest.statements)
+    first, second = response.json()
+    assert (first["atm_id"], first["total_logs"], first["unacknowledged_alerts"], first["log_counts"]) == (1, 0, 0, {})
+    assert second["status"]["name"] == "active"
+    assert second["log_counts"] == {"ERROR": 2, "DEBUG": 1} and second["total_logs"] == 3
+    assert second["unacknowledged_alerts"] == 1
+    assert (second["last_error_log_id"], second["last_error_message"]) == (created["id"], "card jam")
+    assert ingest.get("/api/v1/atms/summary?status_id=99").json() == []
@@ -0,0 +1,54 @@
+# tests/test_sql_profiling.py
+import pytest
+
+import profiling
+
+
+@pytest.fixture()
+def profiles(api, monkeypatch):
+    monkeypatch.setattr(profiling.settings, "SQL_PROFILE_TOKEN", "secret")
+    monkeypatch.setattr(profiling.settings, "SQL_PROFILE_PARAMETERS", True)
+    profiling.clear_profiles()
+    yield api
+    profiling.clear_profiles()
+
+
+def test_header_enables_profile_for_one_request(profiles):
+    response = profiles.get("/api/v1/atms/1", headers={"X-SQL-Profile": "secret"})
+    assert response.status_code == 200
+    profile_id = int(response.headers["x-sql-profile-id"])
+
+    assert "x-sql-profile-id" not in profiles.get("/api/v1/atms/2").headers
+    assert "x-sql-profile-id" not in profiles.get("/api/v1/atms/2", headers={"X-SQL-Profile": "wrong"}).headers
+
+    listed = profiles.get("/api/v1/admin/sql-profiles").json()
+    assert [p["id"] for p in listed] == [profile_id]
+    profile = profiles.get(f"/api/v1/admin/sql-profiles/{profile_id}").json()
+    assert (profile["trigger"], profile["method"], profile["route"], profile["status_code"]) == (
+        "header", "GET", "/api/v1/atms/{atm_id}", 200
+    )
+    assert any("FROM atms" in s["statement"] for s in profile["statements"])
+    assert profile["statements"][0]["parameters"] is not None
+    assert profile["db_ms"] == pytest.approx(sum(s["duration_ms"] for s in profile["statements"]), abs=0.01)
+
+    assert profiles.delete("/api/v1/admin/sql-profiles").status_code == 204
+    assert profiles.get(f"/api/v1/admin/sql-profiles/{profile_id}").status_code == 404
+
+
+def test_parameters_of_user_queries_are_redacted(profiles):
+    profiles.get("/api/v1/users/", headers={"X-SQL-Profile": "secret"})
+    profile = profiles.get("/api/v1/admin/sql-profiles").json()[0]
+    user_statements = [s for s in profile["statements"] if "FROM users" in s["statement"]]
+    assert user_statements and {s["parameters"] for s in user_statements} == {profiling.REDACTED}
+
+
+def test_slow_query_log_without_profiling(profiles, monkeypatch):
+    monkeypatch.setattr(profiling.settings, "SQL_SLOW_QUERY_MS", 1e-6)
+    monkeypatch.setattr(profiling.settings, "SQL_PROFILE_PARAMETERS", False)
+    profiles.get("/api/v1/atms/1")
+    monkeypatch.setattr(profiling.settings, "SQL_SLOW_QUERY_MS", 0)
+
+    slow = profiles.get("/api/v1/admin/sql-profiles", params={"slow_only": True}).json()
+    assert slow and {p["trigger"] for p in slow} == {"slow"}
+    assert all(len(p["statements"]) == 1 and p["statements"][0]["parameters"] is None for p in slow)
+    assert "/api/v1/atms/1" in {p["path"] for p in slow}
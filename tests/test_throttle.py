@@ -0,0 +1,91 @@
+# tests/test_throttle.py
+import asyncio
+import itertools
+
+import pytest
+from fastapi.testclient import TestClient
+
+import models
+import security
+import throttle
+from config import settings
+
+
+@pytest.fixture()
+def login_user(api):
+    throttle.login_attempts.clear()
+    api.session.add(models.User(
+        username="operator1", email="operator1@example.com",
+        password_hash=security.get_password_hash("Secret123!"), role="operator"
+    ))
+    api.session.commit()
+    yield api
+    throttle.login_attempts.clear()
+
+
+def login(api, password: str):
+    return api.post("/api/v1/auth/login/token", data={"username": "operator1", "password": password})
+
+
+def test_login_failures_are_throttled_per_username(login_user, monkeypatch):
+    monkeypatch.setattr(settings, "LOGIN_MAX_FAILURES_PER_USERNAME", 2)
+    assert login(login_user, "Secret123!").status_code == 200
+    assert login(login_user, "wrong").status_code == 401
+    assert login(login_user, "wrong").status_code == 401
+    response = login(login_user, "Secret123!")
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 0
+
+
+def test_failed_attempts_are_throttled_per_ip(login_user, monkeypatch):
+    monkeypatch.setattr(settings, "LOGIN_MAX_ATTEMPTS_PER_IP", 3)
+    # Успешные входы IP не расходуют
+    assert [login(login_user, "Secret123!").status_code for _ in range(4)] == [200] * 4
+    statuses = [
+        login_user.post("/api/v1/auth/login/token", data={"username": f"user{i}", "password": "x"}).status_code
+        for i in range(4)
+    ]
+    assert statuses == [401, 401, 401, 429]
+
+
+def test_ip_is_taken_from_trusted_proxy(login_user, monkeypatch):
+    monkeypatch.setattr(settings, "LOGIN_MAX_ATTEMPTS_PER_IP", 2)
+    # Запросы приходят от прокси 127.0.0.1 (FORWARDED_ALLOW_IPS по умолчанию)
+    proxy = TestClient(login_user.app, client=("127.0.0.1", 40000))
+    usernames = (f"nobody{i}" for i in itertools.count())  # Чтобы не сработал лимит по имени пользователя
+
+    def attempt(forwarded_for: str, **data):
+        data = {"username": next(usernames), "password": "x", **data}
+        return proxy.post("/api/v1/auth/login/token", data=data,
+                          headers={"X-Forwarded-For": forwarded_for}).status_code
+
+    assert [attempt("203.0.113.1") for _ in range(3)] == [401, 401, 429]
+    # Другой клиент за тем же прокси не заблокирован
+    assert attempt("203.0.113.2", username="operator1", password="Secret123!") == 200
+    assert attempt("203.0.113.2") == 401
+    # Недоверенный адрес не может подставить чужой IP
+    untrusted = TestClient(login_user.app, client=("198.51.100.7", 40000))
+    headers = {"X-Forwarded-For": "203.0.113.9"}
+    assert [untrusted.post("/api/v1/auth/login/token", data={"username": next(usernames), "password": "x"},
+                           headers=headers).status_code for _ in range(3)] == [401, 401, 429]
+    assert attempt("203.0.113.9") == 401
+
+
+def test_sliding_window_expires_old_hits(monkeypatch):
+    limiter = throttle.SlidingWindowLimiter()
+    now = [100.0]
+    monkeypatch.setattr(throttle.time, "monotonic", lambda: now[0])
+    limiter.hit("k")
+    limiter.hit("k")
+    assert limiter.retry_after("k", limit=2, window=60) == 60
+    now[0] += 61
+    assert limiter.retry_after("k", limit=2, window=60) is None
+
+
+def test_password_pool_rejects_when_queue_is_full(monkeypatch):
+    monkeypatch.setattr(security, "_password_slots", security.threading.BoundedSemaphore(1))
+    security._password_slots.acquire()
+    with pytest.raises(security.PasswordHashingBusy):
+        asyncio.run(security.verify_password_async("x", security.get_password_hash("x")))
+    security._password_slots.release()
+    assert asyncio.run(security.verify_password_async("x", security.get_password_hash("x")))
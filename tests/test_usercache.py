@@ -0,0 +1,65 @@
+# tests/test_usercache.py
+import crud
+import deps
+import models
+import usercache
+from app.main import app
+from security import create_access_token, decode_access_token
+
+
+def add_user(session, role: str = "operator") -> models.User:
+    user = models.User(username="operator1", email="operator1@example.com", password_hash="-", role=role)
+    session.add(user)
+    session.commit()
+    return user
+
+
+def token_for(user: models.User) -> dict:
+    token = create_access_token({"sub": user.username, "user_id": user.id, "role": user.role, "ver": user.token_version})
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_token_carries_role_and_version():
+    token_data = decode_access_token(create_access_token({"sub": "u", "user_id": 7, "role": "admin", "ver": 3}))
+    assert (token_data.user_id, token_data.role, token_data.token_version) == (7, "admin", 3)
+
+
+def test_authenticated_requests_reuse_cached_user(api):
+    app.dependency_overrides.pop(deps.get_current_user)
+    usercache.invalidate_user()
+    user = add_user(api.session)
+    headers = token_for(user)
+
+    api.statements.clear()
+    assert api.get("/api/v1/users/me", headers=headers).json()["username"] == "operator1"
+    assert len(api.statements) == 1
+    api.statements.clear()
+    assert api.get("/api/v1/users/me", headers=headers).status_code == 200
+    assert api.statements == []  # Пользователь из кеша, без запроса к БД
+
+
+def test_role_change_revokes_issued_tokens(api):
+    app.dependency_overrides.pop(deps.get_current_user)
+    usercache.invalidate_user()
+    user = add_user(api.session)
+    old_headers = token_for(user)
+    assert api.get("/api/v1/users/me", headers=old_headers).status_code == 200
+
+    crud.update_user_role(api.session, user, "admin")
+    assert user.token_version == 1
+    assert usercache.get_cached_user(user.id) is None
+    assert api.get("/api/v1/users/me", headers=old_headers).status_code == 401
+    assert api.get("/api/v1/users/me", headers=token_for(user)).json()["role"] == "admin"
+
+
+def test_tokens_without_role_and_version_claims_are_accepted_until_role_change(api):
+    app.dependency_overrides.pop(deps.get_current_user)
+    usercache.invalidate_user()
+    user = add_user(api.session)
+    # Токен, выданный до появления claims "role" и "ver"
+    legacy = create_access_token({"sub": user.username, "user_id": user.id})
+    legacy_headers = {"Authorization": f"Bearer {legacy}"}
+    assert api.get("/api/v1/users/me", headers=legacy_headers).json()["role"] == "operator"
+
+    crud.update_user_role(api.session, user, "admin")
+    assert api.get("/api/v1/users/me", headers=legacy_headers).status_code == 401